@@ -2,6 +2,9 @@
 
 import pytest
 
+from dope.tests import common
+from dope.tests.incremental import IncrementalCheck
+
 
 def pytest_addoption(parser: pytest.Parser) -> None:
     """Define custom command-line options."""
@@ -13,3 +16,26 @@ def pytest_addoption(parser: pytest.Parser) -> None:
         nargs="*",  # The result is None | list[str].
         action="store",
     )
+    # Check only notes that changed since the last run; see dope/tests/incremental.py.
+    parser.addoption(
+        "--incremental",
+        action="store_true",
+        help="Check only notes changed since the last run and notes depending on changed files.",
+    )
+    # Fewer test items for huge vaults; see dope/tests/common.py.
+    parser.addoption(
+        "--subdirs-per-item",
+        type=int,
+        default=1,
+        help="The number of vault subdirectories checked by one item of @vault_dirs_subdirs tests.",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    """Apply custom command-line options."""
+    IncrementalCheck.enabled = config.getoption("incremental")
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    """Parametrize vault tests when they are collected."""
+    common.parametrize(metafunc)
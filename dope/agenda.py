@@ -0,0 +1,372 @@
+"""
+Agenda of tasks and their iCalendar feed.
+
+Tasks are indexed by the ordinals of their deadlines in a sorted array, thus a window of days,
+e.g. overdue tasks or the tasks of one day, is cut out with two binary searches whatever the
+number of tasks. Recurring tasks are intervals from their starts on: they are sorted by
+their starts, and their occurrences are generated lazily only within a requested window.
+A series has no overdue occurrences, since a missed occurrence is superseded by the next one.
+An agenda is a list of buckets: overdue tasks, today's tasks, and upcoming tasks either by day
+for a week or by week for four weeks after the current one.
+
+The feed is an `.ics` file with one all-day event per task that calendar apps can subscribe to.
+The UID of an event is derived from the vault, the note and the description of its task, thus
+moving a deadline updates the event rather than adds another one. Serialized events are cached
+together with a digest of their tasks: only events of new and changed tasks are serialized
+again and get a new SEQUENCE, and the file is not written at all if no event changed.
+A recurring task is one event with a repetition rule, thus its occurrences are not expanded
+in the feed either; calendar apps skip months shorter than the start day of a monthly series.
+"""
+
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.task import Task
+
+_logger = logging.getLogger(__name__)
+
+VIEWS = ("day", "week")
+DAYS_AHEAD = 7
+"""Upcoming days shown by the day view."""
+WEEKS_AHEAD = 4
+"""Upcoming weeks after the current one shown by the week view."""
+
+_ICS_PRIORITIES = {1: 1, 2: 5, 3: 9}
+"""RFC 5545 priorities: 1 is the highest, 9 the lowest."""
+_ICS_CATEGORIES = {"n": "now", "x": "next", "w": "waiting"}
+_ICS_LINE_OCTETS = 75
+_ICS_FREQUENCIES = {"d": "DAILY", "w": "WEEKLY", "m": "MONTHLY", "y": "YEARLY"}
+
+
+def _sort_key(task: Task) -> tuple[int, int, int]:
+    return (task.deadline.toordinal(), task.SORTING_PRECEDENCE, task.priority)
+
+
+class DeadlineIndex:
+    """One-off tasks sorted by the ordinals of their deadlines, recurring ones by their starts."""
+
+    def __init__(self, tasks: Iterable[Task]) -> None:
+        tasks = sorted(tasks, key=_sort_key)
+        self._tasks = [task for task in tasks if task.every is None]
+        self._ordinals = [task.deadline.toordinal() for task in self._tasks]
+        self._series = [task for task in tasks if task.every is not None]
+        self._starts = [task.deadline.toordinal() for task in self._series]
+
+    def __len__(self) -> int:
+        return len(self._tasks) + len(self._series)
+
+    def window(self, first: date | None, last: date | None) -> list[Task]:
+        """
+        Return tasks with deadlines from the first to the last day; None means no limit.
+
+        Every occurrence of a recurring task in the window is a copy of the task with the
+        occurrence as its deadline. Only bounded windows hold occurrences.
+        """
+        lo = 0 if first is None else bisect.bisect_left(self._ordinals, first.toordinal())
+        hi = (
+            len(self._ordinals)
+            if last is None
+            else bisect.bisect_right(self._ordinals, last.toordinal())
+        )
+        if first is None or last is None:
+            return self._tasks[lo:hi]
+        occurrences = [
+            dataclasses.replace(task, deadline=day)
+            for task in self._series[: bisect.bisect_right(self._starts, last.toordinal())]
+            for day in task.occurrences_iter(first=first, last=last)
+        ]
+        if not occurrences:
+            return self._tasks[lo:hi]
+        return sorted(self._tasks[lo:hi] + occurrences, key=_sort_key)
+
+
+@dataclass
+class AgendaBucket:
+    """Tasks with deadlines in a window of days."""
+
+    title: str
+    first: date | None
+    """The first day of the window; None for overdue tasks."""
+    last: date
+    tasks: list[Task] = field(default_factory=list)
+
+
+def agenda(
+    index: DeadlineIndex, view: str = "day", today: date | None = None
+) -> list[AgendaBucket]:
+    """Return the overdue, today's, and upcoming buckets of the view, see VIEWS."""
+    today = today or date.today()
+    one_day = timedelta(days=1)
+    windows: list[tuple[str, date | None, date]] = [
+        ("Overdue", None, today - one_day),
+        (f"Today, {today:%a %Y-%m-%d}", today, today),
+    ]
+    if view == "day":
+        for offset in range(1, DAYS_AHEAD + 1):
+            day = today + offset * one_day
+            windows.append((f"{day:%a %Y-%m-%d}", day, day))
+    elif view == "week":
+        end_of_week = today + (6 - today.weekday()) * one_day
+        if end_of_week > today:
+            windows.append(("This week", today + one_day, end_of_week))
+        for _ in range(WEEKS_AHEAD):
+            monday, end_of_week = end_of_week + one_day, end_of_week + 7 * one_day
+            windows.append(
+                (
+                    f"Week {monday.isocalendar().week}, {monday} to {end_of_week}",
+                    monday,
+                    end_of_week,
+                )
+            )
+    else:
+        raise ValueError(f"Unknown agenda view `{view}`; use one of {', '.join(VIEWS)}.")
+    return [
+        AgendaBucket(title=title, first=first, last=last, tasks=index.window(first, last))
+        for title, first, last in windows
+    ]
+
+
+def _escape(text: str) -> str:
+    """Escape a TEXT value, see RFC 5545, 3.3.11."""
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> list[str]:
+    """Split a content line into lines of at most 75 octets without splitting characters."""
+    lines = []
+    chunk = ""
+    size = 0
+    for char in line:
+        char_size = len(char.encode("utf8"))
+        if size + char_size > _ICS_LINE_OCTETS:
+            lines.append(chunk)
+            chunk, size = " ", 1  # A continuation line starts with a space.
+        chunk += char
+        size += char_size
+    lines.append(chunk)
+    return lines
+
+
+def task_uids(tasks: Iterable[Task]) -> Iterable[tuple[str, Task]]:
+    """
+    Yield stable UIDs of events with their tasks; the same description in the same note is
+    numbered in the order of the tasks.
+    """
+    seen: dict[str, int] = {}
+    for task in tasks:
+        key = f"{task.vault}/{task.note}/{task.descr}"
+        num = seen[key] = seen.get(key, -1) + 1
+        digest = hashlib.blake2b(f"{key}/{num}".encode("utf8"), digest_size=10).hexdigest()
+        yield f"{digest}@dope", task
+
+
+@dataclass
+class _Event:
+    digest: str
+    """A digest of the task the event was serialized from."""
+    sequence: int
+    """The revision of the event, incremented when its task changes."""
+    text: str
+    """Folded content lines of the VEVENT."""
+
+
+class IcsFeed:
+    """An `.ics` file with events of tasks, rewritten only when events change."""
+
+    # pylint: disable=too-few-public-methods
+
+    CACHE_VERSION = 1
+
+    def __init__(
+        self, ics_path: pathlib.PosixPath, cache_path: pathlib.PosixPath | None = None
+    ) -> None:
+        self.ics_path = ics_path
+        self.cache_path = cache_path or get_cache_dir() / "ics_feed.json"
+        self.events: dict[str, _Event] = {}
+        """Events by UIDs, in the order of the feed."""
+        self.num_changed = 0
+        """The number of events serialized by the last export: new and changed tasks."""
+        self.num_removed = 0
+        """The number of events dropped by the last export: done and deleted tasks."""
+        self._load()
+
+    def export(self, tasks: Iterable[Task], now: datetime | None = None) -> bool:
+        """Write events of the tasks to the feed if any of them changed; return whether it was."""
+        stamp = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+        events: dict[str, _Event] = {}
+        self.num_changed = 0
+        for uid, task in task_uids(tasks):
+            digest = hashlib.blake2b(
+                json.dumps(task.to_record(), sort_keys=True).encode("utf8"), digest_size=10
+            ).hexdigest()
+            event = self.events.get(uid)
+            if event is None or event.digest != digest:
+                self.num_changed += 1
+                sequence = 0 if event is None else event.sequence + 1
+                event = _Event(digest, sequence, self._vevent(uid, task, sequence, stamp))
+            events[uid] = event
+        self.num_removed = len(self.events.keys() - events.keys())
+        unchanged = (
+            not self.num_changed and not self.num_removed and list(events) == list(self.events)
+        )
+        self.events = events
+        if unchanged and self.ics_path.exists():
+            _logger.debug("%d events, none changed.", len(events))
+            return False
+        self._write()
+        self._save()
+        _logger.debug(
+            "%d events, %d changed, %d removed.", len(events), self.num_changed, self.num_removed
+        )
+        return True
+
+    @staticmethod
+    def _vevent(uid: str, task: Task, sequence: int, stamp: str) -> str:
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            f"DTSTAMP:{stamp}",
+            f"SEQUENCE:{sequence}",
+            f"DTSTART;VALUE=DATE:{task.deadline:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{task.deadline + timedelta(days=1):%Y%m%d}",
+            *(
+                []
+                if task.every is None
+                else [f"RRULE:FREQ={_ICS_FREQUENCIES[task.every.unit]};INTERVAL={task.every.num}"]
+            ),
+            f"SUMMARY:{_escape(task.descr)}",
+            f"DESCRIPTION:{_escape(f'{task.vault}/{task.note}')}",
+            f"CATEGORIES:{_ICS_CATEGORIES[task.TYPE_LETTER]}",
+            f"PRIORITY:{_ICS_PRIORITIES.get(task.priority, 0)}",
+            "END:VEVENT",
+        ]
+        return "\r\n".join(folded for line in lines for folded in _fold(line))
+
+    def _write(self) -> None:
+        header = "\r\n".join(
+            (
+                "BEGIN:VCALENDAR",
+                "VERSION:2.0",
+                "PRODID:-//dope//tasks//EN",
+                "CALSCALE:GREGORIAN",
+                "X-WR-CALNAME:dope tasks",
+            )
+        )
+        tmp_path = self.ics_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf8", newline="") as fp:
+            fp.write(header + "\r\n")
+            for event in self.events.values():
+                fp.write(event.text + "\r\n")
+            fp.write("END:VCALENDAR\r\n")
+        os.replace(tmp_path, self.ics_path)
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path,
+            self.CACHE_VERSION,
+            "Calendar feed cache has an old format; rebuilding.",
+        )
+        if cache is None:
+            return
+        if cache["path"] != str(self.ics_path):
+            _logger.info("Calendar feed moved from '%s'; rebuilding.", cache["path"])
+            return
+        self.events = {uid: _Event(*item) for uid, item in cache["events"].items()}
+
+    def _save(self) -> None:
+        cache = {
+            "path": str(self.ics_path),
+            "events": {
+                uid: [event.digest, event.sequence, event.text]
+                for uid, event in self.events.items()
+            },
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def _test_tasks() -> list[Task]:
+    # pylint: disable=import-outside-toplevel
+    from dope.task import Recurrence, TaskNext, TaskNow, TaskWait
+
+    today = date(2026, 10, 21)  # Wednesday.
+    return [
+        TaskNext("Pay, rent", "home", "Bills", 1, today - timedelta(days=3)),
+        TaskNow("Write", "work", "Report", 2, today),
+        TaskWait("Parcel", "home", "Post", 3, today + timedelta(days=1)),
+        TaskNext("Call", "work", "Team", 2, today + timedelta(days=5)),
+        TaskNext("Call", "work", "Team", 2, today + timedelta(days=40)),
+        TaskNow("Water", "home", "Chores", 3, date(2020, 1, 2), Recurrence(1, "w")),  # Thursdays.
+    ]
+
+
+def test_agenda() -> None:
+    """Check windows of the index and buckets of both views."""
+    today = date(2026, 10, 21)
+    index = DeadlineIndex(reversed(_test_tasks()))
+    assert len(index) == 6
+    assert [task.descr for task in index.window(today, today + timedelta(days=5))] == [
+        "Write",
+        "Water",
+        "Parcel",
+        "Call",
+    ]
+    waterings = index.window(today + timedelta(days=6), today + timedelta(days=39))
+    assert [task.deadline.day for task in waterings] == [29, 5, 12, 19, 26]
+    assert all(task.every is not None for task in waterings)
+    assert len(index.window(None, None)) == 5  # Series have no overdue occurrences.
+
+    def titles(view: str) -> list[tuple[str, int]]:
+        return [
+            (bucket.title, len(bucket.tasks)) for bucket in agenda(index, view=view, today=today)
+        ]
+
+    days = titles("day")
+    assert days[:3] == [("Overdue", 1), ("Today, Wed 2026-10-21", 1), ("Thu 2026-10-22", 2)]
+    assert len(days) == 2 + DAYS_AHEAD and sum(num for _, num in days) == 5
+    assert titles("week") == [
+        ("Overdue", 1),
+        ("Today, Wed 2026-10-21", 1),
+        ("This week", 2),
+        ("Week 44, 2026-10-26 to 2026-11-01", 2),
+        ("Week 45, 2026-11-02 to 2026-11-08", 1),
+        ("Week 46, 2026-11-09 to 2026-11-15", 1),
+        ("Week 47, 2026-11-16 to 2026-11-22", 1),
+    ]
+
+
+def test_ics_feed(tmp_path: pathlib.PosixPath) -> None:
+    """Check the content of the feed and that only changed events are serialized."""
+    ics_path = tmp_path / "tasks.ics"
+    cache_path = tmp_path / "ics_feed.json"
+    tasks = _test_tasks()
+    feed = IcsFeed(ics_path, cache_path)
+    assert feed.export(tasks)
+    assert feed.num_changed == 6
+    content = ics_path.read_bytes().decode("utf8")
+    assert content.startswith("BEGIN:VCALENDAR\r\n") and content.endswith("END:VCALENDAR\r\n")
+    assert content.count("BEGIN:VEVENT") == 6
+    assert content.count("RRULE:FREQ=WEEKLY;INTERVAL=1\r\n") == 1
+    assert (
+        "SUMMARY:Pay\\, rent\r\nDESCRIPTION:home/Bills\r\nCATEGORIES:next\r\nPRIORITY:1" in content
+    )
+    assert len(set(uid for uid, _ in task_uids(tasks))) == 6
+
+    feed = IcsFeed(ics_path, cache_path)
+    assert not feed.export(tasks)
+    tasks[1].deadline += timedelta(days=1)
+    assert feed.export(tasks[:4])
+    assert (feed.num_changed, feed.num_removed) == (1, 2)
+    assert "SEQUENCE:1" in ics_path.read_text()
+    assert ics_path.read_text().count("BEGIN:VEVENT") == 4
+    assert all(len(line.encode("utf8")) <= 75 for line in _fold("é" * 100))
@@ -0,0 +1,8 @@
+"""
+Benchmarks of dope's hot paths on synthetic vaults.
+
+Generate a vault and time everything:
+    python -m dope.bench.run --num-notes 5000 --output bench.json
+Compare with a previous run:
+    python -m dope.bench.run --num-notes 5000 --compare bench.json
+"""
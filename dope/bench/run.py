@@ -0,0 +1,181 @@
+"""
+Time dope's hot paths on a synthetic vault and save the results as JSON.
+
+Every benchmark is run several times; the JSON file holds all timings and their statistics,
+the commit, and the vault spec, so that results of different commits can be compared.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import logging
+import pathlib
+import platform
+import statistics
+import subprocess as sp
+import sys
+import time
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+from dope.bench.vault_gen import VaultSpec, generate_vault
+from dope.config import get_cache_dir
+from dope.dope_cli.edu_tracker import Lesson
+from dope.dope_cli.rover_sync import RoverSync
+from dope.markdown_link import MarkdownLink
+from dope.task import Task
+from dope.tests import test_v_files, test_v_links, test_v_notes
+from dope.v_note import VNote
+from dope.wiki_link import WikiLink
+
+_logger = logging.getLogger(__name__)
+
+
+def get_benchmarks(vault_dir: pathlib.PosixPath) -> dict[str, Callable[[], object]]:
+    """Return all benchmarks as named callables."""
+    vault_dirs = [vault_dir]
+    v_notes = VNote.collect(vault_dirs=vault_dirs, exclude_trash=True)
+    lines = [
+        line for v_note in v_notes for _, line in v_note.lines_iter(lazy=True, remove_newline=True)
+    ]
+    subdirs = sorted({v_note.note_path.parent for v_note in v_notes})
+
+    def lines_iter() -> int:
+        return sum(
+            1 for v_note in v_notes for _ in v_note.lines_iter(lazy=True, remove_newline=True)
+        )
+
+    def links_resources() -> None:
+        for subdir in subdirs:
+            test_v_links.test_v_links_resources((vault_dir, subdir))
+
+    return {
+        "VNote.collect_iter": lambda: list(VNote.collect_iter(vault_dirs, exclude_trash=True)),
+        "VNote.lines_iter": lines_iter,
+        "MarkdownLink.collect_iter": lambda: [
+            link for line in lines for link in MarkdownLink.collect_iter(line=line)
+        ],
+        "WikiLink.collect_iter": lambda: [
+            link for line in lines for link in WikiLink.collect_iter(line=line)
+        ],
+        "Task.collect": lambda: Task.collect(vault_dirs=vault_dirs),
+        "Lesson.collect": lambda: Lesson.collect(vault_dirs=vault_dirs, course_filter=[]),
+        "RoverSync._get_files_dirs": lambda: RoverSync._get_files_dirs(vault_dir),
+        "test_v_files_titles": lambda: test_v_files.test_v_files_titles(vault_dir),
+        "test_v_notes_newline": lambda: test_v_notes.test_v_notes_newline(vault_dir),
+        "test_v_notes_titles": lambda: test_v_notes.test_v_notes_titles(vault_dir),
+        "test_v_links_validity": lambda: test_v_links.test_v_links_validity(vault_dir),
+        "test_v_links_resources": links_resources,
+    }
+
+
+def run_benchmarks(
+    vault_dir: pathlib.PosixPath, repeat: int, only: list[str] | None = None
+) -> dict[str, dict[str, Any]]:
+    """Run benchmarks and return timings in seconds with their statistics."""
+    results: dict[str, dict[str, Any]] = {}
+    for name, func in get_benchmarks(vault_dir).items():
+        if only and not any(token in name for token in only):
+            continue
+        timings = []
+        for _ in range(repeat):
+            t_start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t_start)
+        results[name] = {
+            "timings": timings,
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.fmean(timings),
+        }
+        _logger.info("%s: min %.4f s", name, min(timings))
+    return results
+
+
+def compare(old: dict[str, Any], new: dict[str, Any]) -> list[str]:
+    """Return human-readable lines comparing minimal timings of two results."""
+    lines = [f"{old.get('commit', '?')[:10]} -> {new.get('commit', '?')[:10]}"]
+    for name, new_result in new["results"].items():
+        if (old_result := old["results"].get(name)) is None:
+            lines.append(f"{name:30} new: {new_result['min']:.4f} s")
+            continue
+        ratio = new_result["min"] / old_result["min"] if old_result["min"] else float("inf")
+        lines.append(
+            f"{name:30} {old_result['min']:.4f} s -> {new_result['min']:.4f} s ({ratio:.2f}x)"
+        )
+    return lines
+
+
+def _get_commit() -> str | None:
+    proc = sp.run(
+        ["git", "rev-parse", "HEAD"],
+        cwd=pathlib.PosixPath(__file__).parent,
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+
+def main() -> int:
+    """Parse arguments, generate a vault, run benchmarks, save and compare results."""
+    prsr = argparse.ArgumentParser(description="Benchmarks of dope's hot paths.")
+    defaults = VaultSpec()
+    for field in dataclasses.fields(VaultSpec):
+        prsr.add_argument(
+            f"--{field.name.replace('_', '-')}",
+            dest=field.name,
+            type=type(getattr(defaults, field.name)),
+            default=getattr(defaults, field.name),
+        )
+    prsr.add_argument("--repeat", type=int, default=5, help="The number of runs per benchmark.")
+    prsr.add_argument("--only", nargs="+", help="Run benchmarks with these tokens in names.")
+    prsr.add_argument(
+        "--vault-dir",
+        type=pathlib.PosixPath,
+        help=(
+            "Where to generate the vault; 'bench_vault' in the cache directory by default. "
+            "A directory that is not empty must hold a vault generated before."
+        ),
+    )
+    prsr.add_argument("--output", type=pathlib.PosixPath, help="Save results to this JSON file.")
+    prsr.add_argument("--compare", type=pathlib.PosixPath, help="Compare with this JSON file.")
+    args = prsr.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    _logger.setLevel(logging.INFO)
+
+    spec = VaultSpec(
+        **{field.name: getattr(args, field.name) for field in dataclasses.fields(VaultSpec)}
+    )
+    try:
+        vault_dir = generate_vault(args.vault_dir or get_cache_dir() / "bench_vault", spec)
+    except ValueError as err:
+        _logger.error("%s", err)
+        return 1
+    results = {
+        "commit": _get_commit(),
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "python": platform.python_version(),
+        "spec": dataclasses.asdict(spec),
+        "repeat": args.repeat,
+        "results": run_benchmarks(vault_dir=vault_dir, repeat=args.repeat, only=args.only),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as fp:
+            json.dump(obj=results, fp=fp, indent=2)
+    else:
+        json.dump(obj=results, fp=sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, "rb") as fp:
+            for line in compare(old=json.load(fp=fp), new=results):
+                print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Generator of reproducible synthetic Obsidian vaults.
+
+The same spec always produces the same vault, so timings of different commits are comparable.
+All generated links are valid, thus vault tests pass on generated vaults.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import pathlib
+import random
+import shutil
+from dataclasses import dataclass
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class VaultSpec:
+    """Parameters of a synthetic vault."""
+
+    num_notes: int = 1000
+    depth: int = 3
+    """Nesting depth of directories."""
+    fanout: int = 4
+    """The number of subdirectories in every directory."""
+    lines_per_note: int = 40
+    code_fence_ratio: float = 0.2
+    """Probability that a note has a code block."""
+    links_per_note: int = 5
+    """The average number of links to other notes."""
+    wiki_link_ratio: float = 0.3
+    """Part of links that are wiki links."""
+    task_ratio: float = 0.02
+    """Probability that a line has a task tag."""
+    lesson_ratio: float = 0.02
+    """Probability that a line has a lesson tag."""
+    attachments_per_dir: int = 3
+    attachment_size: int = 4096
+    """Size of an attachment in bytes."""
+    seed: int = 0
+
+
+_WORDS = (
+    "alpha beta gamma delta epsilon zeta theta kappa lambda sigma omega "
+    "vault note task lesson link code tag course rover base res inbox"
+).split()
+_SPEC_FILE_NAME = ".bench_spec.json"
+
+
+def generate_vault(vault_dir: pathlib.PosixPath, spec: VaultSpec) -> pathlib.PosixPath:
+    """
+    Generate a vault in the given directory and return the directory.
+
+    If the directory already holds a vault generated with the same spec, it is reused; a vault
+    generated with another spec is replaced.
+
+    :raises ValueError: if the directory is not empty and holds no generated vault, e.g. it is
+        a real vault, which must never be deleted.
+    """
+    spec_path = vault_dir / _SPEC_FILE_NAME
+    spec_dict = dataclasses.asdict(spec)
+    if spec_path.exists() and json.loads(spec_path.read_text()) == spec_dict:
+        _logger.info("Reusing '%s'.", vault_dir)
+        return vault_dir
+    if vault_dir.exists():
+        if not spec_path.exists() and any(vault_dir.iterdir()):
+            raise ValueError(
+                f"'{vault_dir}' is not empty and holds no generated vault ({_SPEC_FILE_NAME}); "
+                "choose an empty or a new directory."
+            )
+        shutil.rmtree(vault_dir)
+
+    rnd = random.Random(spec.seed)
+    dirs = _make_dirs(vault_dir=vault_dir, spec=spec)
+
+    # Decide where all notes live before writing them, so that links can point to any note.
+    note_rpaths = []
+    for note_idx in range(spec.num_notes):
+        note_dir = dirs[rnd.randrange(len(dirs))]
+        note_rpaths.append(note_dir.relative_to(vault_dir) / f"note {note_idx:06d}.md")
+
+    attachments: dict[pathlib.PosixPath, list[str]] = {}
+    for dir_path in dirs:
+        res_dir = dir_path / "res"
+        res_dir.mkdir()
+        attachments[dir_path] = []
+        for att_idx in range(spec.attachments_per_dir):
+            name = f"image-{att_idx:03d}.png"
+            (res_dir / name).write_bytes(rnd.randbytes(spec.attachment_size))
+            attachments[dir_path].append(name)
+
+    for note_rpath in note_rpaths:
+        lines = _make_note_lines(
+            rnd=rnd,
+            spec=spec,
+            note_rpaths=note_rpaths,
+            attachments=attachments[(vault_dir / note_rpath).parent],
+        )
+        (vault_dir / note_rpath).write_text("".join(lines), encoding="utf8")
+
+    spec_path.write_text(json.dumps(spec_dict))
+    _logger.info(
+        "Generated %d notes in %d directories in '%s'.", len(note_rpaths), len(dirs), vault_dir
+    )
+    return vault_dir
+
+
+def _make_dirs(vault_dir: pathlib.PosixPath, spec: VaultSpec) -> list[pathlib.PosixPath]:
+    """Create the directory tree and the service directories of a vault."""
+    for service_dir in (".obsidian", "_inbox", ".trash"):
+        (vault_dir / service_dir).mkdir(parents=True)
+    (vault_dir / "_inbox" / ".keep").touch()
+    (vault_dir / ".trash" / ".keep").touch()
+
+    dirs = [vault_dir / "notes"]
+    level = list(dirs)
+    for _ in range(spec.depth):
+        level = [parent / f"dir{idx}" for parent in level for idx in range(spec.fanout)]
+        dirs.extend(level)
+    for dir_path in dirs:
+        dir_path.mkdir(parents=True)
+    return dirs
+
+
+def _make_note_lines(
+    rnd: random.Random,
+    spec: VaultSpec,
+    note_rpaths: list[pathlib.PosixPath],
+    attachments: list[str],
+) -> list[str]:
+    """Make lines of a note: text with links, tags, attachments, and code blocks."""
+    lines = [f"# {' '.join(rnd.choices(_WORDS, k=3))}\n", "\n"]
+    link_prob = spec.links_per_note / max(spec.lines_per_note, 1)
+    code_line_idx = (
+        rnd.randrange(spec.lines_per_note) if rnd.random() < spec.code_fence_ratio else None
+    )
+    for line_idx in range(spec.lines_per_note):
+        words: list[str] = rnd.choices(_WORDS, k=8)
+        if rnd.random() < spec.task_ratio:
+            month, day = rnd.randint(1, 12), rnd.randint(1, 28)
+            words.insert(
+                0, f"* [ ] #2026-{month:02d}-{day:02d}/{rnd.choice('xwn')}{rnd.randint(1, 3)}"
+            )
+        if rnd.random() < spec.lesson_ratio:
+            words.insert(0, f"* #edu/course{rnd.randrange(10)}/{rnd.choice('xwn')}:")
+        if rnd.random() < link_prob:
+            target = rnd.choice(note_rpaths).with_suffix("")
+            if rnd.random() < spec.wiki_link_ratio:
+                words.append(f"[[{target}|{rnd.choice(_WORDS)}]]")
+            else:
+                words.append(f"[{rnd.choice(_WORDS)}]({str(target).replace(' ', '%20')}.md)")
+        if attachments and rnd.random() < link_prob:
+            words.append(f"![image](./res/{rnd.choice(attachments)})")
+        lines.append(" ".join(words) + "\n")
+        if line_idx == code_line_idx:
+            # Code blocks contain things that look like links and tags but must be ignored.
+            lines.extend(
+                [
+                    "```python\n",
+                    "x = '[not a link](missing.md) [[missing]] #2026-01-01/x1 #edu/none/x'\n",
+                    "```\n",
+                ]
+            )
+    return lines
+
+
+def test_generate_vault(tmp_path: pathlib.PosixPath) -> None:
+    """Check that a generated vault is reproducible and its links are valid."""
+    # pylint: disable-next=import-outside-toplevel
+    from dope.tests import test_v_links, test_v_notes
+
+    spec = VaultSpec(num_notes=30, depth=1, fanout=2, seed=1)
+    vault_a = generate_vault(tmp_path / "a", spec)
+    vault_b = generate_vault(tmp_path / "b", spec)
+    notes_a = sorted(path.relative_to(vault_a) for path in vault_a.rglob("*.md"))
+    notes_b = sorted(path.relative_to(vault_b) for path in vault_b.rglob("*.md"))
+    assert len(notes_a) == 30
+    assert notes_a == notes_b
+    for note in notes_a:
+        assert (vault_a / note).read_bytes() == (vault_b / note).read_bytes()
+
+    (vault_b / ".bench_spec.json").unlink()  # Looks like a real vault now.
+    try:
+        generate_vault(vault_b, VaultSpec(num_notes=1))
+    except ValueError:
+        pass
+    else:
+        assert False, "A directory without a spec is replaced"
+    assert len(list(vault_b.rglob("*.md"))) == 30
+
+    test_v_links.test_v_links_validity(vault_a)
+    test_v_notes.test_v_notes_newline(vault_a)
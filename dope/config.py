@@ -3,10 +3,14 @@ Dope configuration.
 
 Configuration files:
 * vaults.json holds a list of all vault directories
+
+Cache files (indexes that can be rebuilt at any time) are kept in the cache directory.
+They are JSON objects with a version, see read_json_cache() and write_json_cache().
 """
 
 import json
 import logging
+import os
 from pathlib import PosixPath
 from typing import Any
 
@@ -84,6 +88,50 @@ def _get_vaults_json_path() -> PosixPath:
     return config_dir_path / "vaults.json"
 
 
+def get_cache_dir() -> PosixPath:
+    """
+    Return the directory for dope's caches; create it if needed.
+    """
+    cache_dir_path = PosixPath(platformdirs.user_cache_dir("dope"))
+    cache_dir_path.mkdir(parents=True, exist_ok=True)
+    return cache_dir_path
+
+
+def read_json_cache(
+    cache_path: PosixPath, version: int, old_format: str | None = None
+) -> dict[str, Any] | None:
+    """
+    Read a cache written by write_json_cache().
+
+    None is returned if the file does not exist or has another version, i.e. was written by
+    another version of dope; then the `old_format` warning is logged if it is given. A file that
+    is not valid JSON, e.g. truncated by a crash or a full disk, is a cache miss too.
+    """
+    if not cache_path.exists():
+        return None
+    try:
+        with open(cache_path, "rb") as fp:
+            cache = json.load(fp=fp)
+    except ValueError as err:
+        logging.getLogger(__name__).warning(
+            "Cache '%s' is corrupt, %s; rebuilding.", cache_path, err
+        )
+        return None
+    if not isinstance(cache, dict) or cache.get("version") != version:
+        if old_format is not None:
+            logging.getLogger(__name__).warning(old_format)
+        return None
+    return cache
+
+
+def write_json_cache(cache_path: PosixPath, version: int, cache: dict[str, Any]) -> None:
+    """Write the cache with its version atomically: a temporary file replaces the old cache."""
+    tmp_path = cache_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf8") as fp:
+        json.dump(obj={**cache, "version": version}, fp=fp)
+    os.replace(tmp_path, cache_path)
+
+
 def get_config() -> dict[str, Any]:
     """Read local dope configuration. Create default configuration if not found."""
     logger = logging.getLogger(__name__)
@@ -112,3 +160,16 @@ def update_config(update: dict[str, Any]) -> None:
     config.update(update)
     with config_file_path.open("w") as fp:
         json.dump(obj=config, fp=fp)
+
+
+def test_json_cache(tmp_path: PosixPath) -> None:
+    """Check that a cache is read back only with its version and intact."""
+    cache_path = tmp_path / "cache.json"
+    assert read_json_cache(cache_path, version=1) is None
+    write_json_cache(cache_path, 1, {"entries": {"a": [1, 2]}})
+    assert read_json_cache(cache_path, version=1) == {"entries": {"a": [1, 2]}, "version": 1}
+    assert read_json_cache(cache_path, version=2, old_format="Old format.") is None
+    assert [path.name for path in tmp_path.iterdir()] == ["cache.json"]
+    for corrupt in ('{"entries": {"a": [1,', "[1]", "\udcff"):
+        cache_path.write_text(corrupt, errors="surrogateescape")
+        assert read_json_cache(cache_path, version=1) is None
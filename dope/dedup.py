@@ -0,0 +1,396 @@
+"""
+Duplicate attachments in `res` directories of vaults.
+
+Candidates are narrowed down in three steps, each of which reads more of fewer files:
+1. files are grouped by size, which costs one stat() per file,
+2. files of the same size are grouped by a hash of their first and last 64 KiB,
+3. only files whose partial hashes collide are hashed in full, in chunks.
+Files of at most 128 KiB are read in full at the second step already.
+
+Hashes are cached by the device and inode of a file together with its modification time and
+size, thus renamed and moved attachments are not read again. Hard links to the same inode are
+one file and are never reported.
+
+A cluster of duplicates can be collapsed: duplicates within one `res` directory are replaced
+with one canonical file and links to them are rewritten, see collapse(). Duplicates in
+different directories are only reported, because a note links only to its local `res`.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import itertools
+import logging
+import os
+import pathlib
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.link_index import LinkIndex
+from dope.media_index import attachments_iter
+from dope.move import num_links_to, retarget_line
+from dope.name_index import NameIndex
+from dope.property_index import PropertyIndex
+from dope.rewrite import LineTransform, NoteRewriter, RewriteResult
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+PARTIAL_SIZE = 64 * 1024
+"""The number of bytes hashed at the start and at the end of a file."""
+_CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class _HashEntry:
+    path: str
+    mtime_ns: int
+    size: int
+    partial: str | None = None
+    full: str | None = None
+
+
+@dataclass
+class DuplicateCluster:
+    """Files with the same content."""
+
+    size: int
+    """The size of every file in bytes."""
+    paths: list[pathlib.PosixPath]
+    """Sorted paths of the files."""
+
+    @property
+    def reclaimable(self) -> int:
+        """The number of bytes freed if only one file is kept."""
+        return self.size * (len(self.paths) - 1)
+
+
+class DedupIndex:
+    """Cached partial and full hashes of attachments."""
+
+    # pylint: disable=too-few-public-methods
+
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_path: pathlib.PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "dedup_index.json"
+        self.entries: dict[str, _HashEntry] = {}
+        """Entries keyed by `device:inode`."""
+        self.num_read = 0
+        """The number of files read, partially or in full, by the last call of clusters()."""
+        self._load()
+
+    def clusters(self, vault_dirs: Iterable[pathlib.PosixPath]) -> list[DuplicateCluster]:
+        """Return clusters of duplicate attachments of the vaults, most reclaimable first."""
+        vault_dirs = list(vault_dirs)
+        self.num_read = 0
+        by_size: dict[int, dict[str, pathlib.PosixPath]] = {}
+        stats: dict[str, os.stat_result] = {}
+        for vault_dir in vault_dirs:
+            for path in attachments_iter(vault_dir):
+                stat = path.stat()
+                if stat.st_size == 0:
+                    continue  # Empty files are equal, yet freeing them frees nothing.
+                key = f"{stat.st_dev}:{stat.st_ino}"
+                # The first of hard links to the same inode stands for all of them.
+                if by_size.setdefault(stat.st_size, {}).setdefault(key, path) == path:
+                    stats[key] = stat
+
+        clusters: list[DuplicateCluster] = []
+        for size, files in by_size.items():
+            if len(files) < 2:
+                continue
+            for group in self._group(files, stats, self._partial).values():
+                if len(group) < 2:
+                    continue
+                if size > 2 * PARTIAL_SIZE:
+                    groups = list(self._group(group, stats, self._full).values())
+                else:
+                    groups = [group]
+                clusters.extend(
+                    DuplicateCluster(size=size, paths=sorted(same.values()))
+                    for same in groups
+                    if len(same) > 1
+                )
+
+        vaults = tuple(f"{vault_dir}/" for vault_dir in vault_dirs)
+        self.entries = {
+            key: entry
+            for key, entry in self.entries.items()
+            if key in stats or not entry.path.startswith(vaults)
+        }
+        _logger.debug("%d attachments, %d read.", len(stats), self.num_read)
+        self._save()
+        return sorted(clusters, key=lambda cluster: (-cluster.reclaimable, cluster.paths))
+
+    def _group(
+        self,
+        files: dict[str, pathlib.PosixPath],
+        stats: dict[str, os.stat_result],
+        digest: Callable[[pathlib.PosixPath, _HashEntry], str],
+    ) -> dict[str, dict[str, pathlib.PosixPath]]:
+        """Group files keyed by inodes by their digests."""
+        groups: dict[str, dict[str, pathlib.PosixPath]] = {}
+        for key, path in files.items():
+            stat = stats[key]
+            entry = self.entries.get(key)
+            if entry is None or (entry.mtime_ns, entry.size) != (stat.st_mtime_ns, stat.st_size):
+                entry = self.entries[key] = _HashEntry(str(path), stat.st_mtime_ns, stat.st_size)
+            entry.path = str(path)
+            groups.setdefault(digest(path, entry), {})[key] = path
+        return groups
+
+    def _partial(self, path: pathlib.PosixPath, entry: _HashEntry) -> str:
+        if entry.partial is None:
+            self.num_read += 1
+            hasher = hashlib.sha1()
+            with open(path, "rb") as fp:
+                hasher.update(fp.read(PARTIAL_SIZE))
+                if entry.size > 2 * PARTIAL_SIZE:
+                    fp.seek(-PARTIAL_SIZE, os.SEEK_END)
+                hasher.update(fp.read(PARTIAL_SIZE))
+            entry.partial = hasher.hexdigest()
+        return entry.partial
+
+    def _full(self, path: pathlib.PosixPath, entry: _HashEntry) -> str:
+        if entry.full is None:
+            self.num_read += 1
+            hasher = hashlib.sha1()
+            with open(path, "rb") as fp:
+                while chunk := fp.read(_CHUNK_SIZE):
+                    hasher.update(chunk)
+            entry.full = hasher.hexdigest()
+        return entry.full
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path, self.CACHE_VERSION, "Dedup index cache has an old format; rebuilding."
+        )
+        if cache is None:
+            return
+        self.entries = {key: _HashEntry(*item) for key, item in cache["entries"].items()}
+
+    def _save(self) -> None:
+        cache = {
+            "entries": {
+                key: [entry.path, entry.mtime_ns, entry.size, entry.partial, entry.full]
+                for key, entry in self.entries.items()
+            },
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def _num_links_to(
+    v_note: VNote,
+    rpath: str,
+    name_index: NameIndex,
+    transform: Callable[[str], str] | None = None,
+) -> int:
+    """
+    Return the number of links of the note, its lines and properties, that resolve to `rpath`,
+    optionally after the transform of every line and property value.
+    """
+    note_rpath = str(v_note.note_path.relative_to(v_note.vault_dir))
+    texts = itertools.chain(
+        (line for _, line in v_note.lines_iter(lazy=True, remove_newline=True)),
+        itertools.chain.from_iterable(v_note.properties().values()),
+    )
+    return sum(
+        num_links_to(text if transform is None else transform(text), note_rpath, rpath, name_index)
+        for text in texts
+    )
+
+
+def collapse(
+    cluster: DuplicateCluster,
+    vault_dirs: list[pathlib.PosixPath],
+    link_index: LinkIndex,
+    dry_run: bool = False,
+    *,
+    name_indexes: dict[pathlib.PosixPath, NameIndex] | None = None,
+) -> tuple[list[RewriteResult], list[pathlib.PosixPath]]:
+    """
+    Keep one file of the cluster per directory, rewrite links to the others and delete them.
+
+    The canonical file is the one most notes link to, thus the fewest notes are rewritten;
+    of equally linked files, the one with the shortest name, e.g. `image.png` rather than
+    `image 1.png`. Links by paths and wiki links resolved by name, e.g. `![[image 1.png]]`,
+    are counted and rewritten; a duplicate some link to which would not be rewritten is kept.
+    The backlink index must be up to date. Return the rewritten notes and the deleted files;
+    in the dry-run mode nothing is written and the results hold diffs.
+
+    :param name_indexes: indexes of names by vaults, built when missing and updated as
+        duplicates are deleted; pass the same dictionary for all clusters to walk every vault
+        only once.
+    """
+    # pylint: disable=too-many-locals,too-many-branches
+    if name_indexes is None:
+        name_indexes = {}
+    by_dir: dict[pathlib.PosixPath, list[pathlib.PosixPath]] = {}
+    for path in cluster.paths:
+        by_dir.setdefault(path.parent, []).append(path)
+    results = []
+    removed = []
+    for paths in by_dir.values():
+        vault_dir = next((v_dir for v_dir in vault_dirs if paths[0].is_relative_to(v_dir)), None)
+        if len(paths) < 2 or vault_dir is None:
+            continue
+        if vault_dir not in name_indexes:
+            property_index = PropertyIndex()
+            property_index.update([vault_dir])
+            name_indexes[vault_dir] = NameIndex(
+                vault_dir, aliases=property_index.aliases(vault_dir)
+            )
+        name_index = name_indexes[vault_dir]
+        # Links by name are among the links to any file with the name.
+        backlinks = {
+            path: [
+                v_note
+                for v_note in link_index.name_backlinks(vault_dir, path)
+                if _num_links_to(v_note, str(path.relative_to(vault_dir)), name_index)
+            ]
+            for path in paths
+        }
+        ranked = sorted(
+            (-len(links), len(path.name), path.name, path) for path, links in backlinks.items()
+        )
+        canonical, *duplicates = [path for *_, path in ranked]
+        canonical_rpath = str(canonical.relative_to(vault_dir))
+        for duplicate in duplicates:
+            duplicate_rpath = str(duplicate.relative_to(vault_dir))
+            transforms = []
+            for v_note in backlinks[duplicate]:
+                note_rpath = str(v_note.note_path.relative_to(vault_dir))
+                transform = functools.partial(
+                    retarget_line,
+                    note_rpath_old=note_rpath,
+                    note_rpath_new=note_rpath,
+                    src_rpath=duplicate_rpath,
+                    dst_rpath=canonical_rpath,
+                    name_index=name_index,
+                )
+                transforms.append((v_note, transform))
+            num_kept = sum(
+                _num_links_to(v_note, duplicate_rpath, name_index, transform)
+                for v_note, transform in transforms
+            )
+            if not num_kept:
+                for v_note, transform in transforms:
+                    rewriter = NoteRewriter([LineTransform(name="dedup", func=transform)], dry_run)
+                    if result := rewriter.rewrite_note(v_note):
+                        results.append(result)
+                if not dry_run:  # The rewriter reads lines, not parsed properties.
+                    num_kept = sum(
+                        _num_links_to(
+                            VNote(vault_dir, v_note.note_path), duplicate_rpath, name_index
+                        )
+                        for v_note, _ in transforms
+                    )
+            if num_kept:
+                _logger.warning(
+                    "Kept '%s', a duplicate of '%s': %d links to it are not rewritten.",
+                    duplicate,
+                    canonical.name,
+                    num_kept,
+                )
+                continue
+            if not dry_run:
+                duplicate.unlink()
+                _logger.info("Removed '%s', a duplicate of '%s'.", duplicate, canonical.name)
+            removed.append(duplicate)
+            name_index = name_indexes[vault_dir] = name_index.moved(
+                duplicate_rpath, canonical_rpath
+            )
+    return results, removed
+
+
+def test_dedup_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check the three steps, hard links, and that unchanged files are not read again."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "a" / "res").mkdir(parents=True)
+    (vault_dir / "b" / "res").mkdir(parents=True)
+    big = os.urandom(3 * PARTIAL_SIZE)
+    (vault_dir / "a" / "res" / "big.pdf").write_bytes(big)
+    (vault_dir / "b" / "res" / "big.pdf").write_bytes(big)
+    # The same size, start and end; only the middle differs.
+    (vault_dir / "b" / "res" / "other.pdf").write_bytes(
+        big[:PARTIAL_SIZE] + bytes(PARTIAL_SIZE) + big[-PARTIAL_SIZE:]
+    )
+    (vault_dir / "a" / "res" / "i.png").write_bytes(b"png")
+    (vault_dir / "a" / "res" / "i 1.png").write_bytes(b"png")
+    (vault_dir / "a" / "res" / "j.png").write_bytes(b"gif")
+    os.link(vault_dir / "a" / "res" / "j.png", vault_dir / "b" / "res" / "j.png")
+    (vault_dir / "a" / "res" / "empty").write_bytes(b"")
+    (vault_dir / "a" / "res" / "empty 1").write_bytes(b"")
+    cache_path = tmp_path / "dedup_index.json"
+
+    index = DedupIndex(cache_path)
+    clusters = index.clusters([vault_dir])
+    assert [(cluster.paths, cluster.reclaimable) for cluster in clusters] == [
+        ([vault_dir / "a" / "res" / "big.pdf", vault_dir / "b" / "res" / "big.pdf"], len(big)),
+        ([vault_dir / "a" / "res" / "i 1.png", vault_dir / "a" / "res" / "i.png"], 3),
+    ]
+    assert index.num_read == 6 + 3  # Partial hashes of 6 files, full hashes of 3 big ones.
+
+    (vault_dir / "a" / "res" / "i 1.png").rename(vault_dir / "a" / "res" / "i 2.png")
+    index = DedupIndex(cache_path)
+    assert len(index.clusters([vault_dir])) == 2
+    assert index.num_read == 0
+
+
+def test_collapse(tmp_path: pathlib.PosixPath) -> None:
+    """Check that links by paths and by names to duplicates are rewritten to the canonical file."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "a" / "res").mkdir(parents=True)
+    (vault_dir / "a" / "res" / "i.png").write_bytes(b"png")
+    (vault_dir / "a" / "res" / "i 1.png").write_bytes(b"png")
+    (vault_dir / "a" / "res" / "i 1.png.bak").write_bytes(b"bak")  # Shares a prefix of the name.
+    (vault_dir / "a" / "n.md").write_text("![x](./res/i%201.png) ![y](./res/i.png)\n")
+    (vault_dir / "m.md").write_text("[z](a/res/i.png) ![[I 1.png|100]] ![[I 1.png.bak]]\n")
+    (vault_dir / "o.md").write_text("![[i.png]]\n")  # The most linked file is kept.
+    link_index = LinkIndex(cache_path=tmp_path / "link_index.json")
+    link_index.update([vault_dir])
+    (cluster,) = DedupIndex(tmp_path / "dedup_index.json").clusters([vault_dir])
+
+    name_indexes = {vault_dir: NameIndex(vault_dir)}
+    results, removed = collapse(
+        cluster, [vault_dir], link_index, dry_run=True, name_indexes=name_indexes
+    )
+    assert len(results) == 2 and removed == [vault_dir / "a" / "res" / "i 1.png"]
+    assert removed[0].exists()
+
+    name_indexes = {vault_dir: NameIndex(vault_dir)}
+    collapse(cluster, [vault_dir], link_index, name_indexes=name_indexes)
+    assert not removed[0].exists()
+    assert (vault_dir / "a" / "n.md").read_text() == "![x](./res/i.png) ![y](./res/i.png)\n"
+    assert (vault_dir / "m.md").read_text() == "[z](a/res/i.png) ![[i.png|100]] ![[I 1.png.bak]]\n"
+    resolution = name_indexes[vault_dir].resolve("m.md", "i 1.png")
+    assert resolution is None
+
+
+def test_collapse_kept(tmp_path: pathlib.PosixPath) -> None:
+    """Check that a duplicate is not deleted while a link to it is not rewritten."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "res").mkdir(parents=True)
+    (vault_dir / "res" / "i.png").write_bytes(b"png")
+    (vault_dir / "res" / "i 1.png").write_bytes(b"png")
+    (vault_dir / "n.md").write_text("![[i.png]]\n")
+    (vault_dir / "o.md").write_text("![[i.png]]\n")
+    (vault_dir / "p.md").write_text("![[i 1.png]]\n![[ i 1.png ]]\n")  # Spaces are kept.
+    link_index = LinkIndex(cache_path=tmp_path / "link_index.json")
+    link_index.update([vault_dir])
+    (cluster,) = DedupIndex(tmp_path / "dedup_index.json").clusters([vault_dir])
+
+    for dry_run in (True, False):
+        results, removed = collapse(
+            cluster,
+            [vault_dir],
+            link_index,
+            dry_run,
+            name_indexes={vault_dir: NameIndex(vault_dir)},
+        )
+        assert not results and not removed
+    assert (vault_dir / "res" / "i 1.png").exists()
+    assert (vault_dir / "p.md").read_text() == "![[i 1.png]]\n![[ i 1.png ]]\n"
@@ -2,6 +2,7 @@
 dope_cli submodule
 """
 
+import cProfile
 import logging
 import os
 import pathlib
@@ -9,15 +10,27 @@ import sys
 from pprint import pformat
 
 from dope.config import get_config, get_vault_paths
+from dope.dope_cli.agenda import Agenda
 from dope.dope_cli.check_list import process_check_list
 from dope.dope_cli.config import process_arguments
+from dope.dope_cli.dedup import Dedup
 from dope.dope_cli.edu_tracker import EduTracker
+from dope.dope_cli.links import Links
+from dope.dope_cli.move import Move
+from dope.dope_cli.near_dupes import NearDupes
+from dope.dope_cli.orphans import Orphans
 from dope.dope_cli.parse_args import parse_args
 from dope.dope_cli.pomodoro import Pomodoro
+from dope.dope_cli.properties import Properties
+from dope.dope_cli.rewrite import Rewrite
 from dope.dope_cli.rover_sync import RoverSync
+from dope.dope_cli.search import Search
+from dope.dope_cli.tags import Tags
 from dope.dope_cli.task_tracker import TaskTracker
 from dope.dope_cli.vault_utils import VaultUtils
 from dope.dope_cli.vector import Vector
+from dope.instrument import Instrument
+from dope.term import Term
 
 
 def dope_cli() -> int:
@@ -33,7 +46,11 @@ def dope_cli() -> int:
             _logger.fatal("Input doesn't come from tty.")
             raise SystemExit
 
-        os.system("clear")
+        # Colors, styles, and clearing only make sense in a terminal; e.g. exported records
+        # are piped to other tools.
+        if sys.stdout.isatty():
+            os.system("clear")
+        Term.set_enabled(sys.stdout.isatty())
 
         args = parse_args()
         if args["debug"]:
@@ -56,15 +73,66 @@ def dope_cli() -> int:
         else:
             _logger.warning("No vaults configured.")
 
-        ret_val: int = TaskTracker().process(args=args)
-        ret_val += EduTracker().process(args=args)
-        ret_val += VaultUtils.process(args=args)
+        profile_path = pathlib.PosixPath(args["profile"]) if args["profile"] else None
+        collapsed = profile_path is not None and profile_path.suffix in {".folded", ".collapsed"}
+        if args["timings"] or collapsed:
+            Instrument.enable()
+        profiler = cProfile.Profile() if profile_path is not None and not collapsed else None
+        if profiler is not None:
+            profiler.enable()
+
+        ret_val = 0
+        with Instrument.span("tasks"):
+            ret_val += TaskTracker().process(args=args)
+        with Instrument.span("agenda"):
+            ret_val += Agenda.process(args=args)
+        with Instrument.span("edu"):
+            ret_val += EduTracker().process(args=args)
+        with Instrument.span("vault_utils"):
+            ret_val += VaultUtils.process(args=args)
         ret_val += Pomodoro.process(args=args)
-        ret_val += RoverSync.process(args=args)
-        ret_val += Vector.process(args=args)
+        with Instrument.span("rover"):
+            ret_val += RoverSync.process(args=args)
+        with Instrument.span("vector"):
+            ret_val += Vector.process(args=args)
+        with Instrument.span("search"):
+            ret_val += Search.process(args=args)
+        with Instrument.span("tags"):
+            ret_val += Tags.process(args=args)
+        with Instrument.span("props"):
+            ret_val += Properties.process(args=args)
+        with Instrument.span("links"):
+            ret_val += Links.process(args=args)
+        with Instrument.span("rewrite"):
+            ret_val += Rewrite.process(args=args)
+        with Instrument.span("mv"):
+            ret_val += Move.process(args=args)
+        with Instrument.span("dedup"):
+            ret_val += Dedup.process(args=args)
+        with Instrument.span("orphans"):
+            ret_val += Orphans.process(args=args)
+        with Instrument.span("dupes"):
+            ret_val += NearDupes.process(args=args)
         ret_val += process_arguments(args=args)
         ret_val += process_check_list(args=args)
 
+        if profiler is not None:
+            profiler.disable()
+            assert profile_path is not None
+            profiler.dump_stats(profile_path)
+            print(
+                f"Profile saved to '{profile_path}'; see it with `python3 -m pstats`.",
+                file=sys.stderr,
+            )
+        if collapsed:
+            assert profile_path is not None
+            Instrument.write_collapsed(profile_path)
+            print(f"Collapsed stacks saved to '{profile_path}'.", file=sys.stderr)
+        if args["timings"]:
+            # Stderr keeps the output of e.g. --format clean.
+            for line in Instrument.report():
+                print(line, file=sys.stderr)
+
         return ret_val
     except KeyboardInterrupt:
         print("\nKeyboardInterrupt")
@@ -0,0 +1,69 @@
+"""
+Executing user requests related to the agenda of tasks and its calendar feed.
+"""
+
+import logging
+import pathlib
+from typing import Any
+
+from dope.agenda import DeadlineIndex, IcsFeed, agenda
+from dope.config import get_vault_paths
+from dope.instrument import Instrument
+from dope.tag_index import TagIndex
+from dope.task import Task
+from dope.term import Term, TermRenderer
+
+_logger = logging.getLogger(__name__)
+
+
+class Agenda:
+    """Namespace for functions that show the agenda and export the calendar feed."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to the agenda.
+        """
+        if args["agenda"] is None and args["ics"] is None:
+            return 0
+
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        with Instrument.span("index"):
+            tag_index = TagIndex()
+            tag_index.update(vault_dirs)
+        with Instrument.span("collect"):
+            tasks = Task.collect(vault_dirs=vault_dirs, tag_index=tag_index)
+
+        if args["agenda"] is not None:
+            with Instrument.span("render"):
+                Agenda._print_agenda(DeadlineIndex(tasks), view=args["agenda"], pager=args["pager"])
+
+        if args["ics"] is not None:
+            feed = IcsFeed(pathlib.PosixPath(args["ics"]).expanduser().absolute())
+            with Instrument.span("ics"):
+                written = feed.export(tasks)
+            print(
+                f"{len(feed.events)} events in '{feed.ics_path}', {feed.num_changed} changed, "
+                f"{feed.num_removed} removed{'' if written else '; not rewritten'}."
+            )
+        return 0
+
+    @staticmethod
+    def _print_agenda(index: DeadlineIndex, view: str, pager: bool) -> None:
+        letters = {"n": ("N", "green"), "x": ("X", "yellow"), "w": ("W", "red")}
+        with TermRenderer.open(pager=pager) as renderer:
+            for bucket in agenda(index, view=view):
+                if not bucket.tasks and bucket.first is not None and bucket.first != bucket.last:
+                    continue  # Empty weeks; empty days are shown as free.
+                renderer.line(Term.styled(f"{bucket.title}: {len(bucket.tasks)}", "bold"))
+                for task in bucket.tasks:
+                    letter, color = letters[task.TYPE_LETTER]
+                    deadline = f"{task.deadline} " if bucket.first != bucket.last else ""
+                    every = "" if task.every is None else f", every {task.every}"
+                    renderer.line(
+                        f"  {Term.styled(f'#{letter}{task.priority}', color)} {deadline}"
+                        f"{task.descr} ({task.vault}/{Term.underline(task.note)}{every})"
+                    )
+                renderer.line()
@@ -0,0 +1,66 @@
+"""
+Executing user requests related to duplicate attachments.
+"""
+
+import logging
+import pathlib
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.dedup import DedupIndex, collapse
+from dope.link_index import LinkIndex
+from dope.name_index import NameIndex
+from dope.term import Term
+
+_logger = logging.getLogger(__name__)
+
+
+class Dedup:
+    """Namespace for functions that find and collapse duplicate attachments."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to duplicate attachments.
+        """
+        # pylint: disable=too-many-locals
+        if args["dedup"] is None:
+            return 0
+
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        dedup_index = DedupIndex()
+        clusters = dedup_index.clusters(vault_dirs)
+        for cluster in clusters:
+            print(f"{Term.bold(f'{cluster.reclaimable / 1024 / 1024:.1f} MB')} reclaimable:")
+            for path in cluster.paths:
+                print(f"\t{path}")
+        total = sum(cluster.reclaimable for cluster in clusters)
+        print(
+            f"{len(clusters)} clusters of duplicates, {total / 1024 / 1024:.1f} MB = {total} B "
+            f"reclaimable; {dedup_index.num_read} files read."
+        )
+        if args["dedup"] != "collapse":
+            return 0
+
+        link_index = LinkIndex()
+        link_index.update(vault_dirs)
+        num_lines = num_notes = num_bytes = 0
+        name_indexes: dict[pathlib.PosixPath, NameIndex] = {}
+        for cluster in clusters:
+            results, removed = collapse(
+                cluster, vault_dirs, link_index, dry_run=args["dry_run"], name_indexes=name_indexes
+            )
+            for result in results:
+                for diff_line in result.diff or []:
+                    print(diff_line, end="")
+            num_lines += sum(result.num_lines for result in results)
+            num_notes += len(results)
+            num_bytes += cluster.size * len(removed)
+        verb = "would be" if args["dry_run"] else "were"
+        print(
+            f"{num_bytes / 1024 / 1024:.1f} MB of duplicates {verb} removed, "
+            f"{num_lines} links in {num_notes} notes {verb} rewritten."
+        )
+        return 0
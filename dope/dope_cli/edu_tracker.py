@@ -8,13 +8,16 @@ import logging
 import os
 import pathlib
 import random
-from collections.abc import Iterator
-from dataclasses import dataclass
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 from typing import Any
 
 from dope.config import get_vault_paths
+from dope.export import Record, RecordWriter
+from dope.instrument import Instrument
+from dope.tag_index import TagIndex, note_lines_iter
 from dope.task import Task
-from dope.term import Term
+from dope.term import Term, TermRenderer
 from dope.v_note import VNote
 
 _logger = logging.getLogger(__name__)
@@ -34,41 +37,66 @@ class Lesson:
     _actions = {"x", "n", "w", "big"}
 
     @classmethod
-    def collect(cls, vault_dirs: list[pathlib.PosixPath], course_filter: list[str]) -> list[Lesson]:
+    def collect(
+        cls,
+        vault_dirs: list[pathlib.PosixPath],
+        course_filter: list[str],
+        tag_index: TagIndex | None = None,
+    ) -> list[Lesson]:
         """Find all lessons in all vaults.
 
         A line of the form "... #edu/{course}/{action}[:] {descr}" is considered a lesson.
         """
-        lessons: list[Lesson] = []
+        return list(
+            cls.collect_iter(
+                vault_dirs=vault_dirs, course_filter=course_filter, tag_index=tag_index
+            )
+        )
 
-        num_lines = 0
-        for v_note in VNote.collect_iter(vault_dirs=vault_dirs, exclude_trash=True):
-            with open(v_note.note_path, "r", encoding="utf8") as note_fd:
-                note_lines = note_fd.readlines()
-            in_code_block = False
-            for note_line in note_lines:
-                if note_line.startswith("```"):
-                    in_code_block = not in_code_block
-                if not in_code_block:
-                    num_lines += 1
-                    for lesson in cls._parse_line(note_line=note_line, v_note=v_note):
-                        if not course_filter:
-                            lessons.append(lesson)
-                        else:
-                            for word in course_filter:
-                                if word in lesson.course:
-                                    lessons.append(lesson)
-                                    break
-                        _logger.info("%s", lesson)
-        _logger.debug("Checked %d lines, collected %d lessons", num_lines, len(lessons))
+    @classmethod
+    def collect_iter(
+        cls,
+        vault_dirs: list[pathlib.PosixPath],
+        course_filter: list[str],
+        tag_index: TagIndex | None = None,
+    ) -> Iterator[Lesson]:
+        """Walk through all vaults and yield lessons as they are found.
 
-        return lessons
+        The course filter is applied in the line prefilter, so lines and tags of other courses
+        are rejected before any Lesson object is built. If an updated tag index is given,
+        only its cached lines are parsed.
+        """
+        num_lines = 0
+        num_lessons = 0
+        for v_note, note_lines in note_lines_iter(vault_dirs=vault_dirs, tag_index=tag_index):
+            with Instrument.span("parse_lessons", lines=len(note_lines)):
+                lessons = [
+                    lesson
+                    for _, note_line in note_lines
+                    for lesson in cls._parse_line(
+                        note_line=note_line, v_note=v_note, course_filter=course_filter
+                    )
+                ]
+            num_lines += len(note_lines)
+            for lesson in lessons:
+                num_lessons += 1
+                _logger.info("%s", lesson)
+                yield lesson
+        _logger.debug("Checked %d lines, collected %d lessons", num_lines, num_lessons)
 
     @classmethod
-    def _parse_line(cls, note_line: str, v_note: VNote) -> Iterator[Lesson]:
-        """Collect all lessons from the given line."""
+    def _parse_line(
+        cls, note_line: str, v_note: VNote, course_filter: list[str] | None = None
+    ) -> Iterator[Lesson]:
+        """Collect all lessons from the given line.
+
+        If the course filter is not empty, only lessons of courses whose names contain at least
+        one of the filter words are collected.
+        """
         if "#edu/" not in note_line:
             return
+        if course_filter and not any(token in note_line for token in course_filter):
+            return
 
         note_line = note_line.replace("\r", "").replace("\n", "")
         for word in note_line.split(" "):
@@ -83,6 +111,8 @@ class Lesson:
                     f"(got {len(tag_comps)}, expected {num_tag_comps})."
                 )
                 _, course, action = tag_comps
+                if course_filter and not any(token in course for token in course_filter):
+                    continue
 
                 vault = v_note.vault_dir.name
                 note = v_note.note_path.stem
@@ -100,8 +130,71 @@ class Lesson:
                     vault=vault, note=note, tag=tag, descr=descr, course=course, action=action
                 )
 
+    def to_record(self) -> Record:
+        """Return the lesson as a flat record for export."""
+        return {
+            "course": self.course,
+            "action": self.action,
+            "tag": self.tag,
+            "vault": self.vault,
+            "note": self.note,
+            "descr": self.descr,
+        }
+
     def pretty_str(self) -> str:
-        return f"{self.vault}/{Term.underline(Term.bold(self.note))}: {self.descr}."
+        return f"{self.vault}/{Term.styled(self.note, 'underline', 'bold')}: {self.descr}."
+
+
+@dataclass
+class LessonIndex:
+    """
+    Lessons grouped by course and action.
+
+    The index is built in one pass over the lessons.
+    """
+
+    by_course: dict[str, dict[str, list[Lesson]]] = field(default_factory=dict)
+    """course -> action -> lessons"""
+    lessons: list[Lesson] = field(default_factory=list)
+    """All lessons in the order they were added; used for random selection."""
+
+    @classmethod
+    def build(cls, lessons: Iterable[Lesson]) -> LessonIndex:
+        """Build an index from the given lessons."""
+        index = cls()
+        for lesson in lessons:
+            index.add(lesson)
+        return index
+
+    def add(self, lesson: Lesson) -> None:
+        """Put a lesson into its course/action group."""
+        self.by_course.setdefault(lesson.course, {}).setdefault(lesson.action, []).append(lesson)
+        self.lessons.append(lesson)
+
+    def __len__(self) -> int:
+        return len(self.lessons)
+
+    def courses(self) -> list[str]:
+        """Return sorted course names."""
+        return sorted(self.by_course)
+
+    def actions(self, course: str) -> list[str]:
+        """Return sorted actions of the course."""
+        return sorted(self.by_course[course])
+
+    def get(self, course: str, action: str) -> list[Lesson]:
+        """Return lessons of the course with the given action."""
+        return self.by_course.get(course, {}).get(action, [])
+
+    def select_random(self) -> Lesson | None:
+        """
+        Select a random lesson in O(1).
+
+        Every lesson is equally likely, thus every course is weighted by its number of lessons.
+        """
+        if not self.lessons:
+            return None
+        return self.lessons[int(os.urandom(4).hex(), 16) % len(self.lessons)]
 
 
 class EduTracker:
@@ -123,42 +216,57 @@ class EduTracker:
             return self.ret_val
 
         vault_dirs = get_vault_paths(filter=args["vault"])
-        lessons: list[Lesson] = Lesson.collect(vault_dirs=vault_dirs, course_filter=args["edu"])
+        if args["format"] is not None:
+            # Lessons are streamed as they are found, thus the index is not used.
+            with Instrument.span("export"):
+                RecordWriter(args["format"]).write_all(
+                    lesson.to_record()
+                    for lesson in Lesson.collect_iter(
+                        vault_dirs=vault_dirs, course_filter=args["edu"]
+                    )
+                )
+            return self.ret_val
+
+        with Instrument.span("index"):
+            tag_index = TagIndex()
+            tag_index.update(vault_dirs)
+        with Instrument.span("collect"):
+            index = LessonIndex.build(
+                Lesson.collect_iter(
+                    vault_dirs=vault_dirs, course_filter=args["edu"], tag_index=tag_index
+                )
+            )
 
-        courses = set(stsk.course for stsk in lessons)
+        courses = index.courses()
         _logger.debug("Courses (%d): %s.", len(courses), courses)
 
-        print(Term.green("LESSONS:"))
-
-        # Print as course -> action -> vault -> note -> description.
-        for course in sorted(courses):
-            print(f"{course}")
-            actions = set(stsk.action for stsk in lessons if stsk.course == course)
-            for action in sorted(actions):
-                if action in {"x", "big"}:
-                    action_str = Term.yellow(action.upper())
-                elif action == "n":
-                    action_str = Term.green(action.upper())
-                elif action == "w":
-                    action_str = Term.red(action.upper())
-                else:
-                    action_str = action.upper()
-                print(f"\t\t{action_str}")
-                filtered = [
-                    stsk for stsk in lessons if (stsk.course == course and stsk.action == action)
-                ]
-                random.shuffle(filtered)
-                for stsk in filtered:
-                    print(f"\t\t\t{stsk.pretty_str()}")
-
-        print("--------")
-        print("STATS:")
-        print(f"{len(courses)} courses, {len(lessons)} lessons")
-        rnd_lesson_idx = int(os.urandom(4).hex(), 16) % len(lessons)
-        print(
-            f"selected: {lessons[rnd_lesson_idx].pretty_str()}",
-        )
-        print("--------")
+        with Instrument.span("render"), TermRenderer.open(pager=args["pager"]) as renderer:
+            renderer.line(Term.green("LESSONS:"))
+
+            # Print as course -> action -> vault -> note -> description.
+            for course in courses:
+                renderer.line(f"{course}")
+                for action in index.actions(course):
+                    if action in {"x", "big"}:
+                        action_str = Term.styled(action.upper(), "yellow")
+                    elif action == "n":
+                        action_str = Term.styled(action.upper(), "green")
+                    elif action == "w":
+                        action_str = Term.styled(action.upper(), "red")
+                    else:
+                        action_str = action.upper()
+                    renderer.line(f"\t\t{action_str}")
+                    filtered = list(index.get(course, action))
+                    random.shuffle(filtered)
+                    for stsk in filtered:
+                        renderer.line(f"\t\t\t{stsk.pretty_str()}")
+
+            renderer.line("--------")
+            renderer.line("STATS:")
+            renderer.line(f"{len(courses)} courses, {len(index)} lessons")
+            if (selected := index.select_random()) is not None:
+                renderer.line(f"selected: {selected.pretty_str()}")
+            renderer.line("--------")
 
         return self.ret_val
 
@@ -171,3 +279,51 @@ class EduTracker:
                     filtered.append(subtask)
             lessons = filtered
         return lessons
+
+
+def test_lesson_parse_line_course_filter() -> None:
+    """Check that lessons of other courses are rejected by the line prefilter."""
+    v_note = VNote(pathlib.PosixPath("/vault"), pathlib.PosixPath("/vault/note.md"))
+    line = "* #edu/rust/x: Read chapter 1. #edu/cpp/n"
+
+    lessons = list(Lesson._parse_line(note_line=line, v_note=v_note))
+    assert [(lsn.course, lsn.action) for lsn in lessons] == [("rust", "x"), ("cpp", "n")]
+
+    lessons = list(Lesson._parse_line(note_line=line, v_note=v_note, course_filter=["rus"]))
+    assert [(lsn.course, lsn.action) for lsn in lessons] == [("rust", "x")]
+
+    lessons = list(Lesson._parse_line(note_line=line, v_note=v_note, course_filter=["go"]))
+    assert not lessons
+
+
+def test_lesson_index() -> None:
+    """Check grouping of lessons by course and action."""
+
+    def lesson(course: str, action: str) -> Lesson:
+        return Lesson(descr="", vault="v", note="n", tag="", course=course, action=action)
+
+    index = LessonIndex.build(
+        [lesson("rust", "x"), lesson("cpp", "n"), lesson("rust", "n"), lesson("rust", "x")]
+    )
+    assert len(index) == 4
+    assert index.courses() == ["cpp", "rust"]
+    assert index.actions("rust") == ["n", "x"]
+    assert len(index.get("rust", "x")) == 2
+    assert index.get("go", "x") == []
+    assert index.select_random() in index.lessons
+    assert LessonIndex().select_random() is None
+
+
+def test_collect_with_tag_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check that lessons collected from the index are the same as from notes."""
+    # pylint: disable=import-outside-toplevel
+    from dope.bench import vault_gen
+
+    vault_dir = vault_gen.generate_vault(
+        tmp_path / "vault", vault_gen.VaultSpec(num_notes=40, task_ratio=0.2, lesson_ratio=0.2)
+    )
+    index = TagIndex(cache_path=tmp_path / "tag_index.json")
+    index.update([vault_dir])
+    lessons = Lesson.collect(vault_dirs=[vault_dir], course_filter=["1"])
+    assert lessons
+    assert Lesson.collect(vault_dirs=[vault_dir], course_filter=["1"], tag_index=index) == lessons
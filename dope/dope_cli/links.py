@@ -0,0 +1,113 @@
+"""
+Executing user requests related to links in notes.
+"""
+
+import logging
+import pathlib
+from collections.abc import Iterator
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.export import Record, RecordWriter
+from dope.markdown_link import MarkdownLink
+from dope.term import Term
+from dope.v_note import VNote
+from dope.web_links import WebLinkChecker
+from dope.wiki_link import WikiLink
+
+_logger = logging.getLogger(__name__)
+
+
+class Links:
+    """Namespace for functions that extract links from notes."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def collect_iter(vault_dirs: list[pathlib.PosixPath]) -> Iterator[Record]:
+        """Yield all markdown and wiki links of all notes as records, note by note."""
+        for v_note in VNote.collect_iter(vault_dirs=vault_dirs, exclude_trash=True):
+            note = str(v_note.note_path.relative_to(v_note.vault_dir))
+            for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+                if "[" not in note_line:
+                    continue
+                for kind, links in (
+                    ("markdown", MarkdownLink.collect_iter(line=note_line)),
+                    ("wiki", WikiLink.collect_iter(line=note_line)),
+                ):
+                    for link in links:
+                        yield {
+                            "vault": v_note.vault_dir.name,
+                            "note": note,
+                            "line": line_idx,
+                            "kind": kind,
+                            "name": link.name,
+                            "uri": link.uri,
+                            "section": link.section,
+                            "external": link.is_external(),
+                        }
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to links.
+        """
+        if args["check_web"]:
+            return Links.check_web(vault_dirs=get_vault_paths(filter=args["vault"]))
+        if not args["links"]:
+            return 0
+
+        records = Links.collect_iter(vault_dirs=get_vault_paths(filter=args["vault"]))
+        if args["format"] is not None:
+            RecordWriter(args["format"]).write_all(records)
+            return 0
+        for record in records:
+            print(f"{record['vault']}/{record['note']}:{record['line']}: {record['uri']}")
+        return 0
+
+    @staticmethod
+    def check_web(vault_dirs: list[pathlib.PosixPath]) -> int:
+        """
+        Check external links of all notes; print dead links and latencies per host.
+
+        1 is returned if a link is dead, thus the check can fail a script or a CI job.
+        """
+        records = [record for record in Links.collect_iter(vault_dirs) if record["external"]]
+        checker = WebLinkChecker()
+        results = checker.check(str(record["uri"]) for record in records)
+        num_dead = 0
+        for record in records:
+            if (status := results.get(str(record["uri"]))) is not None and not status.ok:
+                num_dead += 1
+                print(
+                    f"{record['vault']}/{record['note']}:{record['line']}: "
+                    f"{Term.red(status.error or str(status.status))} {record['uri']}"
+                )
+        print(f"{'host':40} {'links':>5} {'dead':>5} {'mean':>7} {'median':>7} {'max':>7}")
+        for stats in WebLinkChecker.host_stats(results.values()):
+            print(
+                f"{stats.host:40.40} {stats.num_links:5} {stats.num_dead:5} "
+                f"{stats.mean:7.3f} {stats.median:7.3f} {stats.max:7.3f}"
+            )
+        print(
+            f"{len(results)} URLs, {checker.num_checked} checked now, "
+            f"{num_dead} dead links in notes."
+        )
+        return 1 if num_dead else 0
+
+
+def test_links_collect_iter(tmp_path: pathlib.PosixPath) -> None:
+    """Check that links of both kinds are extracted, except links in code."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "dir").mkdir(parents=True)
+    (vault_dir / "dir" / "a.md").write_text(
+        "[B](b.md#part) and [[c|C]]\n```\n[no](link.md)\n```\n[web](https://x.org)\n"
+    )
+    records = list(Links.collect_iter([vault_dir]))
+    assert [(rec["line"], rec["kind"], rec["uri"], rec["section"]) for rec in records] == [
+        (1, "markdown", "b.md", "part"),
+        (1, "wiki", "c", None),
+        (5, "markdown", "https://x.org", None),
+    ]
+    assert records[0]["note"] == "dir/a.md"
+    assert records[2]["external"] is True
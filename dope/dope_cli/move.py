@@ -0,0 +1,53 @@
+"""
+Executing user requests related to moving files in vaults.
+"""
+
+import logging
+import pathlib
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.link_index import LinkIndex
+from dope.move import move_file
+
+_logger = logging.getLogger(__name__)
+
+
+class Move:
+    """Namespace for functions that move files of vaults."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to moving files.
+        """
+        if args["mv"] is None:
+            return 0
+
+        src, dst = (pathlib.PosixPath(path).absolute() for path in args["mv"])
+        vault_dirs = [vault_dir for vault_dir in get_vault_paths() if src.is_relative_to(vault_dir)]
+        if not vault_dirs:
+            _logger.error("'%s' is not in any vault.", src)
+            return 1
+        try:
+            results = move_file(
+                vault_dir=vault_dirs[0],
+                src=src,
+                dst=dst,
+                link_index=LinkIndex(),
+                dry_run=args["dry_run"],
+            )
+        except ValueError as err:
+            _logger.error("%s", err)
+            return 1
+
+        for result in results:
+            for diff_line in result.diff or []:
+                print(diff_line, end="")
+        verb = "would be rewritten" if args["dry_run"] else "rewritten"
+        print(
+            f"{sum(result.num_lines for result in results)} links in {len(results)} notes {verb}."
+        )
+        return 0
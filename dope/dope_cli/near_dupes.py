@@ -0,0 +1,49 @@
+"""
+Executing user requests related to near-duplicate notes.
+"""
+
+import logging
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.near_dupes import NearDupIndex
+from dope.term import Term
+
+_logger = logging.getLogger(__name__)
+
+
+class NearDupes:
+    """Namespace for functions that find near-duplicate notes."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to near-duplicate notes.
+        """
+        if args["dupes"] is None:
+            return 0
+
+        threshold: float = args["dupes"]
+        if not 0.0 < threshold <= 1.0:
+            _logger.error("The similarity must be in (0, 1], not %s.", threshold)
+            return 1
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        index = NearDupIndex()
+        index.update(vault_dirs)
+        pairs = index.pairs(vault_dirs, threshold=threshold)
+        for pair in pairs:
+            print(
+                f"{Term.bold(f'{pair.similarity:.2f}')} "
+                f"{pair.v_note_a.vault_dir.name}/"
+                f"{pair.v_note_a.note_path.relative_to(pair.v_note_a.vault_dir)}\n"
+                f"     {pair.v_note_b.vault_dir.name}/"
+                f"{pair.v_note_b.note_path.relative_to(pair.v_note_b.vault_dir)}"
+            )
+        print(
+            f"{len(pairs)} pairs of notes at least {threshold:.0%} similar; "
+            f"{len(index.entries)} notes, {index.num_read} read, "
+            f"{index.num_candidates} candidates compared."
+        )
+        return 0
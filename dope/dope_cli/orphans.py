@@ -0,0 +1,34 @@
+"""
+Executing user requests related to attachments that no note links to.
+"""
+
+import logging
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.orphans import orphans_iter
+
+_logger = logging.getLogger(__name__)
+
+
+class Orphans:
+    """Namespace for functions that find orphan attachments."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to orphan attachments.
+        """
+        if not args["orphans"]:
+            return 0
+
+        num_orphans = total = 0
+        for vault_dir in get_vault_paths(filter=args["vault"]):
+            for orphan in orphans_iter(vault_dir):
+                num_orphans += 1
+                total += orphan.size
+                print(f"{orphan.size / 1024:10.1f} KB {orphan.path}")
+        print(f"{num_orphans} orphan files, {total / 1024 / 1024:.1f} MB = {total} B.")
+        return 0
@@ -1,11 +1,14 @@
 """Contains functionality related to parsing command line arguments."""
 
 import argparse
+import importlib.util
 import logging
 from typing import Any
 
+from dope.agenda import VIEWS
 from dope.config import get_vault_paths
 from dope.dope_cli.pomodoro import Pomodoro
+from dope.export import FORMATS
 
 _logger = logging.getLogger(__name__)
 
@@ -32,6 +35,30 @@ def parse_args() -> dict[str, Any]:
     prsr.add_argument(
         "-d", "--debug", dest="debug", action="store_true", help="Show all diagnostic messages."
     )
+    prsr.add_argument(
+        "--timings",
+        dest="timings",
+        action="store_true",
+        help="Show time spent in every phase: walking, reading, parsing, filtering, rendering.",
+    )
+    prsr.add_argument(
+        "--profile",
+        dest="profile",
+        nargs="?",  # The result is None or a path.
+        const="dope.pstats",
+        action="store",
+        help=(
+            "Profile the command and save the result to the given file (dope.pstats by default). "
+            "Files with .folded or .collapsed suffixes get collapsed stacks of dope's phases "
+            "for flame graphs; other files get cProfile statistics."
+        ),
+    )
+    prsr.add_argument(
+        "--pager",
+        dest="pager",
+        action="store_true",
+        help="Show long lists of tasks and lessons in a pager ($PAGER or less).",
+    )
 
     #
     # Task related:
@@ -48,6 +75,28 @@ def parse_args() -> dict[str, Any]:
     prsr.add_argument(
         "-t", "--tasks", dest="tasks_all", action="store_true", help="Show all tasks."
     )
+    prsr.add_argument(
+        "--agenda",
+        dest="agenda",
+        nargs="?",  # The result is None or a string.
+        const="day",
+        choices=VIEWS,
+        action="store",
+        help=(
+            "Show overdue, today's, and upcoming tasks by day for a week, "
+            "or by week for four weeks with 'week'."
+        ),
+    )
+    prsr.add_argument(
+        "--ics",
+        dest="ics",
+        metavar="PATH",
+        action="store",
+        help=(
+            "Export all tasks to an iCalendar file that calendar apps can subscribe to; "
+            "only changed events are rewritten."
+        ),
+    )
     prsr.add_argument(
         "-p",
         "--priorities",
@@ -60,6 +109,17 @@ def parse_args() -> dict[str, Any]:
             '3=not important). "12" means both "1" and "2\'.'
         ),
     )
+    prsr.add_argument(
+        "-q",
+        "--query",
+        dest="task_query",
+        nargs="+",  # The result is None or a list.
+        action="store",
+        help=(
+            "Show tasks matching the query, e.g. "
+            "'type:x prio:1,2 due:<7d vault:work note:~proj text:\"invoice\"'."
+        ),
+    )
 
     #
     # Vaults related:
@@ -115,7 +175,143 @@ def parse_args() -> dict[str, Any]:
         See more at https://docs.pytest.org/en/6.2.x/usage.html.
         """,
     )
+    prsr.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        help=(
+            "With --test, check only notes that changed or failed since the last run and notes "
+            "linking to added, deleted, or changed files."
+        ),
+    )
     prsr.add_argument("--stat", dest="stat", action="store_true", help="Show vault statistics.")
+    prsr.add_argument(
+        "-s",
+        "--search",
+        dest="search",
+        nargs="+",  # The result is None or a list.
+        action="store",
+        help=(
+            "Search for notes containing all given words. "
+            "Use double quotes for phrases ('\"borrow checker\"') and * for prefixes (lifetime*)."
+        ),
+    )
+    prsr.add_argument(
+        "--rewrite",
+        dest="rewrite",
+        nargs="+",  # The result is None or a list.
+        action="store",
+        help=(
+            "Rewrite all notes with transforms: crlf (Windows newlines), uris (percent-encoding "
+            "of links), deadlines:+N (move deadlines by N days), lessons:OLD=NEW (rename a course)."
+        ),
+    )
+    prsr.add_argument(
+        "--mv",
+        dest="mv",
+        nargs=2,
+        metavar=("SRC", "DST"),
+        action="store",
+        help=(
+            "Move or rename a note or an attachment and rewrite all links to it; "
+            "see also --dry-run."
+        ),
+    )
+    prsr.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help=(
+            "Show what --rewrite, --mv, or --dedup collapse would change without writing anything."
+        ),
+    )
+    prsr.add_argument(
+        "--links",
+        dest="links",
+        action="store_true",
+        help="List all markdown and wiki links in notes; see also --format.",
+    )
+    prsr.add_argument(
+        "--check-web",
+        dest="check_web",
+        action="store_true",
+        help=(
+            "Check external http(s) links of notes, report dead ones and latencies per host; "
+            "results are cached for a week."
+        ),
+    )
+    prsr.add_argument(
+        "--format",
+        dest="format",
+        choices=FORMATS,
+        default=None,
+        help=(
+            "Stream tasks (-x/-w/-n/-t/-q), lessons (-e), or links (--links) as machine-readable "
+            "records in the order they are found; msgpack needs the optional msgpack package."
+        ),
+    )
+    prsr.add_argument(
+        "--tags",
+        dest="tags",
+        nargs="*",  # The result is None or a list.
+        action="store",
+        help=(
+            "List lines with tags matching the query, e.g. '#edu/rust AND NOT #edu/rust/w'; "
+            "a tag matches nested tags too. Without a query, list all tags."
+        ),
+    )
+    prsr.add_argument(
+        "--props",
+        dest="props",
+        nargs="*",  # The result is None or a list.
+        action="store",
+        help=(
+            "List notes whose frontmatter properties satisfy all conditions, e.g. "
+            "'status:active' 'tags:edu'; without conditions, count notes per property."
+        ),
+    )
+    prsr.add_argument(
+        "--media",
+        dest="media",
+        nargs="?",  # The result is None or a float.
+        const=10.0,
+        type=float,
+        action="store",
+        help=(
+            "Show the total duration of audio attachments per directory and attachments "
+            "larger than the given size in MB (10 MB by default)."
+        ),
+    )
+    prsr.add_argument(
+        "--dedup",
+        dest="dedup",
+        nargs="?",  # The result is None or a string.
+        const="report",
+        choices=["report", "collapse"],
+        action="store",
+        help=(
+            "Report clusters of duplicate attachments and reclaimable space; with 'collapse', "
+            "keep one file per 'res' directory and rewrite links to it; see also --dry-run."
+        ),
+    )
+    prsr.add_argument(
+        "--orphans",
+        dest="orphans",
+        action="store_true",
+        help="List files other than notes that no note links to, with their sizes.",
+    )
+    prsr.add_argument(
+        "--dupes",
+        dest="dupes",
+        nargs="?",  # The result is None or a float.
+        const=0.8,
+        type=float,
+        action="store",
+        help=(
+            "List pairs of notes whose texts are at least this similar (0.8 by default), "
+            "e.g. copies left after migrations; code blocks are ignored."
+        ),
+    )
     prsr.add_argument(
         "--vector",
         dest="vector",
@@ -158,6 +354,10 @@ def parse_args() -> dict[str, Any]:
     Pomodoro.add_arguments(parser=prsr)
 
     args = prsr.parse_args().__dict__
+    if args["format"] == "msgpack" and importlib.util.find_spec("msgpack") is None:
+        prsr.error(
+            "--format msgpack needs the optional msgpack package: pip install 'dope[msgpack]'."
+        )
 
     # Sanity check
     vault_filter: None | list[str] = args["vault"]
@@ -0,0 +1,47 @@
+"""
+Executing user requests related to properties of notes.
+"""
+
+import logging
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.property_index import PropertyIndex
+from dope.term import Term
+
+_logger = logging.getLogger(__name__)
+
+
+class Properties:
+    """Namespace for functions that query properties of notes."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to properties.
+        """
+        if args["props"] is None:
+            return 0
+
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        property_index = PropertyIndex()
+        property_index.update(vault_dirs)
+        _logger.info("Read %d notes.", property_index.num_read)
+
+        if not args["props"]:
+            for key, count in property_index.counts(vault_dirs).items():
+                print(f"{count:6} {key}")
+            return 0
+
+        try:
+            v_notes = property_index.query(vault_dirs, args["props"])
+        except ValueError as err:
+            _logger.error("%s", err)
+            return 1
+        for v_note in v_notes:
+            rpath = v_note.note_path.relative_to(v_note.vault_dir)
+            print(f"{v_note.vault_dir.name}/{Term.styled(str(rpath), 'underline', 'bold')}")
+        print(f"{len(v_notes)} notes found.")
+        return 0
@@ -0,0 +1,53 @@
+"""
+Executing user requests related to bulk rewriting of notes.
+"""
+
+import logging
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.rewrite import LineTransform, NoteRewriter
+from dope.term import Term
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+
+class Rewrite:
+    """Namespace for functions that rewrite notes."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to rewriting notes.
+        """
+        if args["rewrite"] is None:
+            return 0
+
+        try:
+            transforms = [LineTransform.from_spec(spec) for spec in args["rewrite"]]
+        except ValueError as err:
+            _logger.error("%s", err)
+            return 1
+        v_notes = VNote.collect_iter(
+            vault_dirs=get_vault_paths(filter=args["vault"]), exclude_trash=True
+        )
+        results = NoteRewriter(transforms=transforms, dry_run=args["dry_run"]).rewrite(v_notes)
+
+        for result in results:
+            for diff_line in result.diff or []:
+                diff_line = diff_line.rstrip("\n")
+                if diff_line.startswith(("+++", "---")):
+                    print(Term.styled(diff_line, "bold"))
+                elif diff_line.startswith("+"):
+                    print(Term.styled(diff_line, "green"))
+                elif diff_line.startswith("-"):
+                    print(Term.styled(diff_line, "red"))
+                else:
+                    print(Term.styled(diff_line, "cyan"))
+        num_lines = sum(result.num_lines for result in results)
+        verb = "would change" if args["dry_run"] else "changed"
+        print(f"{', '.join(args['rewrite'])}: {verb} {num_lines} lines in {len(results)} notes.")
+        return 0
@@ -9,6 +9,7 @@ from pathlib import PosixPath
 from typing import Any
 
 from dope.config import get_vault_paths
+from dope.git_changes import git_files
 from dope.term import Term
 
 _logger = logging.getLogger(__name__)
@@ -47,7 +48,7 @@ class RoverSync:
                     continue
 
             print(f"{vault_name}: Walking through BASE.")
-            bfiles, bdirs = cls._get_files_dirs(bvdir)
+            bfiles, bdirs = cls._get_base_files_dirs(bvdir)
             _logger.debug(
                 "%d files / %d directories on `%s` BASE.", len(bfiles), len(bdirs), vault_name
             )
@@ -166,6 +167,25 @@ class RoverSync:
             if res_copy:
                 print("\tDone.")
 
+    @classmethod
+    def _get_base_files_dirs(cls, vdir: PosixPath) -> tuple[set[PosixPath], set[PosixPath]]:
+        """
+        Ask git for the files if the vault is a repository: it reads its index instead of
+        stat'ing every file. Directories are the parents of files, thus empty ones are not seen.
+        """
+        rpaths = git_files(vdir)
+        if rpaths is None:
+            return cls._get_files_dirs(vdir)
+        files: set[PosixPath] = set()
+        dirs: set[PosixPath] = set()
+        for rpath_str in rpaths:
+            rpath = PosixPath(rpath_str)
+            if ".trash" in rpath.parts:
+                continue
+            files.add(rpath)
+            dirs.update(rpath.parents[:-1])  # Without `.`.
+        return files, dirs
+
     @classmethod
     def _get_files_dirs(cls, vdir: PosixPath) -> tuple[set[PosixPath], set[PosixPath]]:
         files = set()
@@ -0,0 +1,58 @@
+"""
+Executing user requests related to full-text search in vaults.
+"""
+
+import logging
+import time
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.search_index import SearchIndex
+from dope.term import Term
+
+_logger = logging.getLogger(__name__)
+
+
+class Search:
+    """Namespace for functions that search through notes."""
+
+    # pylint: disable=too-few-public-methods
+
+    MAX_LINES_PER_HIT = 5
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to full-text search.
+        """
+        if args["search"] is None:
+            return 0
+
+        query = " ".join(args["search"])
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        search_index = SearchIndex()
+        try:
+            t_start = time.perf_counter()
+            num_indexed, num_removed = search_index.update(vault_dirs)
+            t_updated = time.perf_counter()
+            hits = search_index.search(query, vault_dirs=vault_dirs)
+            t_searched = time.perf_counter()
+        finally:
+            search_index.close()
+        _logger.info("Indexed %d notes, removed %d notes.", num_indexed, num_removed)
+
+        for hit in hits:
+            vault_name = hit.vault.rsplit("/", 1)[-1]
+            print(f"{vault_name}/{Term.styled(hit.note_rpath, 'underline', 'bold')}")
+            with open(f"{hit.vault}/{hit.note_rpath}", "r", encoding="utf8") as note_fd:
+                note_lines = note_fd.read().splitlines()
+            for line_idx in hit.lines[: Search.MAX_LINES_PER_HIT]:
+                if line_idx <= len(note_lines):
+                    print(f"\t{Term.styled(str(line_idx), 'cyan')}: {note_lines[line_idx - 1]}")
+            if len(hit.lines) > Search.MAX_LINES_PER_HIT:
+                print(f"\t... {len(hit.lines) - Search.MAX_LINES_PER_HIT} more lines")
+        print(
+            f"{len(hits)} notes found in {(t_searched - t_updated) * 1000:.1f} ms "
+            f"(index update {(t_updated - t_start) * 1000:.1f} ms)."
+        )
+        return 0
@@ -0,0 +1,53 @@
+"""
+Executing user requests related to hashtags in vaults.
+"""
+
+import logging
+import pathlib
+from typing import Any
+
+from dope.config import get_vault_paths
+from dope.tag_index import TagIndex
+from dope.term import Term
+
+_logger = logging.getLogger(__name__)
+
+
+class Tags:
+    """Namespace for functions that query tags of notes."""
+
+    # pylint: disable=too-few-public-methods
+
+    @staticmethod
+    def process(args: dict[str, Any]) -> int:
+        """
+        Executing user's requests related to tags.
+        """
+        if args["tags"] is None:
+            return 0
+
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        tag_index = TagIndex()
+        tag_index.update(vault_dirs)
+        _logger.info("Read %d notes.", tag_index.num_read)
+
+        if not args["tags"]:
+            for tag in tag_index.tags():
+                print(f"#{tag}")
+            return 0
+
+        try:
+            matches = tag_index.query(" ".join(args["tags"]), vault_dirs=vault_dirs)
+        except ValueError as err:
+            _logger.error("%s", err)
+            return 1
+        for note, line_idxs in matches.items():
+            entry = tag_index.entries[note]
+            note_path = pathlib.PosixPath(note)
+            vault_name = pathlib.PosixPath(entry.vault_dir).name
+            print(f"{vault_name}/{Term.styled(note_path.stem, 'underline', 'bold')}")
+            note_lines = dict(entry.lines)
+            for line_idx in line_idxs:
+                print(f"\t{Term.styled(str(line_idx), 'cyan')}: {note_lines[line_idx].rstrip()}")
+        print(f"{sum(len(line_idxs) for line_idxs in matches.values())} lines found.")
+        return 0
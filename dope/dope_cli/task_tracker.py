@@ -6,8 +6,12 @@ import logging
 from typing import Any
 
 from dope.config import get_vault_paths
+from dope.export import RecordWriter
+from dope.instrument import Instrument
+from dope.tag_index import TagIndex
 from dope.task import Task, TaskNext, TaskNow, TaskWait
-from dope.term import Term
+from dope.task_query import TaskQuery
+from dope.term import Term, TermRenderer
 
 _logger = logging.getLogger(__name__)
 
@@ -25,45 +29,65 @@ class TaskTracker:
         """
         Executing user's requests related to tasks.
         """
-        if not any((args["tasks_next"], args["tasks_wait"], args["tasks_now"], args["tasks_all"])):
+        if not any(
+            (
+                args["tasks_next"],
+                args["tasks_wait"],
+                args["tasks_now"],
+                args["tasks_all"],
+                args["task_query"],
+            )
+        ):
             return self.ret_val
 
-        vault_dirs = get_vault_paths(filter=args["vault"])
-        tasks = Task.collect(vault_dirs=vault_dirs)
+        try:
+            query = self._build_query(args=args)
+        except ValueError as err:
+            _logger.error("%s", err)
+            return 1
 
-        tasks = self._filter_by_type(tasks=tasks, args=args)
-        _logger.debug("Filtered %d tasks by type.", len(tasks))
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        if args["format"] is not None:
+            # Tasks are streamed unsorted as they are found, thus the index is not used.
+            with Instrument.span("export"):
+                RecordWriter(args["format"]).write_all(
+                    task.to_record()
+                    for task in Task.collect_iter(vault_dirs=vault_dirs, query=query)
+                )
+            return self.ret_val
 
-        tasks = self._filter_by_priority(tasks=tasks, args=args)
-        _logger.debug("Filtered %d tasks by priority.", len(tasks))
+        with Instrument.span("index"):
+            tag_index = TagIndex()
+            tag_index.update(vault_dirs)
+        # Filters are applied while tasks are collected, see TaskQuery.
+        with Instrument.span("collect"):
+            tasks = Task.collect(vault_dirs=vault_dirs, tag_index=tag_index, query=query)
 
-        # Sort them.
+        # Sort them; a recurring task is one task due at its current occurrence.
         def sort_func(task: Task) -> tuple[int, int, int]:
             return (task.get_days_to_dealine(), task.SORTING_PRECEDENCE, task.priority)
 
-        tasks = sorted(tasks, key=sort_func, reverse=True)
+        with Instrument.span("sort"):
+            tasks = sorted(tasks, key=sort_func, reverse=True)
 
-        self._print_tasks(tasks)
+        with Instrument.span("render"):
+            self._print_tasks(tasks, pager=args["pager"])
         return self.ret_val
 
     @staticmethod
-    def _filter_by_type(tasks: list[Task], args: dict[str, Any]) -> list[Task]:
-        """Filter tasks by type."""
-        tasks_flt = []
-        for task in tasks:
-            if args["tasks_all"]:
-                tasks_flt.append(task)
-            elif isinstance(task, TaskNext) and args["tasks_next"]:
-                tasks_flt.append(task)
-            elif isinstance(task, TaskNow) and args["tasks_now"]:
-                tasks_flt.append(task)
-            elif isinstance(task, TaskWait) and args["tasks_wait"]:
-                tasks_flt.append(task)
-        return tasks_flt
+    def _build_query(args: dict[str, Any]) -> TaskQuery:
+        """Compile the task query and add conditions of the type and priority flags to it."""
+        query = TaskQuery.parse(" ".join(args["task_query"] or []))
+
+        # Without type flags, a query selects tasks of all types.
+        types = {
+            letter
+            for letter, flag in (("x", "tasks_next"), ("w", "tasks_wait"), ("n", "tasks_now"))
+            if args[flag]
+        }
+        if args["tasks_all"] or not types:
+            types = {"x", "w", "n"}
 
-    @staticmethod
-    def _filter_by_priority(tasks: list[Task], args: dict[str, Any]) -> list[Task]:
-        """Filter tasks by their priority."""
         # Only 1, 2, 3, or any combination of them are accepted.
         priorities = args["priorities"]
         assert isinstance(priorities, list)
@@ -76,51 +100,38 @@ class TaskTracker:
         assert all(int(i) in [1, 2, 3] for i in priorities), (
             f"At least one priority is unrecognized: {priorities=}"
         )
-
-        tasks_flt = []
-        for task in tasks:
-            match task.priority:
-                case 1:
-                    if 1 in priorities:
-                        tasks_flt.append(task)
-                case 2:
-                    if 2 in priorities:
-                        tasks_flt.append(task)
-                case 3:
-                    if 3 in priorities:
-                        tasks_flt.append(task)
-                case _:
-                    raise ValueError(f"Unsupported priority: {task.priority}")
-        return tasks_flt
+        return query.restrict(types=types, priorities=priorities)
 
     @staticmethod
-    def _print_tasks(tasks: list[Task]) -> None:
+    def _print_tasks(tasks: list[Task], pager: bool = False) -> None:
         """Output the list of tasks to the terminal."""
-        for task in tasks:
-            if isinstance(task, TaskNext):
-                task_str = Term.yellow(f"#X{task.priority}")
-            elif isinstance(task, TaskNow):
-                task_str = Term.green(f"#N{task.priority}")
-            elif isinstance(task, TaskWait):
-                task_str = Term.red(f"#W{task.priority}")
-            else:
-                raise RuntimeError(str(task))
-            if task.priority == 1:
-                task_str = Term.underline(task_str)
-            print(f"{task_str}: ", end="")
-
-            dl_str = task.get_deadline_string()
-            days = task.get_days_to_dealine()
-            if days == 0:
-                deadline_str = Term.bold(Term.green(f"[today, {dl_str}]"))
-            elif days > 0:
-                deadline_str = f"[in {days} days, {dl_str}]"
-            else:
-                deadline_str = Term.bold(Term.cyan(f"[{days} days ago, {dl_str}]"))
-            print(f"{deadline_str} ", end="")
-
-            note_str = Term.underline(Term.bold(task.note))
-            print(f"{task.vault}/{note_str}", end="")
-            print()
-
-            print(f"{task.descr}\n\n", end="")
+        with TermRenderer.open(pager=pager) as renderer:
+            for task in tasks:
+                styles: tuple[str, ...]
+                if isinstance(task, TaskNext):
+                    styles = ("yellow",)
+                    task_str = f"#X{task.priority}"
+                elif isinstance(task, TaskNow):
+                    styles = ("green",)
+                    task_str = f"#N{task.priority}"
+                elif isinstance(task, TaskWait):
+                    styles = ("red",)
+                    task_str = f"#W{task.priority}"
+                else:
+                    raise RuntimeError(str(task))
+                if task.priority == 1:
+                    styles = ("underline", *styles)
+                task_str = Term.styled(task_str, *styles)
+
+                dl_str = task.get_deadline_string()
+                days = task.get_days_to_dealine()
+                if days == 0:
+                    deadline_str = Term.styled(f"[today, {dl_str}]", "bold", "green")
+                elif days > 0:
+                    deadline_str = f"[in {days} days, {dl_str}]"
+                else:
+                    deadline_str = Term.styled(f"[{days} days ago, {dl_str}]", "bold", "cyan")
+
+                note_str = Term.styled(task.note, "underline", "bold")
+                renderer.line(f"{task_str}: {deadline_str} {task.vault}/{note_str}")
+                renderer.line(f"{task.descr}\n")
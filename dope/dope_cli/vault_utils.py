@@ -12,6 +12,7 @@ import shlex
 from typing import Any
 
 from dope.config import get_vault_paths
+from dope.media_index import MediaIndex
 
 _logger = logging.getLogger(__name__)
 
@@ -84,16 +85,22 @@ class VaultUtils:
         if args["stat"]:
             ret_val += VaultUtils._process_stat(args=args)
 
+        if args["media"] is not None:
+            ret_val += VaultUtils._process_media(args=args)
+
         # Wrapper around Pytest that runs only tests that check vaults.
         # Invocation examples:
         #   d --test -v vault1
         #   d --test -v vault1 -- --collect-only -k sport
+        #   d --test --incremental
         if args["test"]:
             dope_root_dir = pathlib.PosixPath(__file__).parent.parent.parent
             cmd = f"cd {dope_root_dir}; pytest -m vault_test"
             vault_filter: None | list[str] = args["vault"]
             if vault_filter:
                 cmd += f" --vault {' '.join(vault_filter)}"
+            if args["incremental"]:
+                cmd += " --incremental"
 
             remainder = args["remainder"]
             if remainder and remainder[0] == "--":
@@ -146,3 +153,24 @@ class VaultUtils:
 
             print()
         return 0
+
+    @staticmethod
+    def _process_media(args: dict[str, Any]) -> int:
+        """Show information about media attachments."""
+        vault_dirs = get_vault_paths(filter=args["vault"])
+        media_index = MediaIndex()
+        media_index.update(vault_dirs)
+        print(f"{media_index.num_attachments} attachments, {media_index.num_probed} probed.")
+
+        print("Audio duration per directory:")
+        for dir_path, duration in sorted(media_index.total_duration_by_dir().items()):
+            if any(dir_path.is_relative_to(vault_dir) for vault_dir in vault_dirs):
+                mins = round(duration / 60)
+                print(f"\t{mins // 60}h{mins % 60:02d}m {dir_path}")
+
+        min_size_mb: float = args["media"]
+        print(f"Attachments larger than {min_size_mb} MB:")
+        for info in media_index.oversized(min_size=int(min_size_mb * 1024 * 1024)):
+            if any(info.path.startswith(f"{vault_dir}/") for vault_dir in vault_dirs):
+                print(f"\t{round(info.size / 1024 / 1024, 1)} MB {info.path}")
+        return 0
@@ -0,0 +1,125 @@
+"""
+Streaming export of records (tasks, lessons, links) in machine-readable formats.
+
+Records are flat dictionaries written one by one as they are found, thus the first record
+reaches a consumer early and memory does not depend on the number of records.
+The first record is flushed immediately, the others in batches.
+
+Formats:
+* jsonl - one JSON object per line,
+* csv - a header made of the keys of the first record, then one row per record,
+* msgpack - a stream of maps; needs the optional `msgpack` package.
+"""
+
+from __future__ import annotations
+
+import csv
+import importlib
+import io
+import json
+import logging
+import os
+import pathlib
+import sys
+from collections.abc import Iterable
+from typing import IO, Any
+
+_logger = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "csv", "msgpack")
+
+Record = dict[str, str | int | bool | None]
+
+
+class RecordWriter:
+    """Writes records to a binary stream in one of FORMATS."""
+
+    FLUSH_EVERY = 100
+    """The number of records between flushes after the first record."""
+
+    def __init__(self, fmt: str, stream: IO[bytes] | None = None) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format `{fmt}`; use one of {', '.join(FORMATS)}.")
+        self.fmt = fmt
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.num_records = 0
+        self._csv_buffer = io.StringIO()
+        self._csv_writer = csv.writer(self._csv_buffer, lineterminator="\n")
+        self._csv_keys: list[str] = []
+        self._packer: Any = None
+        if fmt == "msgpack":
+            try:
+                msgpack = importlib.import_module("msgpack")
+            except ImportError as err:
+                raise RuntimeError(
+                    "Format `msgpack` needs the optional `msgpack` package: "
+                    "pip install 'dope[msgpack]'."
+                ) from err
+            self._packer = msgpack.Packer()
+
+    def write(self, record: Record) -> None:
+        """Write one record."""
+        match self.fmt:
+            case "jsonl":
+                data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf8")
+            case "csv":
+                if not self._csv_keys:
+                    self._csv_keys = list(record)
+                    self._csv_writer.writerow(self._csv_keys)
+                self._csv_writer.writerow([record.get(key) for key in self._csv_keys])
+                data = self._csv_buffer.getvalue().encode("utf8")
+                self._csv_buffer.seek(0)
+                self._csv_buffer.truncate()
+            case _:
+                data = self._packer.pack(record)
+        self.stream.write(data)
+        self.num_records += 1
+        if self.num_records % self.FLUSH_EVERY == 1:
+            self.stream.flush()
+
+    def write_all(self, records: Iterable[Record]) -> int:
+        """
+        Write all records as they are produced and return their number.
+
+        If the consumer exits early, e.g. `d -t --format jsonl | head -1`, the rest is dropped.
+        """
+        try:
+            for record in records:
+                self.write(record)
+            self.stream.flush()
+        except BrokenPipeError:
+            _logger.debug("The consumer exited after %d records.", self.num_records)
+            if self.stream is sys.stdout.buffer:
+                # Python flushes stdout at exit and would fail again.
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return self.num_records
+        _logger.debug("Exported %d records.", self.num_records)
+        return self.num_records
+
+
+def test_record_writer(tmp_path: pathlib.PosixPath) -> None:
+    """Check that records are written and the first one is flushed immediately."""
+    records: list[Record] = [
+        {"vault": "v", "note": "n, 1", "line": 1},
+        {"vault": "v", "note": 'n "2"', "line": None},
+    ]
+
+    path = tmp_path / "records.jsonl"
+    with open(path, "wb") as stream:
+        writer = RecordWriter("jsonl", stream)
+        writer.write(records[0])
+        assert path.read_bytes() == b'{"vault": "v", "note": "n, 1", "line": 1}\n'
+        assert writer.write_all(records[1:]) == 2
+    assert [json.loads(line) for line in path.read_text().splitlines()] == records
+
+    path = tmp_path / "records.csv"
+    with open(path, "wb") as stream:
+        RecordWriter("csv", stream).write_all(records)
+    assert path.read_text() == 'vault,note,line\nv,"n, 1",1\nv,"n ""2""",\n'
+
+    try:
+        RecordWriter("xml")
+    except ValueError:
+        pass
+    else:
+        assert False, "Unknown format is accepted"
@@ -0,0 +1,137 @@
+"""
+YAML frontmatter of notes, i.e. Obsidian properties.
+
+The frontmatter is a block between two `---` lines at the very start of a note. Only the
+subset of YAML that Obsidian writes is understood, thus no YAML package is needed:
+* `key: value`, where the value may be quoted,
+* `key: [a, "b, c"]`, a flow list,
+* `key:` followed by `  - a` items, a block list.
+Every value is returned as a list of strings; nested mappings are ignored.
+
+A block that is not closed within MAX_LINES lines is not frontmatter, the same as in Obsidian
+where it is plain text.
+"""
+
+from __future__ import annotations
+
+import logging
+import pathlib
+from collections.abc import Iterable
+
+_logger = logging.getLogger(__name__)
+
+DELIMITER = "---"
+MAX_LINES = 500
+"""Frontmatter longer than that is treated as text, so that a stray `---` costs little."""
+
+
+def is_delimiter(line: str) -> bool:
+    """Whether the line opens or closes frontmatter."""
+    return line.rstrip("\r\n") == DELIMITER
+
+
+def read_frontmatter(note_path: pathlib.PosixPath) -> list[str] | None:
+    """
+    Return lines of the note's frontmatter without delimiters and newlines; None if the note
+    has no frontmatter. Only the header of the note is read.
+    """
+    with open(note_path, "r", encoding="utf8") as note_fd:
+        if not is_delimiter(note_fd.readline()):
+            return None
+        lines: list[str] = []
+        while (note_line := note_fd.readline()) != "" and len(lines) < MAX_LINES:
+            if is_delimiter(note_line):
+                return lines
+            lines.append(note_line.rstrip("\r\n"))
+    return None
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value
+
+
+def _split_flow_list(value: str) -> list[str]:
+    """Split the inside of `[a, "b, c"]` by commas outside of quotes."""
+    items = []
+    quote = None
+    start = 0
+    for idx, char in enumerate(value):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == ",":
+            items.append(value[start:idx])
+            start = idx + 1
+    items.append(value[start:])
+    return [_unquote(item) for item in items if item.strip()]
+
+
+def parse_properties(lines: Iterable[str]) -> dict[str, list[str]]:
+    """Parse frontmatter lines into properties."""
+    properties: dict[str, list[str]] = {}
+    key = None
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if line[0] in " \t-":
+            if key is not None and stripped.startswith("-"):
+                if item := _unquote(stripped[1:]):
+                    properties[key].append(item)
+            continue  # Items of lists and nested mappings.
+        name, sep, value = line.partition(":")
+        if not sep:
+            key = None
+            _logger.debug("Not a property: '%s'.", line)
+            continue
+        key = name.strip()
+        value = value.strip()
+        if value.startswith("[") and value.endswith("]"):
+            properties[key] = _split_flow_list(value[1:-1])
+        elif value and value != "null":
+            properties[key] = [_unquote(value)]
+        else:
+            properties[key] = []
+    return properties
+
+
+def test_parse_properties() -> None:
+    """Check scalars, quotes, flow lists, and block lists."""
+    lines = [
+        "aliases: [One, 'Two, three', \"Four\"]",
+        "tags:",
+        "  - edu/rust",
+        "  - '#inbox'",
+        "created: 2024-01-02",
+        'status: "active"',
+        "# A comment.",
+        'related: "[[note|Note: 1]]"',
+        "empty:",
+        "nested:",
+        "  key: value",
+    ]
+    assert parse_properties(lines) == {
+        "aliases": ["One", "Two, three", "Four"],
+        "tags": ["edu/rust", "#inbox"],
+        "created": ["2024-01-02"],
+        "status": ["active"],
+        "related": ["[[note|Note: 1]]"],
+        "empty": [],
+        "nested": [],
+    }
+
+
+def test_read_frontmatter(tmp_path: pathlib.PosixPath) -> None:
+    """Check closed, unclosed, and missing frontmatter."""
+    note_path = tmp_path / "n.md"
+    note_path.write_text("---\r\nstatus: active\r\n---\r\ntext\n")
+    assert read_frontmatter(note_path) == ["status: active"]
+    note_path.write_text("---\nstatus: active\n")
+    assert read_frontmatter(note_path) is None
+    note_path.write_text("text\n---\n")
+    assert read_frontmatter(note_path) is None
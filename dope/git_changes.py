@@ -0,0 +1,301 @@
+"""
+Change detection with git for vaults that are git repositories.
+
+An index remembers a mark: the commit it was refreshed at and the paths that were uncommitted
+at that moment. Paths changed since the mark are those changed between the mark's commit and
+HEAD (`git diff --name-status`, renames included), those uncommitted now (`git status
+--porcelain`: modified, staged, untracked, or ignored), and those uncommitted at the mark,
+which may have been reverted since. Only these paths are examined; other files are not even
+stat'ed.
+
+If a vault is not a git repository, has no commits, or the mark's commit is gone, e.g. after
+a rebase, None is returned and callers fall back to walking the vault and comparing
+modification times.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import pathlib
+import subprocess as sp
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import Any, Protocol, TypeVar
+
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GitMark:
+    """The state of a vault at which an index was refreshed."""
+
+    commit: str
+    dirty: list[str]
+    """Paths relative to the vault that were not committed."""
+
+
+def marks_from_json(items: dict[str, list[Any]]) -> dict[str, GitMark]:
+    """Return marks by vaults from the `git` item of a cache, see marks_to_json()."""
+    return {vault: GitMark(*item) for vault, item in items.items()}
+
+
+def marks_to_json(marks: dict[str, GitMark]) -> dict[str, list[Any]]:
+    """Return marks by vaults as the `git` item of a cache."""
+    return {vault: [mark.commit, mark.dirty] for vault, mark in marks.items()}
+
+
+@dataclass
+class GitChanges:
+    """Paths relative to the vault that changed since a mark."""
+
+    changed: set[str]
+    """Files that were added or modified, including new names of renamed files."""
+    deleted: set[str]
+    """Files that no longer exist, including old names of renamed files."""
+
+
+@dataclass
+class NoteScan:
+    """Notes of a vault to look at when an index is refreshed."""
+
+    v_notes: Iterable[VNote]
+    """All notes of the vault, or only added and modified ones if `complete` is False."""
+    complete: bool
+    deleted: set[str]
+    """Paths of deleted notes if `complete` is False."""
+    mark: GitMark | None
+    """The mark to keep for the next scan; None if the vault is not a git repository."""
+
+
+def _git(vault_dir: pathlib.PosixPath, *args: str) -> bytes | None:
+    """Run git in the vault and return its output; None is returned if git fails."""
+    try:
+        result = sp.run(["git", "-C", str(vault_dir), *args], capture_output=True, check=False)
+    except FileNotFoundError:
+        return None
+    if result.returncode != 0:
+        _logger.debug("git %s: %s", " ".join(args), result.stderr.decode(errors="replace"))
+        return None
+    return result.stdout
+
+
+def git_mark(vault_dir: pathlib.PosixPath) -> GitMark | None:
+    """Return the current state of the vault; None if it is not a git repository with commits."""
+    if (head := _git(vault_dir, "rev-parse", "--verify", "-q", "HEAD")) is None:
+        return None
+    if (prefix := _git(vault_dir, "rev-parse", "--show-prefix")) is None:
+        return None
+    status = _git(
+        vault_dir,
+        "status",
+        "--porcelain=v1",
+        "-z",
+        "--untracked-files=all",
+        "--ignored=traditional",
+        "--",
+        ".",
+    )
+    if status is None:
+        return None
+    root_prefix = prefix.decode().strip()
+    dirty = set()
+    fields = iter(status.decode("utf8", errors="surrogateescape").split("\0"))
+    for field in fields:
+        if not field:
+            continue
+        paths = [field[3:]]
+        if field[0] in "RC":
+            paths.append(next(fields))  # The original path follows a rename or a copy.
+        for path in paths:
+            if path.startswith(root_prefix) and not path.endswith("/"):
+                dirty.add(path[len(root_prefix) :])
+    return GitMark(commit=head.decode().strip(), dirty=sorted(dirty))
+
+
+@functools.lru_cache(maxsize=64)
+def _diff(vault_dir: str, since: str, until: str) -> frozenset[str] | None:
+    """Return paths changed between two commits; the result never changes, thus it is cached."""
+    diff = _git(
+        pathlib.PosixPath(vault_dir),
+        "diff",
+        "--name-status",
+        "-z",
+        "-M",
+        "--relative",
+        "--no-ext-diff",
+        since,
+        until,
+        "--",
+        ".",
+    )
+    if diff is None:
+        return None
+    paths = set()
+    fields = iter(diff.decode("utf8", errors="surrogateescape").split("\0"))
+    for status in fields:
+        if not status:
+            continue
+        paths.add(next(fields))
+        if status[0] in "RC":
+            paths.add(next(fields))  # The new path follows the old one.
+    return frozenset(paths)
+
+
+def git_changes(
+    vault_dir: pathlib.PosixPath, mark: GitMark, current: GitMark | None = None
+) -> GitChanges | None:
+    """
+    Return paths changed since the mark; None if git cannot tell.
+
+    :param current: the current state of the vault if it is already known, see git_mark().
+    """
+    if current is None and (current := git_mark(vault_dir)) is None:
+        return None
+    paths = {*mark.dirty, *current.dirty}
+    if mark.commit != current.commit:
+        if (diff := _diff(str(vault_dir), mark.commit, current.commit)) is None:
+            _logger.info("Commit %s is gone from '%s'; walking the vault.", mark.commit, vault_dir)
+            return None
+        paths.update(diff)
+    changed = {path for path in paths if os.path.isfile(vault_dir / path)}
+    return GitChanges(changed=changed, deleted=paths - changed)
+
+
+def scan_notes(vault_dir: pathlib.PosixPath, mark: GitMark | None) -> NoteScan:
+    """Return notes to refresh an index that was refreshed at the mark."""
+    current = git_mark(vault_dir)
+    changes = None
+    if mark is not None and current is not None:
+        changes = git_changes(vault_dir, mark, current)
+    if changes is None:
+        return NoteScan(
+            v_notes=VNote.collect_iter([vault_dir], exclude_trash=True),
+            complete=True,
+            deleted=set(),
+            mark=current,
+        )
+    _logger.debug(
+        "%s: %d changed, %d deleted files.", vault_dir, len(changes.changed), len(changes.deleted)
+    )
+
+    def is_note(path: str) -> bool:
+        return path.endswith(".md") and ".trash" not in pathlib.PurePosixPath(path).parts
+
+    return NoteScan(
+        v_notes=[
+            VNote(vault_dir, vault_dir / path) for path in sorted(changes.changed) if is_note(path)
+        ],
+        complete=False,
+        deleted={str(vault_dir / path) for path in changes.deleted if is_note(path)},
+        mark=current,
+    )
+
+
+class CachedNote(Protocol):
+    """An entry of an index that is cached per note."""
+
+    # pylint: disable=too-few-public-methods
+
+    vault_dir: str
+    mtime_ns: int
+    size: int
+
+
+EntryT = TypeVar("EntryT", bound=CachedNote)
+
+
+def refresh_entries(
+    entries: dict[str, EntryT],
+    vault_dirs: list[pathlib.PosixPath],
+    git_marks: dict[str, GitMark],
+    read: Callable[[VNote, os.stat_result], EntryT],
+) -> tuple[dict[str, EntryT], int]:
+    """
+    Return entries of an index keyed by note paths refreshed for the vaults, and the number of
+    notes read; a note is read if it is new or its modification time or size changed.
+
+    Entries keep the walk order; with git, changed notes keep their places and new ones are
+    appended. Marks of the vaults are updated in place.
+    """
+    vaults = {str(vault_dir) for vault_dir in vault_dirs}
+    refreshed = {key: entry for key, entry in entries.items() if entry.vault_dir not in vaults}
+    num_read = 0
+    for vault_dir in vault_dirs:
+        scan = scan_notes(vault_dir, git_marks.get(str(vault_dir)))
+        if not scan.complete:
+            refreshed.update(
+                (key, entry)
+                for key, entry in entries.items()
+                if entry.vault_dir == str(vault_dir) and key not in scan.deleted
+            )
+        for v_note in scan.v_notes:
+            key = str(v_note.note_path)
+            stat = v_note.note_path.stat()
+            entry = entries.get(key)
+            if entry is None or (entry.mtime_ns, entry.size) != (stat.st_mtime_ns, stat.st_size):
+                entry = read(v_note, stat)
+                num_read += 1
+            refreshed[key] = entry
+        if scan.mark is None:
+            git_marks.pop(str(vault_dir), None)
+        else:
+            git_marks[str(vault_dir)] = scan.mark
+    return refreshed, num_read
+
+
+def git_files(vault_dir: pathlib.PosixPath) -> set[str] | None:
+    """Return paths of all files of the vault, tracked or not; None if it is not a repository."""
+    listed = _git(vault_dir, "ls-files", "-z", "--cached", "--others")
+    deleted = _git(vault_dir, "ls-files", "-z", "--deleted")
+    if listed is None or deleted is None:
+        return None
+    files = set(listed.decode("utf8", errors="surrogateescape").split("\0"))
+    files -= set(deleted.decode("utf8", errors="surrogateescape").split("\0"))
+    return {path for path in files if path and not path.endswith("/")}
+
+
+def test_git_changes(tmp_path: pathlib.PosixPath) -> None:
+    """Check committed, uncommitted, reverted, renamed, and deleted files, and fallbacks."""
+    vault_dir = tmp_path / "repo" / "vault"
+    vault_dir.mkdir(parents=True)
+    assert git_mark(vault_dir) is None
+
+    def git(*args: str) -> None:
+        assert _git(vault_dir, "-c", "user.name=t", "-c", "user.email=t@t", *args) is not None
+
+    assert _git(vault_dir.parent, "init", "-q") is not None
+    assert git_mark(vault_dir) is None  # No commits yet.
+    (vault_dir.parent / "outside.md").write_text("o\n")
+    for name in ("a.md", "b.md", "c.md"):
+        (vault_dir / name).write_text(f"{name}\n")
+    git("add", "-A")
+    git("commit", "-q", "-m", "1")
+    mark = git_mark(vault_dir)
+    assert mark is not None and not mark.dirty
+    assert git_files(vault_dir) == {"a.md", "b.md", "c.md"}
+
+    (vault_dir / "a.md").write_text("changed\n")
+    git("mv", "b.md", "d.md")
+    git("commit", "-q", "-a", "-m", "2")
+    (vault_dir / "c.md").write_text("uncommitted\n")
+    (vault_dir / "e.md").write_text("untracked\n")
+    (vault_dir.parent / "outside.md").write_text("changed\n")
+    changes = git_changes(vault_dir, mark)
+    assert changes == GitChanges(changed={"a.md", "c.md", "d.md", "e.md"}, deleted={"b.md"})
+
+    mark = git_mark(vault_dir)
+    assert mark is not None and mark.dirty == ["c.md", "e.md"]
+    git("checkout", "-q", "--", "c.md")  # Reverted, yet the index has seen the edit.
+    (vault_dir / "e.md").unlink()
+    assert git_changes(vault_dir, mark) == GitChanges(changed={"c.md"}, deleted={"e.md"})
+
+    scan = scan_notes(vault_dir, GitMark(commit="0" * 40, dirty=[]))
+    assert scan.complete  # The commit is gone.
+    scan = scan_notes(vault_dir, mark)
+    assert not scan.complete and scan.deleted == {str(vault_dir / "e.md")}
+    assert [v_note.note_path.name for v_note in scan.v_notes] == ["c.md"]
+    assert scan_notes(tmp_path, None).mark is None
@@ -1,10 +1,72 @@
-"""Contains HyperLink class."""
+"""
+Contains HyperLink class and the normalisation of URIs.
+
+URIs are decoded and split into a path, a section and a block once per distinct raw URI;
+results are memoised in a bounded LRU cache because vaults link to the same targets again
+and again.
+"""
 
 from __future__ import annotations
 
+import functools
+import urllib.parse
 from dataclasses import dataclass, field
 from typing import Any
 
+PARSE_CACHE_SIZE = 1 << 16
+"""The maximum number of parsed URIs kept in the cache."""
+
+_URI_UNSAFE = frozenset(' "#%()<>[\\]^`{|}')
+"""Characters that are percent-encoded in URIs of notes; all others are kept as they are."""
+
+
+@dataclass(frozen=True)
+class ParsedUri:
+    """A normalised URI."""
+
+    path: str
+    """Fully percent-decoded URI without the anchor."""
+    section: str | None = None
+    """Decoded heading, nested headings are joined with `#`, e.g. `Heading#Subheading`."""
+    block: str | None = None
+    """Block identifier without `^`."""
+
+    def encoded(self) -> str:
+        """Return the canonical raw URI: only unsafe characters are percent-encoded."""
+        anchors = self.section.split("#") if self.section is not None else []
+        anchors = [encode_uri(heading) for heading in anchors]
+        if self.block is not None:
+            anchors.append("^" + encode_uri(self.block))
+        return "#".join([encode_uri(self.path), *anchors])
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_uri(uri_raw: str) -> ParsedUri:
+    """
+    Split the raw URI into a path, a section and a block, e.g. `note.md#Heading#^id`.
+
+    The anchor is split off before decoding, thus an encoded `%23` stays in the path. Only the
+    last component of the anchor that starts with `^` is a block; a heading may contain `^`.
+    """
+    uri, sep, anchor = uri_raw.strip().partition("#")
+    path = urllib.parse.unquote(uri)
+    if not sep:
+        return ParsedUri(path=path)
+    anchors = anchor.split("#")
+    block = anchors.pop()[1:] if anchors[-1].startswith("^") else ""
+    return ParsedUri(
+        path=path,
+        section=urllib.parse.unquote("#".join(anchors)).rstrip("#") or None,
+        block=urllib.parse.unquote(block) or None,
+    )
+
+
+def encode_uri(path: str) -> str:
+    """Percent-encode unsafe characters of a decoded path; parse_uri() restores it."""
+    return "".join(
+        f"%{ord(char):02X}" if char in _URI_UNSAFE or ord(char) < 0x20 else char for char in path
+    )
+
 
 @dataclass()
 class HyperLink:
@@ -28,16 +90,14 @@ class HyperLink:
     """
     section: str | None = field(default=None)
     """
-    Optional section name referenced by the link.
+    Optional anchor referenced by the link as it appears in the note: a section or a block.
     """
 
     def __init__(self, name: str, uri_raw: str) -> None:
         self.name = name
         self.uri_raw = uri_raw.strip()
-        if "#" in uri_raw:
-            self.uri, self.section = self.uri_raw.split("#")
-        else:
-            self.uri = self.uri_raw
+        self.uri, sep, section = self.uri_raw.partition("#")
+        self.section = section if sep else None
 
     def __eq__(self, other: object) -> Any:
         assert isinstance(other, HyperLink)
@@ -52,6 +112,10 @@ class HyperLink:
             or self.uri.startswith("chrome")
         )
 
+    def parsed(self) -> ParsedUri:
+        """Return the normalised raw URI: decoded path, section and block."""
+        return parse_uri(self.uri_raw)
+
     def decoded(self) -> str:
         """
         Decode a percent-encoded URI
@@ -60,12 +124,12 @@ class HyperLink:
         Characters which are not allowed in URIs, but which are allowed in filenames,
         must be percent-encoded. For example, any of "{}`^ " and all control characters.
         """
-        uri_dec = str(self.uri)
-        uri_dec = uri_dec.replace("%20", " ")
-        uri_dec = uri_dec.replace("%28", "(")
-        uri_dec = uri_dec.replace("%29", ")")
-        uri_dec = uri_dec.replace("%40", "@")
-        return uri_dec
+        return parse_uri(self.uri).path
+
+    @staticmethod
+    def encode(uri: str) -> str:
+        """Percent-encode a URI so that decoded() restores it."""
+        return encode_uri(uri)
 
 
 def test_hyper_link_constructor() -> None:
@@ -87,6 +151,8 @@ def test_hyper_link_constructor() -> None:
     test_cases: list[TestCase] = [
         TestCase(name="name", uri_raw="uri", uri="uri", section=None),
         TestCase(name="name", uri_raw="uri#section", uri="uri", section="section"),
+        TestCase(name="name", uri_raw="uri#h1#h2", uri="uri", section="h1#h2"),
+        TestCase(name="name", uri_raw="#^block", uri="", section="^block"),
     ]
 
     for test_case in test_cases:
@@ -95,3 +161,21 @@ def test_hyper_link_constructor() -> None:
         assert hyper_link.uri_raw == test_case.uri_raw
         assert hyper_link.uri == test_case.uri
         assert hyper_link.section == test_case.section
+
+
+def test_parse_uri() -> None:
+    """Check decoding, anchors and the round trip of encoding."""
+    assert parse_uri("a%20b%2Ec%23d.md") == ParsedUri(path="a b.c#d.md")
+    assert parse_uri("n.md#My%20Heading") == ParsedUri(path="n.md", section="My Heading")
+    assert parse_uri("n#H1#H2") == ParsedUri(path="n", section="H1#H2")
+    assert parse_uri("n#^id1") == ParsedUri(path="n", block="id1")
+    assert parse_uri("n#H1#^id1") == ParsedUri(path="n", section="H1", block="id1")
+    assert parse_uri("#") == ParsedUri(path="")
+    assert parse_uri("n#C^2 formula") == ParsedUri(path="n", section="C^2 formula")
+    assert parse_uri("n#C%5E2#^id1") == ParsedUri(path="n", section="C^2", block="id1")
+    assert parse_uri("n#C^2#H2") == ParsedUri(path="n", section="C^2#H2")
+    path = "a (b) [c] ^d 100% `e`.md"
+    assert parse_uri(encode_uri(path)).path == path
+    assert parse_uri("a%2Eb c.md#H%201#^id").encoded() == "a.b%20c.md#H%201#^id"
+    assert HyperLink("x", "a%20(b)%40c.md#s").decoded() == "a (b)@c.md"
+    assert parse_uri("n#^id1") is parse_uri("n#^id1")
@@ -0,0 +1,186 @@
+"""
+Instrumentation of dope's phases: named, nested spans with timings and counters.
+
+Instrumentation is disabled by default and then costs almost nothing.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import pathlib
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import AbstractContextManager
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+_T = TypeVar("_T")
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+@dataclass
+class SpanStats:
+    """Accumulated statistics of a span."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    counters: dict[str, int] = field(default_factory=dict)
+    """E.g. "notes", "lines", "bytes"."""
+
+    def add_counters(self, counters: dict[str, int]) -> None:
+        """Add values to the counters."""
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class Instrument:
+    """
+    A namespace for functions that measure time spent in named spans.
+
+    Spans are nested, thus statistics are kept per stack of span names, e.g. ("tasks", "walk").
+    """
+
+    _enabled = False
+    _stack: list[str] = []
+    _stats: dict[tuple[str, ...], SpanStats] = {}
+
+    @classmethod
+    def enable(cls) -> None:
+        """Start collecting statistics."""
+        cls._enabled = True
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        """Whether or not statistics are being collected."""
+        return cls._enabled
+
+    @classmethod
+    def reset(cls) -> None:
+        """Disable instrumentation and drop all statistics."""
+        cls._enabled = False
+        cls._stack.clear()
+        cls._stats.clear()
+
+    @classmethod
+    def span(cls, name: str, **counters: int) -> AbstractContextManager[None]:
+        """Measure the time spent in the with-block; counters are added to the span."""
+        if not cls._enabled:
+            return _NULL_CONTEXT
+        return cls._span(name, counters)
+
+    @classmethod
+    @contextlib.contextmanager
+    def _span(cls, name: str, counters: dict[str, int]) -> Iterator[None]:
+        cls._stack.append(name)
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = cls._stats.setdefault(tuple(cls._stack), SpanStats())
+            stats.calls += 1
+            stats.seconds += time.perf_counter() - t_start
+            stats.add_counters(counters)
+            cls._stack.pop()
+
+    @classmethod
+    def count(cls, **counters: int) -> None:
+        """Add values to the counters of the current span."""
+        if cls._enabled and cls._stack:
+            cls._stats.setdefault(tuple(cls._stack), SpanStats()).add_counters(counters)
+
+    @classmethod
+    def timed_iter(cls, name: str, iterable: Iterable[_T], unit: str) -> Iterator[_T]:
+        """
+        Measure the time spent in producing items, i.e. in the iterator, not in the consumer.
+
+        Every item is counted as one `unit`, e.g. "notes".
+        """
+        if not cls._enabled:
+            return iter(iterable)
+        return cls._timed_iter(name, iter(iterable), unit)
+
+    @classmethod
+    def _timed_iter(cls, name: str, iterator: Iterator[_T], unit: str) -> Iterator[_T]:
+        first = True
+        while True:
+            cls._stack.append(name)
+            stats = cls._stats.setdefault(tuple(cls._stack), SpanStats())
+            if first:
+                stats.calls += 1
+                first = False
+            t_start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stats.seconds += time.perf_counter() - t_start
+                cls._stack.pop()
+            stats.counters[unit] = stats.counters.get(unit, 0) + 1
+            yield item
+
+    @classmethod
+    def report(cls) -> list[str]:
+        """Return the phase breakdown as human-readable lines."""
+        lines = [f"{'phase':40} {'time, s':>9} {'calls':>8}  throughput"]
+        for path in sorted(cls._stats):
+            stats = cls._stats[path]
+            name = "  " * (len(path) - 1) + path[-1]
+            throughput = []
+            if stats.seconds > 0:
+                for counter, unit, scale in (
+                    ("notes", "notes/s", 1),
+                    ("lines", "lines/s", 1),
+                    ("bytes", "MB/s", 1e6),
+                ):
+                    if counter in stats.counters:
+                        rate = stats.counters[counter] / scale / stats.seconds
+                        throughput.append(f"{rate:,.1f} {unit}")
+            counters = ", ".join(f"{value:,} {name}" for name, value in stats.counters.items())
+            lines.append(
+                f"{name:40} {stats.seconds:9.3f} {stats.calls:8}  "
+                + "; ".join(throughput)
+                + (f" ({counters})" if counters else "")
+            )
+        return lines
+
+    @classmethod
+    def write_collapsed(cls, path: pathlib.Path) -> None:
+        """
+        Write self times of spans in microseconds as collapsed stacks.
+
+        Every line looks like `tasks;walk 12345`; flamegraph tools accept this format.
+        """
+        with open(path, "w", encoding="utf8") as fp:
+            for stack, stats in sorted(cls._stats.items()):
+                children = sum(
+                    child.seconds
+                    for child_stack, child in cls._stats.items()
+                    if len(child_stack) == len(stack) + 1 and child_stack[:-1] == stack
+                )
+                self_us = round(max(stats.seconds - children, 0.0) * 1e6)
+                fp.write(f"{';'.join(stack)} {self_us}\n")
+
+
+def test_instrument(tmp_path: pathlib.Path) -> None:
+    """Check spans, timed iterators and collapsed stacks."""
+    try:
+        assert Instrument.span("disabled") is _NULL_CONTEXT
+        Instrument.enable()
+        with Instrument.span("cli"):
+            for _ in Instrument.timed_iter("walk", range(3), unit="notes"):
+                with Instrument.span("parse", lines=10):
+                    Instrument.count(bytes=100)
+        assert Instrument._stats[("cli", "walk")].calls == 1
+        assert Instrument._stats[("cli", "walk")].counters == {"notes": 3}
+        assert Instrument._stats[("cli", "parse")].calls == 3
+        assert Instrument._stats[("cli", "parse")].counters == {"lines": 30, "bytes": 300}
+        assert len(Instrument.report()) == 4
+
+        collapsed = tmp_path / "dope.folded"
+        Instrument.write_collapsed(collapsed)
+        stacks = [line.rsplit(" ", 1)[0] for line in collapsed.read_text().splitlines()]
+        assert stacks == ["cli", "cli;parse", "cli;walk"]
+    finally:
+        Instrument.reset()
@@ -0,0 +1,275 @@
+"""
+Backlink index: which notes link to which files.
+
+Links of every note are resolved to paths relative to the vault, the same way
+`_check_v_link_validity` resolves them; the results are cached together with the note's
+modification time and size, thus only changed notes are read again.
+A link without an extension may point to a note, so both `path` and `path.md` are indexed.
+Links in properties, e.g. `related: "[[note]]"`, are indexed too.
+
+The same scan collects anchors of every note: headings, slugged the way Obsidian matches
+them, and `^block-id` markers; links to sections and blocks are checked against them with set
+lookups, see LinkIndex.has_anchor().
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.git_changes import GitMark, marks_from_json, marks_to_json, refresh_entries
+from dope.hyper_link import HyperLink, ParsedUri
+from dope.markdown_link import MarkdownLink
+from dope.name_index import name_key
+from dope.v_note import VNote
+from dope.wiki_link import WikiLink
+
+_logger = logging.getLogger(__name__)
+
+_NOT_FILES = ("broken:", "evernote:", "file:")
+_RE_HEADING = re.compile(r"#{1,6}\s+(.*?)(?:\s+#+)?\s*$")
+_RE_BLOCK = re.compile(r"(?:^|\s)\^([\w-]+)\s*$")
+_RE_SLUG_SEPARATORS = re.compile(r"[#^|:%\\\[\]]")
+
+
+def heading_slug(heading: str) -> str:
+    """
+    Return the form of a heading that links are matched against.
+
+    Obsidian drops `#^|:%\\[]` from links to headings and ignores case and repeated spaces.
+    """
+    return " ".join(_RE_SLUG_SEPARATORS.sub(" ", heading).split()).lower()
+
+
+def anchors_of_line(line: str) -> tuple[str | None, str | None]:
+    """Return the heading slug and the block identifier defined by the line, if any."""
+    heading = block = None
+    if line.startswith("#") and (mtch := _RE_HEADING.match(line)) is not None:
+        heading = heading_slug(mtch[1])
+    if "^" in line and (mtch := _RE_BLOCK.search(line)) is not None:
+        block = mtch[1]
+    return heading, block
+
+
+def link_target_rpath(note_rpath: str, hyper_link: HyperLink) -> str | None:
+    """
+    Return the path of the link's target relative to the vault as it is written in the link,
+    i.e. `.md` may be omitted; None is returned for external links and links outside the vault.
+    """
+    if hyper_link.is_external() or hyper_link.uri.startswith(_NOT_FILES):
+        return None
+    uri = hyper_link.decoded()
+    if not uri:
+        return None  # A link to a section of the same note.
+    if uri.startswith(("./", "../")):
+        uri = os.path.join(os.path.dirname(note_rpath), uri)
+    rpath = os.path.normpath(uri)
+    if rpath.startswith("..") or os.path.isabs(rpath):
+        return None
+    return rpath
+
+
+def links_iter(line: str) -> Iterable[HyperLink]:
+    """Yield markdown and wiki links of the line."""
+    if "[" not in line:
+        return
+    yield from MarkdownLink.collect_iter(line=line)
+    yield from WikiLink.collect_iter(line=line)
+
+
+@dataclass
+class _NoteEntry:
+    vault_dir: str
+    mtime_ns: int
+    size: int
+    targets: list[str]
+    """Paths of linked files relative to the vault, `.md` may be omitted."""
+    headings: list[str]
+    """Slugs of headings, see heading_slug()."""
+    blocks: list[str]
+    """Block identifiers without `^`."""
+
+
+class LinkIndex:
+    """Cached link targets and anchors of all notes and backlinks built from them."""
+
+    CACHE_VERSION = 3
+
+    def __init__(self, cache_path: pathlib.PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "link_index.json"
+        self.entries: dict[str, _NoteEntry] = {}
+        self.num_read = 0
+        """The number of notes read by the last update."""
+        self.git_marks: dict[str, GitMark] = {}
+        """States of vaults that are git repositories at the last update, see dope.git_changes."""
+        self._backlinks: dict[tuple[str, str], set[str]] | None = None
+        self._name_backlinks: dict[tuple[str, str], set[str]] | None = None
+        self._anchors: dict[str, tuple[frozenset[str], frozenset[str]]] = {}
+        self._load()
+
+    def update(self, vault_dirs: Iterable[pathlib.PosixPath]) -> None:
+        """Read new and changed notes of the vaults, forget deleted ones."""
+        self.entries, self.num_read = refresh_entries(
+            self.entries, list(vault_dirs), self.git_marks, self._read_note
+        )
+        self._backlinks = None
+        self._name_backlinks = None
+        self._anchors = {}
+        _logger.debug("%d notes, %d read.", len(self.entries), self.num_read)
+        self._save()
+
+    @staticmethod
+    def _read_note(v_note: VNote, stat: os.stat_result) -> _NoteEntry:
+        """Collect link targets and anchors of the note in one pass, then links of properties."""
+        note_rpath = str(v_note.note_path.relative_to(v_note.vault_dir))
+        targets: set[str] = set()
+        headings: set[str] = set()
+        blocks: set[str] = set()
+        for _, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+            for hyper_link in links_iter(note_line):
+                if (target := link_target_rpath(note_rpath, hyper_link)) is not None:
+                    targets.add(target)
+            heading, block = anchors_of_line(note_line)
+            if heading is not None:
+                headings.add(heading)
+            if block is not None:
+                blocks.add(block)
+        for values in v_note.properties().values():
+            for value in values:
+                for hyper_link in links_iter(value):  # E.g. `related: "[[note]]"`.
+                    if (target := link_target_rpath(note_rpath, hyper_link)) is not None:
+                        targets.add(target)
+        return _NoteEntry(
+            vault_dir=str(v_note.vault_dir),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            targets=sorted(targets),
+            headings=sorted(headings),
+            blocks=sorted(blocks),
+        )
+
+    def has_anchor(self, note_path: pathlib.PosixPath, parsed_uri: ParsedUri) -> bool | None:
+        """
+        Whether the note defines the section and the block of the URI.
+
+        Nested headings like `H1#H2` must all exist. None is returned if the note is not indexed.
+        """
+        key = str(note_path)
+        if (anchors := self._anchors.get(key)) is None:
+            if (entry := self.entries.get(key)) is None:
+                return None
+            anchors = self._anchors[key] = (frozenset(entry.headings), frozenset(entry.blocks))
+        headings, blocks = anchors
+        if parsed_uri.section is not None and any(
+            heading_slug(heading) not in headings for heading in parsed_uri.section.split("#")
+        ):
+            return False
+        return parsed_uri.block is None or parsed_uri.block in blocks
+
+    def backlinks(self, vault_dir: pathlib.PosixPath, target: pathlib.PosixPath) -> list[VNote]:
+        """Return notes of the vault that link to the target file."""
+        if self._backlinks is None:
+            self._backlinks = {}
+            for key, entry in self.entries.items():
+                for rpath in entry.targets:
+                    for linked in (rpath, rpath + ".md"):
+                        self._backlinks.setdefault((entry.vault_dir, linked), set()).add(key)
+        rpath = str(target.relative_to(vault_dir))
+        return [
+            VNote(vault_dir, pathlib.PosixPath(key))
+            for key in sorted(self._backlinks.get((str(vault_dir), rpath), ()))
+        ]
+
+    def name_backlinks(
+        self, vault_dir: pathlib.PosixPath, target: pathlib.PosixPath
+    ) -> list[VNote]:
+        """
+        Return notes of the vault that link to any file with the name of the target, which
+        includes wiki links resolved by name, see dope.name_index.
+        """
+        if self._name_backlinks is None:
+            self._name_backlinks = {}
+            for key, entry in self.entries.items():
+                for rpath in entry.targets:
+                    self._name_backlinks.setdefault((entry.vault_dir, name_key(rpath)), set()).add(
+                        key
+                    )
+        return [
+            VNote(vault_dir, pathlib.PosixPath(key))
+            for key in sorted(self._name_backlinks.get((str(vault_dir), name_key(target.name)), ()))
+        ]
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path, self.CACHE_VERSION, "Link index cache has an old format; rebuilding."
+        )
+        if cache is None:
+            return
+        self.entries = {key: _NoteEntry(**item) for key, item in cache["entries"].items()}
+        self.git_marks = marks_from_json(cache.get("git", {}))
+
+    def _save(self) -> None:
+        cache = {
+            "entries": {key: entry.__dict__ for key, entry in self.entries.items()},
+            "git": marks_to_json(self.git_marks),
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def test_link_target_rpath() -> None:
+    """Check resolution of absolute and relative links."""
+    note_rpath = "a/b/note.md"
+    assert link_target_rpath(note_rpath, MarkdownLink("x", "c/d%20e.md#part")) == "c/d e.md"
+    assert link_target_rpath(note_rpath, MarkdownLink("x", "./res/i.png")) == "a/b/res/i.png"
+    assert link_target_rpath(note_rpath, WikiLink("x", "../c")) == "a/c"
+    assert link_target_rpath(note_rpath, MarkdownLink("x", "../../../c.md")) is None
+    assert link_target_rpath(note_rpath, MarkdownLink("x", "https://x.org")) is None
+    assert link_target_rpath(note_rpath, MarkdownLink("x", "#part")) is None
+
+
+def test_anchors_of_line() -> None:
+    """Check headings and block markers."""
+    assert anchors_of_line("## My: [Big]  Heading ##") == ("my big heading", None)
+    assert anchors_of_line("#tag is not a heading") == (None, None)
+    assert anchors_of_line("A paragraph. ^par-1") == (None, "par-1")
+    assert anchors_of_line("^table") == (None, "table")
+    assert anchors_of_line("2^10 is 1024") == (None, None)
+    assert heading_slug("my big heading") == heading_slug("My: Big Heading")
+
+
+def test_link_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check backlinks and incremental updates."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "dir" / "res").mkdir(parents=True)
+    (vault_dir / "dir" / "a.md").write_text("[[dir/b]] ![i](./res/i.png)\n```\n[[c]]\n```\n")
+    (vault_dir / "dir" / "b.md").write_text("# Part 1\n[a](../dir/a.md) ^x\n")
+    index = LinkIndex(cache_path=tmp_path / "link_index.json")
+    index.update([vault_dir])
+
+    def backlinks(rpath: str) -> list[str]:
+        return [v_note.note_path.name for v_note in index.backlinks(vault_dir, vault_dir / rpath)]
+
+    assert backlinks("dir/b.md") == ["a.md"]
+    assert index.has_anchor(vault_dir / "dir" / "b.md", ParsedUri(path="", section="Part 1"))
+    assert index.has_anchor(vault_dir / "dir" / "b.md", ParsedUri(path="", block="x"))
+    assert not index.has_anchor(vault_dir / "dir" / "b.md", ParsedUri(path="", section="Part 2"))
+    assert index.has_anchor(vault_dir / "dir" / "res" / "i.png", ParsedUri(path="")) is None
+    assert backlinks("dir/a.md") == ["b.md"]
+    assert backlinks("dir/res/i.png") == ["a.md"]
+    assert not backlinks("c.md")
+    assert [
+        v_note.note_path.name for v_note in index.name_backlinks(vault_dir, vault_dir / "B.md")
+    ] == ["a.md"]
+
+    index = LinkIndex(cache_path=tmp_path / "link_index.json")
+    index.update([vault_dir])
+    assert index.num_read == 0
+    (vault_dir / "dir" / "b.md").write_text("nothing\n")
+    index.update([vault_dir])
+    assert index.num_read == 1
+    assert not backlinks("dir/a.md")
@@ -0,0 +1,232 @@
+"""
+Index of media attachments in vaults.
+
+Attachments live in `res` directories next to the notes that reference them.
+Every attachment is probed once; its metadata is cached and keyed by path, mtime and size,
+so unchanged files are never probed again, unless ffprobe failed or was missing.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import subprocess as sp
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+
+_logger = logging.getLogger(__name__)
+
+AUDIO_SUFFIXES = frozenset({".mp3", ".m4a", ".ogg", ".wav", ".flac"})
+VIDEO_SUFFIXES = frozenset({".mp4", ".mkv", ".webm", ".mov"})
+IMAGE_SUFFIXES = frozenset({".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".bmp"})
+
+
+def attachments_iter(vault_dir: pathlib.PosixPath) -> Iterable[pathlib.PosixPath]:
+    """Yield files of all `res` directories of the vault."""
+    for dir_path, dir_names, file_names in os.walk(vault_dir):
+        dir_names[:] = [name for name in dir_names if name not in {".git", ".trash"}]
+        if pathlib.PosixPath(dir_path).name == "res":
+            for file_name in file_names:
+                yield pathlib.PosixPath(dir_path) / file_name
+
+
+@dataclass
+class MediaInfo:
+    """Metadata of one attachment."""
+
+    path: str
+    """Absolute path of the attachment."""
+    mtime_ns: int
+    size: int
+    """Size in bytes."""
+    kind: str
+    """One of "audio", "video", "image", "other"."""
+    format: str | None = None
+    """Container format reported by ffprobe, or the suffix when the file is not probed."""
+    duration: float | None = None
+    """Duration in seconds of audio and video files."""
+    retry: bool = False
+    """Whether ffprobe failed or is not installed, thus the file is probed again next time."""
+
+    @property
+    def owner_dir(self) -> pathlib.PosixPath:
+        """The directory whose notes own the attachment, i.e. the parent of `res`."""
+        return pathlib.PosixPath(self.path).parent.parent
+
+
+class MediaIndex:
+    """Cached metadata of all attachments in `res` directories of vaults."""
+
+    CACHE_VERSION = 2
+
+    def __init__(self, cache_path: pathlib.PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "media_index.json"
+        self.entries: dict[str, MediaInfo] = {}
+        """Attachments of all vaults updated so far."""
+        self.num_attachments = 0
+        """The number of attachments in the vaults of the last update."""
+        self.num_probed = 0
+        """The number of files probed by the last update."""
+        self._load()
+
+    def update(self, vault_dirs: Iterable[pathlib.PosixPath], max_workers: int = 8) -> None:
+        """
+        Walk through `res` directories of the vaults and probe new or changed attachments.
+
+        Entries of files that no longer exist in these vaults are dropped.
+        """
+        vault_dirs = list(vault_dirs)
+        seen: set[str] = set()
+        to_probe: list[MediaInfo] = []
+        for vault_dir in vault_dirs:
+            for path in attachments_iter(vault_dir):
+                stat = path.stat()
+                key = str(path)
+                seen.add(key)
+                entry = self.entries.get(key)
+                if (
+                    entry
+                    and entry.mtime_ns == stat.st_mtime_ns
+                    and entry.size == stat.st_size
+                    and not entry.retry
+                ):
+                    continue
+                to_probe.append(
+                    MediaInfo(
+                        path=key,
+                        mtime_ns=stat.st_mtime_ns,
+                        size=stat.st_size,
+                        kind=self._get_kind(path),
+                    )
+                )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for info in executor.map(self._probe, to_probe):
+                self.entries[info.path] = info
+        self.num_attachments = len(seen)
+        self.num_probed = len(to_probe)
+
+        for key in list(self.entries):
+            in_vaults = any(key.startswith(f"{vault_dir}/") for vault_dir in vault_dirs)
+            if in_vaults and key not in seen:
+                del self.entries[key]
+        _logger.debug("%d attachments, %d probed.", len(seen), self.num_probed)
+        self._save()
+
+    def total_duration_by_dir(self, kind: str = "audio") -> dict[pathlib.PosixPath, float]:
+        """
+        Return the total duration of attachments of the given kind per owner directory.
+
+        In my vaults every course has its own directory, thus this is the duration per course.
+        """
+        totals: dict[pathlib.PosixPath, float] = {}
+        for info in self.entries.values():
+            if info.kind == kind and info.duration is not None:
+                totals[info.owner_dir] = totals.get(info.owner_dir, 0.0) + info.duration
+        return totals
+
+    def oversized(self, min_size: int) -> list[MediaInfo]:
+        """Return attachments of at least min_size bytes, largest first."""
+        return sorted(
+            (info for info in self.entries.values() if info.size >= min_size),
+            key=lambda info: info.size,
+            reverse=True,
+        )
+
+    @staticmethod
+    def _get_kind(path: pathlib.PosixPath) -> str:
+        suffix = path.suffix.lower()
+        if suffix in AUDIO_SUFFIXES:
+            return "audio"
+        if suffix in VIDEO_SUFFIXES:
+            return "video"
+        if suffix in IMAGE_SUFFIXES:
+            return "image"
+        return "other"
+
+    @staticmethod
+    def _probe(info: MediaInfo) -> MediaInfo:
+        """Fill in format and duration; only audio and video files are probed with ffprobe."""
+        info.format = pathlib.PosixPath(info.path).suffix.lower().lstrip(".") or None
+        if info.kind not in {"audio", "video"}:
+            return info
+        try:
+            proc = sp.run(
+                [
+                    "ffprobe",
+                    "-v",
+                    "error",
+                    "-show_entries",
+                    "format=format_name,duration",
+                    "-of",
+                    "json",
+                    info.path,
+                ],
+                shell=False,
+                check=False,
+                text=True,
+                capture_output=True,
+            )
+        except FileNotFoundError:
+            _logger.warning("ffprobe is not installed; durations are unknown.")
+            info.retry = True
+            return info
+        if proc.returncode:
+            _logger.warning("ffprobe failed for '%s': %s", info.path, proc.stderr.strip())
+            info.retry = True
+            return info
+        fmt = json.loads(proc.stdout).get("format", {})
+        info.format = fmt.get("format_name", info.format)
+        if (duration := fmt.get("duration")) is not None:
+            info.duration = float(duration)
+        return info
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path, self.CACHE_VERSION, "Media index cache has an old format; rebuilding."
+        )
+        if cache is None:
+            return
+        self.entries = {item["path"]: MediaInfo(**item) for item in cache["entries"]}
+
+    def _save(self) -> None:
+        cache = {
+            "entries": [dataclasses.asdict(info) for info in self.entries.values()],
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def test_media_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check that unchanged attachments are not probed again unless probing failed."""
+    vault_dir = tmp_path / "vault"
+    res_dir = vault_dir / "course" / "res"
+    res_dir.mkdir(parents=True)
+    (res_dir / "image.png").write_bytes(b"0" * 100)
+    (res_dir / "lecture.mp3").write_bytes(b"0" * 10)  # Not MP3, thus ffprobe always fails.
+    (vault_dir / "course" / "note.md").write_text("")
+    cache_path = tmp_path / "media_index.json"
+
+    index = MediaIndex(cache_path=cache_path)
+    index.update([vault_dir])
+    assert (index.num_attachments, index.num_probed) == (2, 2)
+    assert index.entries[str(res_dir / "lecture.mp3")].retry
+    assert [pathlib.PosixPath(info.path).name for info in index.oversized(50)] == ["image.png"]
+    assert index.entries[str(res_dir / "image.png")].kind == "image"
+
+    index = MediaIndex(cache_path=cache_path)
+    index.update([vault_dir])
+    assert index.num_probed == 1
+    index.update([tmp_path / "other"])
+    assert (index.num_attachments, len(index.entries)) == (0, 2)
+
+    (res_dir / "image.png").write_bytes(b"0" * 200)
+    (res_dir / "lecture.mp3").unlink()
+    index.update([vault_dir])
+    assert index.num_probed == 1  # The image only.
+    assert list(index.entries) == [str(res_dir / "image.png")]
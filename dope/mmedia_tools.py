@@ -1,8 +1,18 @@
 """Utils for creating MP3 and MP4 files."""
 
+import csv
 import logging
+import os
 import pathlib
 import subprocess as sp
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+
+SEGMENTS_CACHE_VERSION = 1
 
 
 def extract_mp3_segment(
@@ -89,6 +99,210 @@ def extract_mp3_segment(
         logger.info("ffmpeg returned 0, '%s' is ready.", output_file.name)
 
 
+@dataclass(frozen=True)
+class Mp3Segment:
+    """A segment of an MP3 file to be extracted into its own file."""
+
+    time_from: str | int
+    """Start time of the segment, see extract_mp3_segment()."""
+    time_to: str | int
+    """End time of the segment, see extract_mp3_segment()."""
+    output_file: pathlib.PosixPath
+
+
+@dataclass(frozen=True)
+class Mp3SegmentResult:
+    """The outcome of extracting one segment in a batch."""
+
+    segment: Mp3Segment
+    output_file: pathlib.PosixPath
+    """The output file with the .mp3 suffix."""
+    skipped: bool
+    """True if the output file was already up to date."""
+    elapsed: float
+    """Time spent on the segment, in seconds."""
+
+
+def read_mp3_segments_csv(csv_file: pathlib.PosixPath) -> list[Mp3Segment]:
+    """
+    Read a list of segments from a CSV file.
+
+    Every row is `from,to,output`, e.g. `03:51:21,03:58:00,lesson-01.mp3`.
+    Relative output paths are relative to the CSV file's directory.
+    Empty rows and rows starting with '#' are ignored.
+    """
+    segments: list[Mp3Segment] = []
+    with open(csv_file, "r", encoding="utf8", newline="") as csv_fd:
+        for row in csv.reader(csv_fd):
+            if not row or row[0].strip().startswith("#"):
+                continue
+            if len(row) != 3:
+                raise ValueError(f"'{csv_file.name}': expected 3 columns, got {row}.")
+            time_from, time_to, output = (cell.strip() for cell in row)
+            output_file = pathlib.PosixPath(output)
+            if not output_file.is_absolute():
+                output_file = csv_file.parent / output_file
+            segments.append(Mp3Segment(time_from, time_to, output_file))
+    return segments
+
+
+def extract_mp3_segments(
+    input_file: pathlib.PosixPath,
+    segments: list[Mp3Segment],
+    max_workers: int = 4,
+    cache_path: pathlib.PosixPath | None = None,
+) -> list[Mp3SegmentResult]:
+    """
+    Extract many segments from an MP3 file.
+
+    All segments are validated before any ffmpeg process is started.
+    Every extracted output is recorded together with the input file, its modification time and
+    the times of the segment; an output is up to date and skipped if it is unchanged since and
+    its segment is the same. The rest is extracted by a bounded pool of ffmpeg processes; every
+    process seeks in the input file instead of reading it from the beginning and writes
+    a temporary file that replaces the output only when ffmpeg succeeds.
+
+    :param max_workers: The maximal number of ffmpeg processes running at the same time.
+    :param cache_path: The record of extracted outputs, in the user cache directory by default.
+    :return: Results in the order of the segments.
+    """
+    logger = logging.getLogger(__name__)
+    assert input_file.exists(), f"'{input_file}' is not found"
+    assert input_file.is_file(), f"'{input_file}' is not a file"
+    assert input_file.suffix == ".mp3", f"'{input_file}' is not MP3"
+    assert max_workers > 0
+
+    # Validate the whole batch up front.
+    jobs: list[tuple[Mp3Segment, pathlib.PosixPath, int, int]] = []
+    outputs: set[pathlib.PosixPath] = set()
+    for segment in segments:
+        seconds_from = _get_time_seconds(segment.time_from)
+        seconds_to = _get_time_seconds(segment.time_to)
+        if seconds_from >= seconds_to:
+            raise ValueError(f"Segment {segment} ends before it starts.")
+        output_file = segment.output_file
+        if output_file.suffix != ".mp3":
+            output_file = output_file.with_suffix(".mp3")
+        if output_file in outputs:
+            raise ValueError(f"'{output_file}' is the output of more than one segment.")
+        outputs.add(output_file)
+        jobs.append((segment, output_file, seconds_from, seconds_to))
+
+    cache_path = cache_path or get_cache_dir() / "mp3_segments.json"
+    records = _load_segment_records(cache_path)
+    input_mtime_ns = input_file.stat().st_mtime_ns
+
+    def run(job: tuple[Mp3Segment, pathlib.PosixPath, int, int]) -> Mp3SegmentResult:
+        segment, output_file, seconds_from, seconds_to = job
+        t_start = time.perf_counter()
+        params = [str(input_file), input_mtime_ns, seconds_from, seconds_to]
+        if _is_up_to_date(records.get(str(output_file)), params, output_file):
+            return Mp3SegmentResult(segment, output_file, True, time.perf_counter() - t_start)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        # A partial output of a failed or interrupted ffmpeg never takes the output's name.
+        tmp_file = output_file.with_name(f".{output_file.name}.tmp")
+        try:
+            proc: sp.CompletedProcess[str] = sp.run(
+                [
+                    "ffmpeg",
+                    "-y",  # overwrite
+                    "-ss",  # Seeking in the input is much faster than decoding up to the start.
+                    _format_time(seconds_from),
+                    "-i",
+                    str(input_file),
+                    "-t",
+                    _format_time(seconds_to - seconds_from),
+                    "-acodec",
+                    "copy",
+                    "-f",  # The temporary file has no .mp3 suffix to guess the format from.
+                    "mp3",
+                    str(tmp_file),
+                ],
+                shell=False,
+                check=False,
+                text=True,
+                stdout=sp.PIPE,
+                stderr=sp.PIPE,
+            )
+            if proc.returncode:
+                logger.warning("ffmpeg returned %d for '%s'", proc.returncode, output_file.name)
+                for line in proc.stderr.splitlines():
+                    logger.info("stderr: %s", line)
+                proc.check_returncode()
+            os.replace(tmp_file, output_file)
+        finally:
+            tmp_file.unlink(missing_ok=True)
+        records[str(output_file)] = [*params, output_file.stat().st_mtime_ns]
+        return Mp3SegmentResult(segment, output_file, False, time.perf_counter() - t_start)
+
+    t_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(run, jobs))
+    finally:
+        _save_segment_records(cache_path, records)  # Keep the outputs extracted before a failure.
+    for result in results:
+        logger.info(
+            "%s: %s in %.2f s",
+            result.output_file.name,
+            "up to date" if result.skipped else "extracted",
+            result.elapsed,
+        )
+    logger.info(
+        "%d segments (%d skipped) in %.2f s",
+        len(results),
+        sum(result.skipped for result in results),
+        time.perf_counter() - t_start,
+    )
+    return results
+
+
+def _is_up_to_date(
+    record: list[Any] | None, params: list[Any], output_file: pathlib.PosixPath
+) -> bool:
+    """
+    Whether the output was extracted with the parameters, i.e. the input file, its modification
+    time and the times of the segment, and is unchanged since.
+    """
+    if record is None or record[:-1] != params:
+        return False
+    mtime_ns: int = record[-1]
+    try:
+        return output_file.stat().st_mtime_ns == mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def _load_segment_records(cache_path: pathlib.PosixPath) -> dict[str, list[Any]]:
+    """Return extracted outputs with their parameters and modification times."""
+    cache = read_json_cache(
+        cache_path,
+        SEGMENTS_CACHE_VERSION,
+        "MP3 segment cache has an old format; extracting all segments again.",
+    )
+    if cache is None:
+        return {}
+    records: dict[str, list[Any]] = cache["outputs"]
+    return records
+
+
+def _save_segment_records(cache_path: pathlib.PosixPath, records: dict[str, list[Any]]) -> None:
+    write_json_cache(cache_path, SEGMENTS_CACHE_VERSION, {"outputs": records})
+
+
+def _get_time_seconds(time_arg: str | int) -> int:
+    """Convert time_from or time_to argument to the number of seconds."""
+    hh, mm, ss = _get_time_parts(time_arg)
+    if mm >= 60 or ss >= 60:
+        raise ValueError(f"Wrong time: {time_arg!r}.")
+    return ss + 60 * mm + 3600 * hh
+
+
+def _format_time(seconds: int) -> str:
+    """Format the number of seconds as HH:MM:SS."""
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
 def _get_time_parts(time_arg: str | int) -> tuple[int, int, int]:
     """Convert time_from or time_to argument to a tuple (hours, minutes, seconds)."""
     assert isinstance(time_arg, str | int)
@@ -126,3 +340,63 @@ def test_get_time_parts() -> None:
     assert _get_time_parts(0) == (0, 0, 0)
     assert _get_time_parts(34550) == (3, 45, 50)
     assert _get_time_parts(9995959) == (999, 59, 59)
+
+
+def test_get_time_seconds() -> None:
+    """Test _get_time_seconds() and _format_time() functions."""
+    assert _get_time_seconds("03:45:50") == 13550
+    assert _get_time_seconds(34550) == 13550
+    assert _format_time(13550) == "03:45:50"
+    assert _format_time(_get_time_seconds(9995959)) == "999:59:59"
+    for wrong in ("00:60:00", 7000):
+        try:
+            _get_time_seconds(wrong)
+        except ValueError:
+            pass
+        else:
+            assert False, f"{wrong!r} is accepted"
+
+
+def test_extract_mp3_segments_validation(tmp_path: pathlib.PosixPath) -> None:
+    """Check that the whole batch is validated before ffmpeg is started."""
+    input_file = tmp_path / "lecture.mp3"
+    input_file.write_bytes(b"")
+    csv_file = tmp_path / "segments.csv"
+    csv_file.write_text("# from,to,output\n00:00:10,00:01:00,a\n\n00:02:00,00:01:00,b.mp3\n")
+
+    segments = read_mp3_segments_csv(csv_file)
+    assert segments == [
+        Mp3Segment("00:00:10", "00:01:00", tmp_path / "a"),
+        Mp3Segment("00:02:00", "00:01:00", tmp_path / "b.mp3"),
+    ]
+    try:
+        extract_mp3_segments(input_file=input_file, segments=segments)
+    except ValueError:
+        pass
+    else:
+        assert False, "The second segment is invalid"
+    assert not (tmp_path / "a.mp3").exists()
+
+
+def test_extract_mp3_segments_skip(tmp_path: pathlib.PosixPath) -> None:
+    """Check that only unchanged outputs of unchanged segments are skipped."""
+    input_file = tmp_path / "lecture.mp3"
+    input_file.write_bytes(b"")
+    output_file = tmp_path / "a.mp3"
+    output_file.write_bytes(b"mp3")
+    params = [str(input_file), input_file.stat().st_mtime_ns, 10, 60]
+    record = [*params, output_file.stat().st_mtime_ns]
+    cache_path = tmp_path / "mp3_segments.json"
+    _save_segment_records(cache_path, {str(output_file): record})
+
+    (result,) = extract_mp3_segments(
+        input_file=input_file,
+        segments=[Mp3Segment("00:00:10", "00:01:00", output_file)],
+        cache_path=cache_path,
+    )
+    assert result.skipped
+    assert not _is_up_to_date(record, [*params[:-1], 61], output_file)  # The segment is edited.
+    os.utime(output_file, ns=(0, 0))
+    assert not _is_up_to_date(record, params, output_file)  # The output is changed.
+    output_file.unlink()
+    assert not _is_up_to_date(record, params, output_file)
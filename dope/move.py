@@ -0,0 +1,338 @@
+"""
+Moving and renaming notes and attachments without breaking links to them.
+
+Notes that link to the moved file are found with the backlink index, thus only they are read
+and rewritten. Links keep their style: absolute links stay absolute, relative links (`./`,
+`../`) are recomputed, `.md` is omitted if it was omitted, markdown links are percent-encoded.
+Relative links of a moved note are recomputed too.
+
+Wiki links resolved by name, e.g. `[[Note]]` for `a/Note.md`, see dope.name_index, are kept if
+they still resolve to the file after the move, e.g. when it only changes its directory;
+otherwise they become the shortest end of the new path that resolves to it unambiguously.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import functools
+import logging
+import os
+import pathlib
+import re
+
+from dope.link_index import LinkIndex, link_target_rpath, links_iter
+from dope.markdown_link import MarkdownLink
+from dope.name_index import NameIndex
+from dope.property_index import PropertyIndex
+from dope.rewrite import LineTransform, NoteRewriter, RewriteResult
+from dope.v_note import VNote
+from dope.wiki_link import WikiLink
+
+_logger = logging.getLogger(__name__)
+
+
+def _name_link(
+    link: str,
+    note_rpath_old: str,
+    note_rpath_new: str,
+    move: tuple[str, str],
+    name_index: NameIndex,
+) -> str | None:
+    """
+    Return the wiki link by name that resolves to `dst_rpath` after `src_rpath` is moved there:
+    the link itself if it still does, otherwise the shortest end of the new path that resolves
+    unambiguously; None is returned if the link does not resolve to `src_rpath`.
+
+    :param move: `src_rpath` and `dst_rpath`.
+    """
+    src_rpath, dst_rpath = move
+    resolution = name_index.resolve(note_rpath_old, link)
+    if resolution is None or resolution.path != name_index.vault_dir / src_rpath:
+        return None
+    after = name_index.moved(src_rpath, dst_rpath)
+    parts = dst_rpath.split("/")
+    new_link = dst_rpath
+    for num_parts in range(1, len(parts) + 1):
+        new_link = "/".join(parts[-num_parts:])
+        if not link.lower().endswith(".md"):
+            new_link = new_link.removesuffix(".md")
+        for candidate in (link, new_link) if num_parts == 1 else (new_link,):
+            resolution = after.resolve(note_rpath_new, candidate)
+            if (
+                resolution is not None
+                and resolution.path == after.vault_dir / dst_rpath
+                and not resolution.ambiguous
+            ):
+                return candidate
+    return new_link
+
+
+def num_links_to(
+    line: str, note_rpath: str, rpath: str, name_index: NameIndex | None = None
+) -> int:
+    """
+    Return the number of links of the line in the note `note_rpath` that resolve to `rpath`;
+    with the index of names of the vault, wiki links resolved by name are counted too.
+    """
+    num_links = 0
+    for hyper_link in links_iter(line):
+        target = link_target_rpath(note_rpath, hyper_link)
+        if target is None:
+            continue
+        if rpath in {target, target + ".md"}:
+            num_links += 1
+        elif (
+            name_index is not None
+            and isinstance(hyper_link, WikiLink)
+            and not hyper_link.uri.startswith(("./", "../"))
+            and (resolution := name_index.resolve(note_rpath, target)) is not None
+        ):
+            num_links += resolution.path == name_index.vault_dir / rpath
+    return num_links
+
+
+def retarget_line(
+    line: str,
+    note_rpath_old: str,
+    note_rpath_new: str,
+    src_rpath: str,
+    dst_rpath: str,
+    *,
+    name_index: NameIndex | None = None,
+) -> str:
+    """
+    Rewrite links of the line after `src_rpath` is moved to `dst_rpath`.
+
+    The note with the line itself is moved from `note_rpath_old` to `note_rpath_new`;
+    all paths are relative to the vault. If the index of names of the vault before the move is
+    given, wiki links resolved by name are rewritten too.
+    """
+    # pylint: disable=too-many-arguments,too-many-branches
+    wiki_uris: dict[str, str] = {}
+    markdown_uris: dict[str, str] = {}
+    for hyper_link in links_iter(line):
+        target = link_target_rpath(note_rpath_old, hyper_link)
+        if target is None:
+            continue
+        if target == src_rpath:
+            new_target = dst_rpath
+        elif target + ".md" == src_rpath:
+            new_target = dst_rpath.removesuffix(".md")
+        elif (
+            name_index is not None
+            and isinstance(hyper_link, WikiLink)
+            and not hyper_link.uri.startswith(("./", "../"))
+            and (
+                name_link := _name_link(
+                    target, note_rpath_old, note_rpath_new, (src_rpath, dst_rpath), name_index
+                )
+            )
+            is not None
+        ):
+            if name_link == target:
+                continue
+            new_target = name_link
+        elif note_rpath_old != note_rpath_new and hyper_link.uri.startswith(("./", "../")):
+            new_target = target  # A relative link of the moved note.
+        else:
+            continue
+
+        if hyper_link.uri.startswith(("./", "../")):
+            new_uri = os.path.relpath(new_target, os.path.dirname(note_rpath_new) or ".")
+            if not new_uri.startswith("../"):
+                new_uri = "./" + new_uri
+        else:
+            new_uri = new_target
+        if isinstance(hyper_link, MarkdownLink):
+            markdown_uris[hyper_link.uri_raw] = dataclasses.replace(
+                hyper_link.parsed(), path=new_uri
+            ).encoded()
+        else:
+            if hyper_link.section is not None:
+                new_uri += "#" + hyper_link.section
+            wiki_uris[hyper_link.uri_raw] = new_uri
+    return _replace_uris(line, wiki_uris, markdown_uris)
+
+
+def _replace_uris(line: str, wiki_uris: dict[str, str], markdown_uris: dict[str, str]) -> str:
+    """
+    Replace raw URIs of wiki and markdown links of the line by new ones in one pass.
+
+    Only a whole URI is replaced, thus `[[a/Notebook]]` is kept when `[[a/Note]]` is rewritten,
+    and a new URI is never rewritten again as the old URI of another link.
+    """
+    if not wiki_uris and not markdown_uris:
+        return line
+    pattern = "|".join(
+        [rf"(?<=\[\[){re.escape(uri)}(?=\s*(?:\\?\||\]\]))" for uri in wiki_uris]
+        + [rf"(?<=\]\(){re.escape(uri)}(?=\))" for uri in markdown_uris]
+    )
+    return re.sub(
+        pattern,
+        lambda match: (wiki_uris if line[match.start() - 1] == "[" else markdown_uris)[
+            match.group()
+        ],
+        line,
+    )
+
+
+def move_file(
+    vault_dir: pathlib.PosixPath,
+    src: pathlib.PosixPath,
+    dst: pathlib.PosixPath,
+    link_index: LinkIndex,
+    dry_run: bool = False,
+    *,
+    name_index: NameIndex | None = None,
+) -> list[RewriteResult]:
+    """
+    Move a file of the vault and rewrite links to it; return the rewritten notes.
+
+    If `dst` is a directory, the file is moved into it. In the dry-run mode, nothing is
+    written and the results hold diffs. Without an index of names, one is built with aliases
+    from the property index.
+    """
+    # pylint: disable=too-many-arguments
+    src, dst = src.absolute(), dst.absolute()
+    if dst.is_dir():
+        dst = dst / src.name
+    if not src.is_file():
+        raise ValueError(f"'{src}' is not a file.")
+    if dst.exists():
+        raise ValueError(f"'{dst}' already exists.")
+    if not src.is_relative_to(vault_dir) or not dst.is_relative_to(vault_dir):
+        raise ValueError(f"Both '{src}' and '{dst}' must be in '{vault_dir}'.")
+    src_rpath = str(src.relative_to(vault_dir))
+    dst_rpath = str(dst.relative_to(vault_dir))
+
+    link_index.update([vault_dir])
+    if name_index is None:
+        property_index = PropertyIndex()
+        property_index.update([vault_dir])
+        name_index = NameIndex(vault_dir, aliases=property_index.aliases(vault_dir))
+    # Links by name are among the links to any file with the name.
+    v_notes = link_index.name_backlinks(vault_dir, src)
+    if src.suffix == ".md" and VNote(vault_dir, src) not in v_notes:
+        v_notes.append(VNote(vault_dir, src))
+    _logger.debug("%d notes may link to '%s'.", len(v_notes), src_rpath)
+
+    results = []
+    for v_note in v_notes:
+        note_rpath = str(v_note.note_path.relative_to(vault_dir))
+        transform = LineTransform(
+            name="mv",
+            func=functools.partial(
+                retarget_line,
+                note_rpath_old=note_rpath,
+                note_rpath_new=dst_rpath if v_note.note_path == src else note_rpath,
+                src_rpath=src_rpath,
+                dst_rpath=dst_rpath,
+                name_index=name_index,
+            ),
+        )
+        if result := NoteRewriter([transform], dry_run=dry_run).rewrite_note(v_note):
+            results.append(result)
+
+    if not dry_run:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(src, dst)
+        _logger.info("Moved '%s' to '%s'.", src_rpath, dst_rpath)
+    return results
+
+
+def test_retarget_line() -> None:
+    """Check that links keep their style."""
+    assert retarget_line(
+        "[1](a/x%20y.md#s) [[a/x y|n]] [2](../a/x%20y) [3](a/other.md) [4](a/x%20y.md#^b1)",
+        note_rpath_old="d/n.md",
+        note_rpath_new="d/n.md",
+        src_rpath="a/x y.md",
+        dst_rpath="b/c/z.md",
+    ) == ("[1](b/c/z.md#s) [[b/c/z|n]] [2](../b/c/z) [3](a/other.md) [4](b/c/z.md#^b1)")
+    # The moved note itself.
+    assert retarget_line(
+        "![i](./res/i.png) [self](./x%20y.md) [abs](a/q.md)",
+        note_rpath_old="a/x y.md",
+        note_rpath_new="b/c/z.md",
+        src_rpath="a/x y.md",
+        dst_rpath="b/c/z.md",
+    ) == ("![i](../../a/res/i.png) [self](./z.md) [abs](a/q.md)")
+    # Links that only start with the moved one, and a new URI that is the old one of another link.
+    assert retarget_line(
+        "[[a/Note]] and [[a/Notebook|b]] [[a/Note.md.bak]] [n](a/Note.md) [m](a/Note.mdx)",
+        note_rpath_old="c.md",
+        note_rpath_new="c.md",
+        src_rpath="a/Note.md",
+        dst_rpath="b/Renamed.md",
+    ) == ("[[b/Renamed]] and [[a/Notebook|b]] [[a/Note.md.bak]] [n](b/Renamed.md) [m](a/Note.mdx)")
+    assert retarget_line(
+        "[[./x]] [[../x]]",
+        note_rpath_old="a/n.md",
+        note_rpath_new="a/b/n.md",
+        src_rpath="a/n.md",
+        dst_rpath="a/b/n.md",
+    ) == ("[[../x]] [[../../x]]")
+
+
+def test_num_links_to(tmp_path: pathlib.PosixPath) -> None:
+    """Check links by paths and by names."""
+    (tmp_path / "a" / "res").mkdir(parents=True)
+    (tmp_path / "a" / "res" / "i.png").write_bytes(b"png")
+    line = "![x](./res/i.png) [[a/res/i.png]] ![[I.png|100]] [[./i.png]] [y](i.png)"
+    assert num_links_to(line, "a/n.md", "a/res/i.png") == 2
+    assert num_links_to(line, "a/n.md", "a/res/i.png", NameIndex(tmp_path)) == 3
+
+
+def test_move_file(tmp_path: pathlib.PosixPath) -> None:
+    """Check that a moved attachment stays linked and unrelated notes are untouched."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "a" / "res").mkdir(parents=True)
+    (vault_dir / "a" / "res" / "i.png").write_bytes(b"png")
+    (vault_dir / "a" / "n.md").write_text("![i](./res/i.png)\n```\n![i](./res/i.png)\n```\n")
+    (vault_dir / "b.md").write_text("[i](a/res/i.png)\n")
+    (vault_dir / "c.md").write_text("nothing\n")
+    link_index = LinkIndex(cache_path=tmp_path / "link_index.json")
+
+    src, dst = vault_dir / "a" / "res" / "i.png", vault_dir / "res" / "i.png"
+    results = move_file(
+        vault_dir, src, dst, link_index, dry_run=True, name_index=NameIndex(vault_dir)
+    )
+    assert len(results) == 2 and src.exists()
+
+    c_mtime = (vault_dir / "c.md").stat().st_mtime_ns
+    move_file(vault_dir, src, dst, link_index, name_index=NameIndex(vault_dir))
+    assert (vault_dir / "res" / "i.png").read_bytes() == b"png"
+    assert (vault_dir / "a" / "n.md").read_text() == (
+        "![i](../res/i.png)\n```\n![i](./res/i.png)\n```\n"
+    )
+    assert (vault_dir / "b.md").read_text() == "[i](res/i.png)\n"
+    assert (vault_dir / "c.md").stat().st_mtime_ns == c_mtime
+
+
+def test_move_file_by_name(tmp_path: pathlib.PosixPath) -> None:
+    """Check that wiki links by name are renamed, kept, or lengthened to stay unambiguous."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "a").mkdir(parents=True)
+    (vault_dir / "b").mkdir()
+    (vault_dir / "a" / "Note.md").write_text("text\n")
+    (vault_dir / "b" / "Renamed.md").write_text("text\n")
+    (vault_dir / "c.md").write_text("[[Note#Part|n]] [[a/Note]] [[note.md]] [[Other]]\n")
+    link_index = LinkIndex(cache_path=tmp_path / "link_index.json")
+
+    def move(src: str, dst: str) -> None:
+        move_file(
+            vault_dir, vault_dir / src, vault_dir / dst, link_index, name_index=NameIndex(vault_dir)
+        )
+
+    move("a/Note.md", "a/Renamed.md")  # b/Renamed.md exists, thus the name is ambiguous.
+    assert (vault_dir / "c.md").read_text() == (
+        "[[a/Renamed#Part|n]] [[a/Renamed]] [[a/Renamed.md]] [[Other]]\n"
+    )
+    move("a/Renamed.md", "d/Renamed.md")  # Resolves by the path, which must change.
+    assert (vault_dir / "c.md").read_text() == (
+        "[[d/Renamed#Part|n]] [[d/Renamed]] [[d/Renamed.md]] [[Other]]\n"
+    )
+    (vault_dir / "b" / "Renamed.md").unlink()
+    (vault_dir / "c.md").write_text("[[Renamed]]\n")
+    move("d/Renamed.md", "e/Renamed.md")  # Still the only note with the name.
+    assert (vault_dir / "c.md").read_text() == "[[Renamed]]\n"
@@ -0,0 +1,194 @@
+"""
+Index of file names for wiki links that Obsidian resolves by name.
+
+Obsidian resolves `[[Note Name]]` to a note with that name anywhere in the vault, and
+`[[dir/Note Name]]` to a file whose path ends with the link, ignoring case. The vault is walked
+once and every file is indexed by its lowercase name, a note also by the name without `.md`,
+thus a link is resolved with one dictionary lookup and a check of the few files with its name
+instead of a search of the file system. Aliases of notes, see PropertyIndex.aliases(), are
+indexed too and resolve links that no file name matches.
+
+Of several candidates, the one Obsidian opens is chosen:
+1. the path relative to the vault root, e.g. `[[dir/Note]]` for `dir/Note.md`,
+2. a file in the directory of the linking note,
+3. the file with the shortest path, then the first in alphabetical order.
+A link that matches several files otherwise is ambiguous: it resolves, yet it changes meaning
+as soon as the linking note is moved or a file is renamed, thus it is reported separately.
+Hidden files and directories, e.g. `.obsidian`, and `.trash` are ignored.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import os
+import pathlib
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+_logger = logging.getLogger(__name__)
+
+
+def name_key(rpath: str) -> str:
+    """Return the key a file or a link is indexed by: its lowercase name without `.md`."""
+    name = rpath.rsplit("/", 1)[-1].lower()
+    return name[:-3] if name.endswith(".md") else name
+
+
+@dataclass
+class Resolution:
+    """The file a wiki link resolves to."""
+
+    path: pathlib.PosixPath
+    candidates: list[pathlib.PosixPath]
+    """All files the link matches, the resolved one first."""
+    exact: bool
+    """Whether the link is the path of the file relative to the vault root."""
+
+    @property
+    def ambiguous(self) -> bool:
+        """Whether the link relies on disambiguation, see the module docstring."""
+        return not self.exact and len(self.candidates) > 1
+
+
+class NameIndex:
+    """Files of a vault by names and notes by aliases."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(
+        self,
+        vault_dir: pathlib.PosixPath,
+        aliases: dict[str, list[pathlib.PosixPath]] | None = None,
+    ) -> None:
+        """
+        Walk through the vault once.
+
+        :param aliases: notes by lowercase aliases, see PropertyIndex.aliases().
+        """
+        self.vault_dir = vault_dir
+        self._names: dict[str, list[str]] = {}
+        """Paths relative to the vault by keys, see name_key()."""
+        for dir_path, dir_names, file_names in os.walk(vault_dir):
+            dir_names[:] = [name for name in dir_names if not name.startswith(".")]
+            for file_name in file_names:
+                if not file_name.startswith("."):
+                    rpath = os.path.relpath(os.path.join(dir_path, file_name), vault_dir)
+                    self._names.setdefault(name_key(file_name), []).append(rpath)
+        self._aliases = {
+            alias: [str(note_path.relative_to(vault_dir)) for note_path in note_paths]
+            for alias, note_paths in (aliases or {}).items()
+        }
+        _logger.debug(
+            "%s: %d names, %d aliases.", vault_dir.name, len(self._names), len(self._aliases)
+        )
+
+    def moved(self, src_rpath: str, dst_rpath: str) -> NameIndex:
+        """
+        Return a copy of the index in which the file is moved or, if the destination exists,
+        deleted; the vault is not walked again.
+        """
+        # pylint: disable=protected-access
+        index = copy.copy(self)
+        index._names = dict(self._names)
+        src_key, dst_key = name_key(src_rpath), name_key(dst_rpath)
+        index._names[src_key] = [
+            rpath for rpath in self._names.get(src_key, ()) if rpath != src_rpath
+        ]
+        if dst_rpath not in index._names.get(dst_key, ()):
+            index._names[dst_key] = [*index._names.get(dst_key, ()), dst_rpath]
+        index._aliases = {
+            alias: [dst_rpath if rpath == src_rpath else rpath for rpath in rpaths]
+            for alias, rpaths in self._aliases.items()
+        }
+        return index
+
+    def aliases_of(self, note_rpaths: Iterable[str]) -> set[str]:
+        """Return lowercase aliases of the notes, given by paths relative to the vault."""
+        note_rpaths = set(note_rpaths)
+        return {
+            alias for alias, rpaths in self._aliases.items() if not note_rpaths.isdisjoint(rpaths)
+        }
+
+    def resolve(self, note_rpath: str, link_path: str) -> Resolution | None:
+        """
+        Resolve the path of a wiki link written in the note; None is returned if no file matches.
+
+        :param note_rpath: the path of the linking note relative to the vault.
+        :param link_path: the decoded link without a section or a block.
+        """
+        link = link_path.strip("/").lower()
+        link_md = link if link.endswith(".md") else link + ".md"
+        candidates = [
+            rpath
+            for rpath in self._names.get(name_key(link), ())
+            if (lower := rpath.lower()) in {link, link_md}
+            or lower.endswith((f"/{link}", f"/{link_md}"))
+        ]
+        if not candidates and "/" not in link:
+            candidates = self._aliases.get(link, [])
+        if not candidates:
+            return None
+        note_dir = os.path.dirname(note_rpath)
+        ranked = sorted(
+            candidates,
+            key=lambda rpath: (
+                rpath.lower() not in {link, link_md},
+                os.path.dirname(rpath) != note_dir,
+                len(rpath),
+                rpath,
+            ),
+        )
+        return Resolution(
+            path=self.vault_dir / ranked[0],
+            candidates=[self.vault_dir / rpath for rpath in ranked],
+            exact=ranked[0].lower() in {link, link_md},
+        )
+
+
+def test_name_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check the disambiguation rules, attachments, and aliases."""
+    vault_dir = tmp_path / "vault"
+    for rpath in (
+        "Note.md",
+        "a/Note.md",
+        "a/b/Note.md",
+        "c/Other.md",
+        "c/res/i.png",
+        ".trash/X.md",
+    ):
+        (vault_dir / rpath).parent.mkdir(parents=True, exist_ok=True)
+        (vault_dir / rpath).write_text("")
+    index = NameIndex(vault_dir, aliases={"nickname": [vault_dir / "c" / "Other.md"]})
+
+    def resolve(note_rpath: str, link_path: str) -> tuple[str, bool] | None:
+        resolution = index.resolve(note_rpath, link_path)
+        if resolution is None:
+            return None
+        return str(resolution.path.relative_to(vault_dir)), resolution.ambiguous
+
+    assert resolve("c/Other.md", "Note") == ("Note.md", False)  # The root path.
+    assert resolve("a/b/x.md", "b/note") == ("a/b/Note.md", False)  # The only match.
+    assert resolve("a/b/x.md", "a/Note.md") == ("a/Note.md", False)
+    assert resolve("a/b/x.md", "Other") == ("c/Other.md", False)
+    assert resolve("x.md", "i.png") == ("c/res/i.png", False)
+    assert resolve("x.md", "Nickname") == ("c/Other.md", False)
+    assert index.aliases_of(["c/Other.md", "Note.md"]) == {"nickname"}
+    assert resolve("x.md", "X") is None
+    assert resolve("x.md", "d/Other") is None
+
+    (vault_dir / "a" / "Note.md").unlink()
+    (vault_dir / "a" / "c").mkdir()
+    (vault_dir / "a" / "c" / "Note.md").write_text("")
+    index = NameIndex(vault_dir / "a")
+    assert resolve("c/x.md", "Note") == ("a/c/Note.md", True)  # The same directory.
+    assert resolve("x.md", "Note") == ("a/b/Note.md", True)  # Shortest, then alphabetical.
+    resolution = index.resolve("x.md", "note")
+    assert resolution is not None and len(resolution.candidates) == 2
+
+    index = index.moved("c/Note.md", "c/Renamed.md")
+    assert resolve("x.md", "Note") == ("a/b/Note.md", False)
+    assert resolve("x.md", "Renamed") == ("a/c/Renamed.md", False)
+    index = index.moved("c/Renamed.md", "b/Note.md")  # A duplicate is deleted.
+    assert resolve("x.md", "Renamed") is None
+    assert resolve("x.md", "Note") == ("a/b/Note.md", False)
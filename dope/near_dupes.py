@@ -0,0 +1,253 @@
+"""
+Near-duplicate notes found with MinHash and locality-sensitive hashing.
+
+Text of every note, except code blocks, is split into terms the same way as for full-text
+search, and every 4 consecutive terms form a shingle. The Jaccard similarity of two notes,
+the share of shingles they have in common, is estimated with a MinHash signature of 64 bins.
+Signatures are computed with one-permutation hashing: every shingle is hashed once, the hash
+selects a bin and the bin keeps its minimum; empty bins borrow from the next non-empty bin.
+Signatures are cached per note together with its modification time and size.
+
+Candidate pairs come from locality-sensitive hashing: signatures are cut into 16 bands of
+4 bins, and notes that share any band land in the same bucket. Only candidates are compared,
+thus the cost grows with the number of notes rather than with the number of pairs.
+A pair with similarity `s` becomes a candidate with probability `1 - (1 - s^4)^16`, which is
+above 99.9% for `s = 0.8` and below 2% for `s = 0.2`.
+"""
+
+from __future__ import annotations
+
+import array
+import base64
+import collections
+import hashlib
+import itertools
+import logging
+import os
+import pathlib
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.git_changes import GitMark, marks_from_json, marks_to_json, refresh_entries
+from dope.search_index import tokenize
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 4
+NUM_BINS = 64
+NUM_BANDS = 16
+_ROWS = NUM_BINS // NUM_BANDS
+_VALUE_BITS = 26
+"""Bits of a bin's value; densified bins add the distance to the borrowed bin above them."""
+_EMPTY = 1 << 32
+
+
+def shingles_iter(v_note: VNote) -> Iterator[str]:
+    """Yield shingles of the note; a note shorter than a shingle is one shingle."""
+    window: collections.deque[str] = collections.deque(maxlen=SHINGLE_SIZE)
+    num_shingles = 0
+    for _, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+        for term in tokenize(note_line):
+            window.append(term)
+            if len(window) == SHINGLE_SIZE:
+                num_shingles += 1
+                yield " ".join(window)
+    if window and not num_shingles:
+        yield " ".join(window)
+
+
+def signature(shingles: Iterable[str]) -> array.array[int] | None:
+    """Return the MinHash signature of the shingles; None if there are none."""
+    mins = [_EMPTY] * NUM_BINS
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        bin_idx = value % NUM_BINS
+        value >>= 64 - _VALUE_BITS
+        if value < mins[bin_idx]:
+            mins[bin_idx] = value
+    if all(value == _EMPTY for value in mins):
+        return None
+    dense = list(mins)
+    for bin_idx, value in enumerate(mins):
+        if value == _EMPTY:
+            distance = 1
+            while mins[(bin_idx + distance) % NUM_BINS] == _EMPTY:
+                distance += 1
+            dense[bin_idx] = mins[(bin_idx + distance) % NUM_BINS] | (distance << _VALUE_BITS)
+    return array.array("I", dense)
+
+
+def similarity(sig_a: array.array[int], sig_b: array.array[int]) -> float:
+    """Estimate the Jaccard similarity of two notes from their signatures."""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_BINS
+
+
+@dataclass
+class _NoteEntry:
+    vault_dir: str
+    mtime_ns: int
+    size: int
+    signature: array.array[int] | None
+    """None for notes without terms."""
+
+
+@dataclass
+class NearDuplicate:
+    """A pair of similar notes."""
+
+    similarity: float
+    """Estimated share of shingles the notes have in common."""
+    v_note_a: VNote
+    v_note_b: VNote
+
+
+class NearDupIndex:
+    """Cached MinHash signatures of all notes."""
+
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_path: pathlib.PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "near_dupes.json"
+        self.entries: dict[str, _NoteEntry] = {}
+        self.num_read = 0
+        """The number of notes read by the last update."""
+        self.num_candidates = 0
+        """The number of candidate pairs compared by the last call of pairs()."""
+        self.git_marks: dict[str, GitMark] = {}
+        """States of vaults that are git repositories at the last update, see dope.git_changes."""
+        self._load()
+
+    def update(self, vault_dirs: Iterable[pathlib.PosixPath]) -> None:
+        """Compute signatures of new and changed notes of the vaults, forget deleted ones."""
+        self.entries, self.num_read = refresh_entries(
+            self.entries, list(vault_dirs), self.git_marks, self._read_note
+        )
+        _logger.debug("%d notes, %d read.", len(self.entries), self.num_read)
+        self._save()
+
+    @staticmethod
+    def _read_note(v_note: VNote, stat: os.stat_result) -> _NoteEntry:
+        return _NoteEntry(
+            str(v_note.vault_dir), stat.st_mtime_ns, stat.st_size, signature(shingles_iter(v_note))
+        )
+
+    def pairs(
+        self, vault_dirs: Iterable[pathlib.PosixPath], threshold: float = 0.8
+    ) -> list[NearDuplicate]:
+        """Return pairs of notes of the vaults at least `threshold` similar, most similar first."""
+        candidates = self._candidates({str(vault_dir) for vault_dir in vault_dirs})
+        self.num_candidates = len(candidates)
+
+        pairs = []
+        for key_a, key_b in candidates:
+            entry_a, entry_b = self.entries[key_a], self.entries[key_b]
+            assert entry_a.signature is not None and entry_b.signature is not None
+            if (sim := similarity(entry_a.signature, entry_b.signature)) >= threshold:
+                pairs.append(
+                    NearDuplicate(
+                        similarity=sim,
+                        v_note_a=VNote(
+                            pathlib.PosixPath(entry_a.vault_dir), pathlib.PosixPath(key_a)
+                        ),
+                        v_note_b=VNote(
+                            pathlib.PosixPath(entry_b.vault_dir), pathlib.PosixPath(key_b)
+                        ),
+                    )
+                )
+        _logger.debug("%d candidates, %d pairs.", len(candidates), len(pairs))
+        return sorted(
+            pairs,
+            key=lambda pair: (-pair.similarity, pair.v_note_a.note_path, pair.v_note_b.note_path),
+        )
+
+    def _candidates(self, vaults: set[str]) -> set[tuple[str, str]]:
+        """Return pairs of notes of the vaults that share a band of their signatures."""
+        buckets: dict[tuple[int, bytes], list[str]] = {}
+        for key, entry in self.entries.items():
+            if entry.vault_dir in vaults and entry.signature is not None:
+                for band in range(NUM_BANDS):
+                    rows = entry.signature[band * _ROWS : (band + 1) * _ROWS].tobytes()
+                    buckets.setdefault((band, rows), []).append(key)
+        return {
+            pair
+            for keys in buckets.values()
+            if len(keys) > 1
+            for pair in itertools.combinations(sorted(keys), 2)
+        }
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path,
+            self.CACHE_VERSION,
+            "Near-duplicates cache has an old format; rebuilding.",
+        )
+        if cache is None:
+            return
+        self.entries = {}
+        for key, (vault_dir, mtime_ns, size, sig_b64) in cache["entries"].items():
+            sig = None
+            if sig_b64 is not None:
+                sig = array.array("I")
+                sig.frombytes(base64.b64decode(sig_b64))
+            self.entries[key] = _NoteEntry(vault_dir, mtime_ns, size, sig)
+        self.git_marks = marks_from_json(cache.get("git", {}))
+
+    def _save(self) -> None:
+        cache = {
+            "entries": {
+                key: [
+                    entry.vault_dir,
+                    entry.mtime_ns,
+                    entry.size,
+                    None
+                    if entry.signature is None
+                    else base64.b64encode(entry.signature.tobytes()).decode("ascii"),
+                ]
+                for key, entry in self.entries.items()
+            },
+            "git": marks_to_json(self.git_marks),
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def test_signature() -> None:
+    """Check that the estimate is close to the Jaccard similarity."""
+    shingles_a = {f"s{idx}" for idx in range(1000)}
+    shingles_b = {f"s{idx}" for idx in range(200, 1200)}  # Jaccard similarity is 2/3.
+    sig_a, sig_b = signature(shingles_a), signature(shingles_b)
+    assert sig_a is not None and sig_b is not None
+    assert similarity(sig_a, sig_a) == 1.0
+    assert abs(similarity(sig_a, sig_b) - 2 / 3) < 0.2
+    assert signature([]) is None
+    sig_c = signature(["one"])  # Densified from a single bin.
+    assert sig_c is not None and len(set(sig_c)) == NUM_BINS
+
+
+def test_near_dup_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check that near copies are found, code is ignored, and unchanged notes are not read."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    words = [f"word{idx}" for idx in range(300)]
+    (vault_dir / "a.md").write_text(" ".join(words) + "\n")
+    (vault_dir / "b.md").write_text(" ".join(words[:299]) + " changed\n```\ncode\n```\n")
+    (vault_dir / "c.md").write_text(" ".join(reversed(words)) + "\n")
+    (vault_dir / "d.md").write_text("```\n" + " ".join(words) + "\n```\n")
+    cache_path = tmp_path / "near_dupes.json"
+
+    index = NearDupIndex(cache_path)
+    index.update([vault_dir])
+    assert index.num_read == 4
+    assert index.entries[str(vault_dir / "d.md")].signature is None
+    pairs = index.pairs([vault_dir])
+    assert [(pair.v_note_a.note_path.name, pair.v_note_b.note_path.name) for pair in pairs] == [
+        ("a.md", "b.md")
+    ]
+    assert pairs[0].similarity > 0.9
+
+    index = NearDupIndex(cache_path)
+    index.update([vault_dir])
+    assert index.num_read == 0
+    assert len(index.pairs([vault_dir])) == 1
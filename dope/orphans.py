@@ -0,0 +1,95 @@
+"""
+Attachments that no note links to.
+
+All notes are streamed once: links of lines and of properties, e.g. `banner: "[[cover.png]]"`, are
+resolved the same way as for the backlink index, see link_target_rpath(), and only the set of
+distinct targets is kept. The vault is walked afterwards and every file that is neither a note nor a
+target is yielded as soon as it is found. Obsidian resolves a wiki link without a directory, e.g.
+`[[image.png]]`, to a file with that name anywhere in the vault, ignoring case, thus such names keep
+all files with the name.
+Hidden files and directories, e.g. `.obsidian`, and `.trash` are ignored.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import pathlib
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from dope.link_index import link_target_rpath, links_iter
+from dope.name_index import name_key
+from dope.v_note import VNote
+from dope.wiki_link import WikiLink
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Orphan:
+    """A file that no note links to."""
+
+    path: pathlib.PosixPath
+    size: int
+    """Size in bytes."""
+
+
+def linked_targets(vault_dir: pathlib.PosixPath) -> tuple[set[str], set[str]]:
+    """
+    Return paths of all link targets relative to the vault, `.md` may be omitted, and keys
+    of names of targets of wiki links without a directory, see name_key().
+    """
+    targets: set[str] = set()
+    names: set[str] = set()
+    for v_note in VNote.collect_iter([vault_dir], exclude_trash=True):
+        note_rpath = str(v_note.note_path.relative_to(vault_dir))
+        lines = (note_line for _, note_line in v_note.lines_iter(lazy=True, remove_newline=True))
+        values = itertools.chain.from_iterable(v_note.properties().values())
+        for text in itertools.chain(lines, values):
+            for hyper_link in links_iter(text):
+                if (target := link_target_rpath(note_rpath, hyper_link)) is None:
+                    continue
+                targets.add(target)
+                if isinstance(hyper_link, WikiLink) and "/" not in target:
+                    names.add(name_key(target))
+    _logger.debug("%s: %d targets, %d names.", vault_dir.name, len(targets), len(names))
+    return targets, names
+
+
+def orphans_iter(vault_dir: pathlib.PosixPath) -> Iterator[Orphan]:
+    """Yield files of the vault other than notes that no note links to."""
+    targets, names = linked_targets(vault_dir)
+    for dir_path, dir_names, file_names in os.walk(vault_dir):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith("."))
+        for file_name in sorted(file_names):
+            if (
+                file_name.endswith(".md")
+                or file_name.startswith(".")
+                or name_key(file_name) in names
+            ):
+                continue
+            path = os.path.join(dir_path, file_name)
+            if os.path.relpath(path, vault_dir) not in targets:
+                yield Orphan(path=pathlib.PosixPath(path), size=os.stat(path).st_size)
+
+
+def test_orphans_iter(tmp_path: pathlib.PosixPath) -> None:
+    """Check absolute, relative, wiki, and name-only links in any case, properties, and code."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "a" / "res").mkdir(parents=True)
+    (vault_dir / ".obsidian").mkdir()
+    (vault_dir / ".obsidian" / "app.json").write_text("{}")
+    (vault_dir / "a" / "n.md").write_text(
+        "![x](./res/x%20y.png) [[a/res/w.pdf|w]] ![[Z.PNG]]\n```\n![o](./res/o.png)\n```\n"
+    )
+    (vault_dir / "m.md").write_text('---\nbanner: "[[cover.png]]"\n---\n[v](a/res/v.mp3)\n')
+    for name in ("x y.png", "w.pdf", "z.png", "v.mp3", "o.png", "u.png", "cover.png"):
+        (vault_dir / "a" / "res" / name).write_bytes(b"12345")
+    (vault_dir / "z.png").write_bytes(b"")
+
+    assert list(orphans_iter(vault_dir)) == [
+        Orphan(vault_dir / "a" / "res" / "o.png", 5),
+        Orphan(vault_dir / "a" / "res" / "u.png", 5),
+    ]
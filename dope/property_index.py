@@ -0,0 +1,170 @@
+"""
+Index of properties of notes, i.e. of their YAML frontmatter.
+
+Only the header of a new or changed note is read, see VNote.properties(); properties are
+cached together with the note's modification time and size.
+
+Property queries are conditions that all must hold:
+* `status:active` - the property has the value, case-insensitive,
+* `status` - the note has the property, whatever its value.
+Values of `tags` are compared without `#`, and a tag matches nested tags the same way as in
+tag queries: `tags:edu` matches `edu/rust`.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.git_changes import GitMark, marks_from_json, marks_to_json, refresh_entries
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _NoteEntry:
+    vault_dir: str
+    mtime_ns: int
+    size: int
+    properties: dict[str, list[str]]
+
+
+def _normalize(key: str, value: str) -> str:
+    value = value.strip().lower()
+    return value.lstrip("#") if key == "tags" else value
+
+
+def parse_condition(condition: str) -> tuple[str, str | None]:
+    """Split `key:value` into the key and the normalized value; the value may be omitted."""
+    key, sep, value = condition.partition(":")
+    key = key.strip()
+    if not key:
+        raise ValueError(f"Malformed property condition `{condition}`, e.g. `status:active`.")
+    return key, _normalize(key, value) if sep and value.strip() else None
+
+
+class PropertyIndex:
+    """Cached properties of all notes."""
+
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_path: pathlib.PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "property_index.json"
+        self.entries: dict[str, _NoteEntry] = {}
+        self.num_read = 0
+        """The number of notes whose headers were read by the last update."""
+        self.git_marks: dict[str, GitMark] = {}
+        """States of vaults that are git repositories at the last update, see dope.git_changes."""
+        self._load()
+
+    def update(self, vault_dirs: Iterable[pathlib.PosixPath]) -> None:
+        """Read properties of new and changed notes of the vaults, forget deleted ones."""
+        self.entries, self.num_read = refresh_entries(
+            self.entries, list(vault_dirs), self.git_marks, self._read_note
+        )
+        _logger.debug("%d notes, %d read.", len(self.entries), self.num_read)
+        self._save()
+
+    @staticmethod
+    def _read_note(v_note: VNote, stat: os.stat_result) -> _NoteEntry:
+        return _NoteEntry(
+            str(v_note.vault_dir), stat.st_mtime_ns, stat.st_size, v_note.properties()
+        )
+
+    def query(self, vault_dirs: Iterable[pathlib.PosixPath], conditions: list[str]) -> list[VNote]:
+        """
+        Return notes of the vaults that satisfy all conditions, see the module docstring.
+
+        :raises ValueError: if a condition is malformed.
+        """
+        parsed = [parse_condition(condition) for condition in conditions]
+        vaults = {str(vault_dir) for vault_dir in vault_dirs}
+        v_notes = []
+        for key, entry in sorted(self.entries.items()):
+            if entry.vault_dir in vaults and all(
+                self._matches(entry.properties, prop, value) for prop, value in parsed
+            ):
+                v_notes.append(VNote(pathlib.PosixPath(entry.vault_dir), pathlib.PosixPath(key)))
+        return v_notes
+
+    @staticmethod
+    def _matches(properties: dict[str, list[str]], key: str, value: str | None) -> bool:
+        if key not in properties:
+            return False
+        if value is None:
+            return True
+        for item in properties[key]:
+            item = _normalize(key, item)
+            if item == value or (key == "tags" and item.startswith(value + "/")):
+                return True
+        return False
+
+    def aliases(self, vault_dir: pathlib.PosixPath) -> dict[str, list[pathlib.PosixPath]]:
+        """Return notes of the vault by their lowercase aliases."""
+        notes: dict[str, list[pathlib.PosixPath]] = {}
+        for key, entry in self.entries.items():
+            if entry.vault_dir == str(vault_dir):
+                for alias in entry.properties.get("aliases", []):
+                    notes.setdefault(alias.lower(), []).append(pathlib.PosixPath(key))
+        return notes
+
+    def counts(self, vault_dirs: Iterable[pathlib.PosixPath]) -> dict[str, int]:
+        """Return the number of notes of the vaults that have every property, by property."""
+        vaults = {str(vault_dir) for vault_dir in vault_dirs}
+        counts: dict[str, int] = {}
+        for entry in self.entries.values():
+            if entry.vault_dir in vaults:
+                for key in entry.properties:
+                    counts[key] = counts.get(key, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path,
+            self.CACHE_VERSION,
+            "Property index cache has an old format; rebuilding.",
+        )
+        if cache is None:
+            return
+        self.entries = {key: _NoteEntry(**item) for key, item in cache["entries"].items()}
+        self.git_marks = marks_from_json(cache.get("git", {}))
+
+    def _save(self) -> None:
+        cache = {
+            "entries": {key: entry.__dict__ for key, entry in self.entries.items()},
+            "git": marks_to_json(self.git_marks),
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def test_property_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check queries, aliases, and that unchanged notes are not read again."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    (vault_dir / "a.md").write_text("---\nstatus: Active\ntags: [edu/rust]\naliases: [A1]\n---\n")
+    (vault_dir / "b.md").write_text("---\nstatus: done\ntags:\n  - '#edu'\n---\ntext\n")
+    (vault_dir / "c.md").write_text("no properties\n")
+    cache_path = tmp_path / "property_index.json"
+    index = PropertyIndex(cache_path)
+    index.update([vault_dir])
+    assert index.num_read == 3
+
+    def query(*conditions: str) -> list[str]:
+        return [v_note.note_path.name for v_note in index.query([vault_dir], list(conditions))]
+
+    assert query("status: active") == ["a.md"]
+    assert query("tags:edu") == ["a.md", "b.md"]
+    assert query("tags:#edu/rust", "status") == ["a.md"]
+    assert not query("tags:ed")
+    assert index.aliases(vault_dir) == {"a1": [vault_dir / "a.md"]}
+    assert index.counts([vault_dir]) == {"aliases": 1, "status": 2, "tags": 2}
+
+    index = PropertyIndex(cache_path)
+    index.update([vault_dir])
+    assert index.num_read == 0
+    assert query("status:done") == ["b.md"]
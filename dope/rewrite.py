@@ -0,0 +1,268 @@
+"""
+Bulk rewriting of notes with line transforms.
+
+Every note is streamed line by line through the transforms. Nothing is written until a line
+actually changes, thus untouched notes are never rewritten; changed notes are written to
+a temporary file that atomically replaces the note, see VNote.open_for_rewrite().
+Notes are processed in parallel. In the dry-run mode, unified diffs are returned instead.
+
+Transforms are given as specs:
+* `crlf` - replace Windows-style newlines with `\\n`, also in code blocks,
+* `uris` - percent-encode URIs of markdown links to notes the same way, see normalize_uri(),
+* `deadlines:+7` - move deadlines of tasks by the number of days,
+* `lessons:old=new` - move lessons from course `old` to course `new`.
+"""
+
+from __future__ import annotations
+
+import difflib
+import logging
+import pathlib
+import re
+import urllib.parse
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from dope.hyper_link import encode_uri
+from dope.markdown_link import MarkdownLink
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+_RE_DEADLINE = re.compile(r"(?<=#)(\d\d\d\d-\d\d-\d\d)(?=/[nxw]\d)")
+_RE_ESCAPES = re.compile(r"((?:%[0-9A-Fa-f]{2})+)")
+
+_RESERVED = frozenset(":/?#[]@!$&'()*+,;=%")
+"""Characters whose percent-encoding is kept: decoding them may change the target."""
+
+
+def normalize_uri(uri: str) -> str:
+    """
+    Decode percent-encoded characters and encode only unsafe ones; anchors are kept.
+
+    Reserved characters stay encoded, e.g. `a%2Fb.md` is a note in the root, not in `a/`.
+    """
+    path, *anchors = uri.split("#")
+    block = anchors.pop()[1:] if anchors and anchors[-1].startswith("^") else None
+    parts = [_normalize_part(part) for part in (path, *anchors)]
+    if block is not None:
+        parts.append("^" + _normalize_part(block))
+    return "#".join(parts)
+
+
+def _normalize_part(part: str) -> str:
+    """Normalize a path or a heading, see normalize_uri()."""
+
+    def decode(char: str) -> str:
+        if "\udc80" <= char <= "\udcff":  # A byte that is not UTF-8.
+            return f"%{ord(char) - 0xDC00:02X}"
+        return f"%{ord(char):02X}" if char in _RESERVED else encode_uri(char)
+
+    return "".join(
+        "".join(map(decode, urllib.parse.unquote(piece, errors="surrogateescape")))
+        if idx % 2
+        else encode_uri(piece)
+        for idx, piece in enumerate(_RE_ESCAPES.split(part))
+    )
+
+
+@dataclass(frozen=True)
+class LineTransform:
+    """A named function that rewrites one line including its newline."""
+
+    name: str
+    func: Callable[[str], str]
+    in_code: bool = False
+    """Whether or not lines of code blocks are transformed too."""
+
+    @classmethod
+    def from_spec(cls, spec: str) -> LineTransform:
+        """Make a transform from a spec like `deadlines:+7`; see the module docstring."""
+        name, _, arg = spec.partition(":")
+        match name:
+            case "crlf":
+                return cls(name=spec, func=cls._crlf, in_code=True)
+            case "uris":
+                return cls(name=spec, func=cls._uris)
+            case "deadlines":
+                try:
+                    days = int(arg)
+                except ValueError as err:
+                    raise ValueError(f"Malformed `{spec}`, e.g. `deadlines:+7`.") from err
+                return cls(name=spec, func=lambda line: cls._deadlines(line, days))
+            case "lessons":
+                old, _, new = arg.partition("=")
+                if not old or not new or "/" in old + new:
+                    raise ValueError(f"Malformed `{spec}`, e.g. `lessons:rust=rust-book`.")
+                re_old = re.compile(rf"#edu/{re.escape(old)}/")
+                return cls(name=spec, func=lambda line: re_old.sub(f"#edu/{new}/", line))
+            case _:
+                raise ValueError(f"Unknown transform `{spec}`; use crlf, uris, deadlines, lessons.")
+
+    @staticmethod
+    def _crlf(line: str) -> str:
+        return line[:-2] + "\n" if line.endswith("\r\n") else line
+
+    @staticmethod
+    def _uris(line: str) -> str:
+        if "](" not in line:
+            return line
+        for link in MarkdownLink.collect_iter(line=line):
+            if not link.is_external():
+                uri = normalize_uri(link.uri_raw)
+                if uri != link.uri_raw:
+                    line = line.replace(f"]({link.uri_raw})", f"]({uri})")
+        return line
+
+    @staticmethod
+    def _deadlines(line: str, days: int) -> str:
+        if "#" not in line:
+            return line
+
+        def bump(mtch: re.Match[str]) -> str:
+            try:
+                return (date.fromisoformat(mtch[0]) + timedelta(days=days)).isoformat()
+            except ValueError:
+                _logger.warning("Deadline `%s` is corrupted; kept as is.", mtch[0])
+                return mtch[0]
+
+        return _RE_DEADLINE.sub(bump, line)
+
+
+@dataclass
+class RewriteResult:
+    """A rewritten note."""
+
+    note_path: pathlib.PosixPath
+    num_lines: int
+    """The number of changed lines."""
+    diff: list[str] | None = None
+    """Unified diff in the dry-run mode."""
+
+
+class NoteRewriter:
+    """Applies line transforms to many notes."""
+
+    def __init__(
+        self, transforms: list[LineTransform], dry_run: bool = False, max_workers: int = 8
+    ) -> None:
+        self.transforms = transforms
+        self.dry_run = dry_run
+        self.max_workers = max_workers
+
+    def rewrite(self, v_notes: Iterable[VNote]) -> list[RewriteResult]:
+        """Rewrite notes in parallel and return results of changed notes only."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = [
+                result for result in executor.map(self.rewrite_note, v_notes) if result is not None
+            ]
+        _logger.debug("%d notes changed.", len(results))
+        return results
+
+    def rewrite_note(self, v_note: VNote) -> RewriteResult | None:
+        """Rewrite one note; None is returned if no line changes."""
+        # Newlines are read as they are, so that CRLF can be seen and kept.
+        with open(v_note.note_path, "r", encoding="utf8", newline="") as note_fd:
+            lines = self._transform_iter(note_fd)
+            # Unchanged lines are only kept until the first change.
+            old_lines: list[str] = []
+            for old_line, new_line in lines:
+                if new_line != old_line:
+                    break
+                old_lines.append(old_line)
+            else:
+                return None
+            new_lines = [*old_lines, new_line]
+            old_lines.append(old_line)
+            num_changed = 1
+
+            if self.dry_run:
+                for old_line, new_line in lines:
+                    old_lines.append(old_line)
+                    new_lines.append(new_line)
+                    num_changed += new_line != old_line
+                rpath = str(v_note.note_path.relative_to(v_note.vault_dir))
+                diff = list(
+                    difflib.unified_diff(old_lines, new_lines, fromfile=rpath, tofile=rpath, n=0)
+                )
+                return RewriteResult(note_path=v_note.note_path, num_lines=num_changed, diff=diff)
+
+            with v_note.open_for_rewrite() as tmp_fd:
+                tmp_fd.writelines(new_lines)
+                for old_line, new_line in lines:
+                    tmp_fd.write(new_line)
+                    num_changed += new_line != old_line
+        _logger.info("Rewrote %d lines in '%s'.", num_changed, v_note.note_path)
+        return RewriteResult(note_path=v_note.note_path, num_lines=num_changed)
+
+    def _transform_iter(self, note_lines: Iterable[str]) -> Iterator[tuple[str, str]]:
+        """Yield every line and its transformed version."""
+        in_code_block = False
+        for note_line in note_lines:
+            if note_line.startswith("```"):
+                in_code_block = not in_code_block
+            new_line = note_line
+            for transform in self.transforms:
+                if transform.in_code or not in_code_block:
+                    new_line = transform.func(new_line)
+            yield note_line, new_line
+
+
+def test_line_transforms() -> None:
+    """Check every transform on lines."""
+
+    def apply(spec: str, line: str) -> str:
+        return LineTransform.from_spec(spec).func(line)
+
+    assert apply("crlf", "a\r\n") == "a\n"
+    assert apply("crlf", "a") == "a"
+    assert apply("deadlines:+3", "* [ ] #2026-12-30/x1 #2026-01-01 x\n") == (
+        "* [ ] #2027-01-02/x1 #2026-01-01 x\n"
+    )
+    assert apply("deadlines:-1", "#2026-02-30/w2") == "#2026-02-30/w2"
+    assert apply("lessons:rust=rs", "#edu/rust/x: #edu/rusty/x") == "#edu/rs/x: #edu/rusty/x"
+    assert apply("uris", "[a](my%20note%2Emd) [b](https://x.org/a%2Eb) [c](x y)") == (
+        "[a](my%20note.md) [b](https://x.org/a%2Eb) [c](x%20y)"
+    )
+    assert normalize_uri("a%28b%29 ü") == "a%28b%29%20ü"
+    assert normalize_uri("a%23b.md#^id") == "a%23b.md#^id"
+    assert (
+        normalize_uri("a%2fb%3Fc%2E%C3%BC%FF.md#H%20%5E1#^id") == "a%2Fb%3Fc.ü%FF.md#H%20%5E1#^id"
+    )
+    assert (
+        apply("uris", "[a](dir/a%2Fb.md) [b](c%20d%3F.md)") == "[a](dir/a%2Fb.md) [b](c%20d%3F.md)"
+    )
+    for spec in ("deadlines:x", "lessons:a", "upper"):
+        try:
+            LineTransform.from_spec(spec)
+        except ValueError:
+            pass
+        else:
+            assert False, f"Malformed spec `{spec}` is accepted"
+
+
+def test_note_rewriter(tmp_path: pathlib.PosixPath) -> None:
+    """Check that only changed notes are rewritten, atomically, and dry runs write nothing."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    changed = vault_dir / "changed.md"
+    changed.write_bytes(b"#2026-01-01/x1 a\r\n```\n#2026-01-01/x1 code\r\n```\n")
+    changed.chmod(0o600)
+    untouched = vault_dir / "untouched.md"
+    untouched.write_bytes(b"nothing\n")
+    untouched_mtime = untouched.stat().st_mtime_ns
+    v_notes = VNote.collect(vault_dirs=[vault_dir], exclude_trash=True)
+    transforms = [LineTransform.from_spec(spec) for spec in ("crlf", "deadlines:+1")]
+
+    results = NoteRewriter(transforms, dry_run=True).rewrite(v_notes)
+    assert [(result.note_path, result.num_lines) for result in results] == [(changed, 2)]
+    assert results[0].diff is not None and "+#2026-01-02/x1 a\n" in results[0].diff
+    assert changed.read_bytes().startswith(b"#2026-01-01/x1 a\r\n")
+
+    NoteRewriter(transforms).rewrite(v_notes)
+    assert changed.read_bytes() == b"#2026-01-02/x1 a\n```\n#2026-01-01/x1 code\n```\n"
+    assert changed.stat().st_mode & 0o777 == 0o600
+    assert untouched.stat().st_mtime_ns == untouched_mtime
+    assert sorted(path.name for path in vault_dir.iterdir()) == ["changed.md", "untouched.md"]
@@ -0,0 +1,335 @@
+"""
+Full-text inverted index of notes.
+
+The index is an SQLite database in dope's cache directory:
+* `notes` holds every indexed note with its modification time and size,
+* `postings` maps a term and a note to the positions of the term in the note.
+
+Positions are pairs (line index, token index in the line); they are delta-encoded and packed
+as varints. Only notes whose modification time or size changed are re-indexed.
+Code blocks are not indexed, see VNote.lines_iter().
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import pathlib
+import re
+import sqlite3
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+from dope.config import get_cache_dir
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+_RE_TOKEN = re.compile(r"\w+")
+_RE_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(line: str) -> list[str]:
+    """Split a line into lowercase terms."""
+    return _RE_TOKEN.findall(line.lower())
+
+
+def encode_positions(positions: list[tuple[int, int]]) -> bytes:
+    """Pack sorted (line, token) pairs; lines are delta-encoded."""
+    out = bytearray()
+    prev_line = 0
+    for line, token in positions:
+        for value in (line - prev_line, token):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        prev_line = line
+    return bytes(out)
+
+
+def decode_positions(data: bytes) -> list[tuple[int, int]]:
+    """Unpack (line, token) pairs packed by encode_positions()."""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    positions = []
+    line = 0
+    for idx in range(0, len(values), 2):
+        line += values[idx]
+        positions.append((line, values[idx + 1]))
+    return positions
+
+
+@dataclass
+class SearchHit:
+    """A note matching a query."""
+
+    vault: str
+    note_rpath: str
+    """Path of the note relative to its vault."""
+    score: float
+    lines: list[int] = field(default_factory=list)
+    """One-based indexes of matching lines."""
+
+
+@dataclass
+class _QueryPart:
+    """A word, a prefix (ends with *), or a phrase (a list of words)."""
+
+    terms: list[str]
+    prefix: bool = False
+
+
+class SearchIndex:
+    """Incrementally maintained full-text index of all notes in vaults."""
+
+    def __init__(self, db_path: pathlib.PosixPath | None = None) -> None:
+        self.db_path = db_path or get_cache_dir() / "search_index.sqlite"
+        self.db = sqlite3.connect(self.db_path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id INTEGER PRIMARY KEY,
+                vault TEXT NOT NULL,
+                rpath TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                UNIQUE (vault, rpath)
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                note_id INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                positions BLOB NOT NULL,
+                PRIMARY KEY (term, note_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_note_id ON postings (note_id);
+            """
+        )
+
+    def close(self) -> None:
+        """Close the database."""
+        self.db.close()
+
+    def update(self, vault_dirs: Iterable[pathlib.PosixPath]) -> tuple[int, int]:
+        """
+        Index new and changed notes, forget deleted ones.
+
+        :return: The number of indexed and removed notes.
+        """
+        num_indexed = num_removed = 0
+        with self.db:
+            for vault_dir in vault_dirs:
+                vault = str(vault_dir)
+                known = {
+                    rpath: (note_id, mtime_ns, size)
+                    for note_id, rpath, mtime_ns, size in self.db.execute(
+                        "SELECT id, rpath, mtime_ns, size FROM notes WHERE vault = ?", (vault,)
+                    )
+                }
+                for v_note in VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True):
+                    rpath = str(v_note.note_path.relative_to(vault_dir))
+                    stat = v_note.note_path.stat()
+                    note = known.pop(rpath, None)
+                    if note is not None:
+                        if note[1:] == (stat.st_mtime_ns, stat.st_size):
+                            continue
+                        self._remove_note(note[0])
+                    self._index_note(v_note, vault, rpath, stat.st_mtime_ns, stat.st_size)
+                    num_indexed += 1
+                for note_id, _, _ in known.values():
+                    self._remove_note(note_id)
+                    num_removed += 1
+        _logger.debug("Indexed %d notes, removed %d notes.", num_indexed, num_removed)
+        return num_indexed, num_removed
+
+    def _remove_note(self, note_id: int) -> None:
+        self.db.execute("DELETE FROM postings WHERE note_id = ?", (note_id,))
+        self.db.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+
+    def _index_note(self, v_note: VNote, vault: str, rpath: str, mtime_ns: int, size: int) -> None:
+        positions: dict[str, list[tuple[int, int]]] = {}
+        for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+            for token_idx, term in enumerate(tokenize(note_line)):
+                positions.setdefault(term, []).append((line_idx, token_idx))
+        cursor = self.db.execute(
+            "INSERT INTO notes (vault, rpath, mtime_ns, size) VALUES (?, ?, ?, ?)",
+            (vault, rpath, mtime_ns, size),
+        )
+        note_id = cursor.lastrowid
+        self.db.executemany(
+            "INSERT INTO postings (term, note_id, count, positions) VALUES (?, ?, ?, ?)",
+            (
+                (term, note_id, len(term_positions), encode_positions(term_positions))
+                for term, term_positions in positions.items()
+            ),
+        )
+
+    def search(
+        self,
+        query: str,
+        vault_dirs: Iterable[pathlib.PosixPath] | None = None,
+        limit: int = 30,
+    ) -> list[SearchHit]:
+        """
+        Return notes matching all parts of the query, best first.
+
+        Query parts are words, prefixes ending with `*`, and phrases in double quotes,
+        e.g. `rust "borrow checker" lifetime*`. Notes are ranked by TF-IDF.
+        """
+        parts = self._parse_query(query)
+        if not parts:
+            return []
+        vaults = [str(vault_dir) for vault_dir in vault_dirs] if vault_dirs is not None else None
+        (num_notes,) = self.db.execute("SELECT COUNT(*) FROM notes").fetchone()
+
+        scores: dict[int, float] | None = None
+        # Matching lines are decoded only for the notes that are returned.
+        lines: dict[int, list[bytes | set[int]]] = {}
+        for part in parts:
+            part_scores, part_lines = self._match_part(part, vaults, num_notes)
+            if scores is None:
+                scores = part_scores
+            else:
+                scores = {
+                    note_id: score + part_scores[note_id]
+                    for note_id, score in scores.items()
+                    if note_id in part_scores
+                }
+            for note_id, note_lines in part_lines.items():
+                lines.setdefault(note_id, []).extend(note_lines)
+            if not scores:
+                return []
+        assert scores is not None
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        hits = []
+        for note_id, score in best:
+            vault, rpath = self.db.execute(
+                "SELECT vault, rpath FROM notes WHERE id = ?", (note_id,)
+            ).fetchone()
+            hit_lines: set[int] = set()
+            for item in lines[note_id]:
+                if isinstance(item, bytes):
+                    hit_lines.update(line for line, _ in decode_positions(item))
+                else:
+                    hit_lines.update(item)
+            hits.append(
+                SearchHit(vault=vault, note_rpath=rpath, score=score, lines=sorted(hit_lines))
+            )
+        return hits
+
+    def _postings(
+        self, term: str, prefix: bool, vaults: list[str] | None
+    ) -> list[tuple[str, int, int, bytes]]:
+        if prefix:
+            sql = "p.term >= ? AND p.term < ?"
+            params: list[str | int] = [term, term + "\U0010ffff"]
+        else:
+            sql = "p.term = ?"
+            params = [term]
+        if vaults is not None:
+            sql += f" AND n.vault IN ({', '.join('?' * len(vaults))})"
+            params.extend(vaults)
+        return self.db.execute(
+            "SELECT p.term, p.note_id, p.count, p.positions FROM postings p "
+            f"JOIN notes n ON n.id = p.note_id WHERE {sql}",
+            params,
+        ).fetchall()
+
+    def _match_part(
+        self, part: _QueryPart, vaults: list[str] | None, num_notes: int
+    ) -> tuple[dict[int, float], dict[int, list[bytes | set[int]]]]:
+        """
+        Return TF-IDF scores and matching lines of notes matching the query part.
+
+        Lines are either encoded positions or decoded line indexes.
+        """
+        if len(part.terms) == 1:
+            rows = self._postings(part.terms[0], part.prefix, vaults)
+            idf = math.log(1 + num_notes / max(len({row[1] for row in rows}), 1))
+            scores: dict[int, float] = {}
+            lines: dict[int, list[bytes | set[int]]] = {}
+            for _, note_id, count, positions in rows:
+                scores[note_id] = scores.get(note_id, 0.0) + (1 + math.log(count)) * idf
+                lines.setdefault(note_id, []).append(positions)
+            return scores, lines
+
+        # A phrase: all terms must follow each other in the same line.
+        # Positions are decoded only for notes that have all terms.
+        term_rows = [
+            {note_id: positions for _, note_id, _, positions in self._postings(term, False, vaults)}
+            for term in part.terms
+        ]
+        candidates = set(term_rows[0]).intersection(*term_rows[1:])
+        matches: dict[int, set[int]] = {}
+        for note_id in candidates:
+            term_positions = [set(decode_positions(rows[note_id])) for rows in term_rows]
+            for line, token in term_positions[0]:
+                if all(
+                    (line, token + offset) in term_positions[offset]
+                    for offset in range(1, len(part.terms))
+                ):
+                    matches.setdefault(note_id, set()).add(line)
+        idf = math.log(1 + num_notes / max(len(matches), 1))
+        scores = {
+            note_id: (1 + math.log(len(note_lines))) * idf * len(part.terms)
+            for note_id, note_lines in matches.items()
+        }
+        return scores, {note_id: [note_lines] for note_id, note_lines in matches.items()}
+
+    @staticmethod
+    def _parse_query(query: str) -> list[_QueryPart]:
+        parts = []
+        for mtch in _RE_QUERY.finditer(query):
+            phrase, word = mtch.groups()
+            if phrase is not None:
+                if terms := tokenize(phrase):
+                    parts.append(_QueryPart(terms=terms))
+            elif word.endswith("*") and (terms := tokenize(word[:-1])):
+                parts.extend(_QueryPart(terms=[term]) for term in terms[:-1])
+                parts.append(_QueryPart(terms=[terms[-1]], prefix=True))
+            else:
+                parts.extend(_QueryPart(terms=[term]) for term in tokenize(word))
+        return parts
+
+
+def test_positions_encoding() -> None:
+    """Check that positions survive encoding and decoding."""
+    positions = [(1, 0), (1, 5), (300, 2), (70000, 200)]
+    assert decode_positions(encode_positions(positions)) == positions
+    assert decode_positions(b"") == []
+
+
+def test_search_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check queries and incremental updates."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    (vault_dir / "a.md").write_text("Rust borrow checker\nThe checker is strict\n")
+    (vault_dir / "b.md").write_text("borrow a book\n```\nrust in code\n```\nrusty nail\n")
+    index = SearchIndex(db_path=tmp_path / "index.sqlite")
+    assert index.update([vault_dir]) == (2, 0)
+    assert index.update([vault_dir]) == (0, 0)
+
+    def search(query: str) -> list[tuple[str, list[int]]]:
+        return [(hit.note_rpath, hit.lines) for hit in index.search(query)]
+
+    assert search("rust") == [("a.md", [1])]
+    assert sorted(search("rust*")) == [("a.md", [1]), ("b.md", [5])]
+    assert search('"borrow checker"') == [("a.md", [1])]
+    assert search('"checker borrow"') == []
+    assert search("borrow strict") == [("a.md", [1, 2])]
+    assert index.search("borrow", vault_dirs=[tmp_path / "other"]) == []
+
+    (vault_dir / "a.md").unlink()
+    (vault_dir / "c.md").write_text("checker\n")
+    assert index.update([vault_dir]) == (1, 1)
+    assert search("checker") == [("c.md", [1])]
+    index.close()
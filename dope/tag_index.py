@@ -0,0 +1,315 @@
+"""
+Index of Obsidian hashtags in notes and a boolean tag-query engine.
+
+Every line that contains '#' (outside of code blocks) is cached together with its note's
+modification time and size, thus every note is read only when it changes. Tasks and lessons
+are special cases of tags, so they are collected from the cached lines too.
+
+Tag queries look like `#edu/rust AND NOT #edu/rust/w`:
+* operators are AND, OR, NOT, and parentheses; adjacent tags mean AND,
+* a tag matches itself and all nested tags, i.e. `#edu` matches `#edu/rust/x`,
+* tags are case-insensitive.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import pathlib
+import re
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.git_changes import GitMark, marks_from_json, marks_to_json, refresh_entries
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+_RE_TAG = re.compile(r"(?<![^\s(\[])#([\w/-]+)")
+_RE_QUERY_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+
+LineKey = tuple[str, int]
+"""Note path and one-based line index."""
+
+
+def collect_tags(line: str) -> list[str]:
+    """
+    Return all tags in the line without '#', lowercase.
+
+    Tags in inline code are ignored. A tag must contain at least one character that is not a digit.
+    """
+    if "#" not in line:
+        return []
+    tags = []
+    # Even parts are outside of inline code; unclosed inline code lasts till the end of the line.
+    for part in line.split("`")[::2]:
+        for tag in _RE_TAG.findall(part):
+            tag = tag.rstrip("/")
+            if tag and not tag.isdigit():
+                tags.append(tag.lower())
+    return tags
+
+
+@dataclass
+class _NoteEntry:
+    vault_dir: str
+    mtime_ns: int
+    size: int
+    lines: list[tuple[int, str]]
+    """One-based index and raw text of every line containing '#'."""
+
+
+class TagIndex:
+    """Cached lines with tags of all notes and postings built from them."""
+
+    CACHE_VERSION = 2
+
+    def __init__(self, cache_path: pathlib.PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "tag_index.json"
+        self.entries: dict[str, _NoteEntry] = {}
+        self.num_read = 0
+        """The number of notes read by the last update."""
+        self.git_marks: dict[str, GitMark] = {}
+        """States of vaults that are git repositories at the last update, see dope.git_changes."""
+        self._postings: dict[str, set[LineKey]] | None = None
+        self._sorted_tags: list[str] = []
+        self._load()
+
+    def update(self, vault_dirs: Iterable[pathlib.PosixPath]) -> None:
+        """Read new and changed notes of the vaults, forget deleted ones."""
+        # Entries are kept in the walk order, so that collected tasks and lessons are ordered
+        # the same way as without the index.
+        self.entries, self.num_read = refresh_entries(
+            self.entries, list(vault_dirs), self.git_marks, self._read_note
+        )
+        self._postings = None
+        _logger.debug("%d notes, %d read.", len(self.entries), self.num_read)
+        self._save()
+
+    @staticmethod
+    def _read_note(v_note: VNote, stat: os.stat_result) -> _NoteEntry:
+        lines = [
+            (line_idx, note_line)
+            for line_idx, note_line in v_note.lines_iter(lazy=False, remove_newline=False)
+            if "#" in note_line
+        ]
+        return _NoteEntry(str(v_note.vault_dir), stat.st_mtime_ns, stat.st_size, lines)
+
+    def lines_iter(
+        self,
+        vault_dirs: Iterable[pathlib.PosixPath],
+        note_filter: Callable[[VNote], bool] | None = None,
+    ) -> Iterator[tuple[VNote, list[tuple[int, str]]]]:
+        """Yield notes of the vaults accepted by the filter with their lines containing '#'."""
+        vaults = {str(vault_dir) for vault_dir in vault_dirs}
+        for key, entry in self.entries.items():
+            if entry.vault_dir in vaults and entry.lines:
+                v_note = VNote(pathlib.PosixPath(entry.vault_dir), pathlib.PosixPath(key))
+                if note_filter is None or note_filter(v_note):
+                    yield v_note, entry.lines
+
+    def tags(self) -> list[str]:
+        """Return all known tags, sorted."""
+        self._build_postings()
+        return list(self._sorted_tags)
+
+    def query(
+        self, query: str, vault_dirs: Iterable[pathlib.PosixPath] | None = None
+    ) -> dict[str, list[int]]:
+        """
+        Return lines matching the tag query grouped by note paths.
+
+        NOT is relative to all lines with tags.
+        """
+        postings = self._build_postings()
+        tokens = _RE_QUERY_TOKEN.findall(query)
+        if not tokens:
+            return {}
+        universe: set[LineKey] = set().union(*postings.values()) if postings else set()
+        parser = _QueryParser(tokens=tokens, match_tag=self._match_tag, universe=universe)
+        matches = parser.parse()
+        vaults = {str(vault_dir) for vault_dir in vault_dirs} if vault_dirs is not None else None
+        result: dict[str, list[int]] = {}
+        for note, line_idx in sorted(matches):
+            if vaults is None or self.entries[note].vault_dir in vaults:
+                result.setdefault(note, []).append(line_idx)
+        return result
+
+    def _match_tag(self, tag: str) -> set[LineKey]:
+        """Return lines with the tag or any tag nested in it."""
+        postings = self._build_postings()
+        tag = tag.lstrip("#").rstrip("/").lower()
+        matches: set[LineKey] = set(postings.get(tag, ()))
+        idx = bisect.bisect_left(self._sorted_tags, tag + "/")
+        while idx < len(self._sorted_tags) and self._sorted_tags[idx].startswith(tag + "/"):
+            matches |= postings[self._sorted_tags[idx]]
+            idx += 1
+        return matches
+
+    def _build_postings(self) -> dict[str, set[LineKey]]:
+        if self._postings is None:
+            self._postings = {}
+            for key, entry in self.entries.items():
+                for line_idx, note_line in entry.lines:
+                    for tag in collect_tags(note_line):
+                        self._postings.setdefault(tag, set()).add((key, line_idx))
+            self._sorted_tags = sorted(self._postings)
+        return self._postings
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path, self.CACHE_VERSION, "Tag index cache has an old format; rebuilding."
+        )
+        if cache is None:
+            return
+        self.entries = {
+            key: _NoteEntry(
+                vault_dir=item["vault_dir"],
+                mtime_ns=item["mtime_ns"],
+                size=item["size"],
+                lines=list(map(tuple, item["lines"])),
+            )
+            for key, item in cache["entries"].items()
+        }
+        self.git_marks = marks_from_json(cache.get("git", {}))
+
+    def _save(self) -> None:
+        cache = {
+            "entries": {
+                key: {
+                    "vault_dir": entry.vault_dir,
+                    "mtime_ns": entry.mtime_ns,
+                    "size": entry.size,
+                    "lines": entry.lines,
+                }
+                for key, entry in self.entries.items()
+            },
+            "git": marks_to_json(self.git_marks),
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def note_lines_iter(
+    vault_dirs: list[pathlib.PosixPath],
+    tag_index: TagIndex | None = None,
+    note_filter: Callable[[VNote], bool] | None = None,
+) -> Iterator[tuple[VNote, list[tuple[int, str]]]]:
+    """
+    Yield notes of the vaults with their lines; notes rejected by the filter are not read.
+
+    Without an index all lines are read from the notes; with an updated index only the cached
+    lines containing '#' are yielded, which is enough to find tasks and lessons.
+    """
+    if tag_index is not None:
+        yield from tag_index.lines_iter(vault_dirs, note_filter=note_filter)
+        return
+    for v_note in VNote.collect_iter(vault_dirs=vault_dirs, exclude_trash=True):
+        if note_filter is None or note_filter(v_note):
+            yield v_note, list(v_note.lines_iter(lazy=False, remove_newline=False))
+
+
+class _QueryParser:
+    """
+    Recursive descent parser and evaluator of tag queries.
+
+    expr   := term (OR term)*
+    term   := factor (AND? factor)*
+    factor := NOT factor | '(' expr ')' | tag
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, tokens: list[str], match_tag: Any, universe: set[LineKey]) -> None:
+        self.tokens = tokens
+        self.pos = 0
+        self.match_tag = match_tag
+        self.universe = universe
+
+    def parse(self) -> set[LineKey]:
+        """Evaluate the whole query."""
+        result = self._expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected `{self.tokens[self.pos]}` in the tag query.")
+        return result
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _expr(self) -> set[LineKey]:
+        result = self._term()
+        while self._peek() == "OR":
+            self.pos += 1
+            result = result | self._term()
+        return result
+
+    def _term(self) -> set[LineKey]:
+        result = self._factor()
+        while (token := self._peek()) is not None and token not in {"OR", ")"}:
+            if token == "AND":
+                self.pos += 1
+            result = result & self._factor()
+        return result
+
+    def _factor(self) -> set[LineKey]:
+        token = self._peek()
+        if token is None:
+            raise ValueError("Unexpected end of the tag query.")
+        self.pos += 1
+        if token == "NOT":
+            return self.universe - self._factor()
+        if token == "(":
+            result = self._expr()
+            if self._peek() != ")":
+                raise ValueError("Missing `)` in the tag query.")
+            self.pos += 1
+            return result
+        if token in {"AND", "OR", ")"}:
+            raise ValueError(f"Unexpected `{token}` in the tag query.")
+        matches: set[LineKey] = self.match_tag(token)
+        return matches
+
+
+def test_collect_tags() -> None:
+    """Check which tags are recognized."""
+    assert not collect_tags("")
+    assert not collect_tags("# Heading")
+    assert collect_tags("* [ ] #2024-09-10/x2: Do it.") == ["2024-09-10/x2"]
+    assert collect_tags("#edu/Rust/x #idea, (#a) not#tag #1984") == ["edu/rust/x", "idea", "a"]
+    assert collect_tags("`#code` #real `#unclosed") == ["real"]
+    assert not collect_tags("[link](note.md#section)")
+
+
+def test_tag_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check boolean and hierarchical queries and incremental updates."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    (vault_dir / "a.md").write_text("#edu/rust/x one\n#edu/rust/w two\n```\n#edu/rust/n\n```\n")
+    (vault_dir / "b.md").write_text("#edu/cpp/x three\nno tags\n#idea #edu/rust/n\n")
+    cache_path = tmp_path / "tag_index.json"
+    index = TagIndex(cache_path=cache_path)
+    index.update([vault_dir])
+    assert index.num_read == 2
+    note_a, note_b = str(vault_dir / "a.md"), str(vault_dir / "b.md")
+
+    assert index.query("#edu/rust") == {note_a: [1, 2], note_b: [3]}
+    assert index.query("#edu/rust AND NOT #edu/rust/w") == {note_a: [1], note_b: [3]}
+    assert index.query("#idea #edu") == {note_b: [3]}
+    assert index.query("#idea OR (#edu/cpp)") == {note_b: [1, 3]}
+    assert not index.query("#edu/ru")
+    assert index.tags() == ["edu/cpp/x", "edu/rust/n", "edu/rust/w", "edu/rust/x", "idea"]
+
+    index = TagIndex(cache_path=cache_path)
+    index.update([vault_dir])
+    assert index.num_read == 0
+    (vault_dir / "a.md").unlink()
+    index.update([vault_dir])
+    assert index.query("#edu/rust") == {note_b: [3]}
+    try:
+        index.query("#edu AND")
+    except ValueError:
+        pass
+    else:
+        assert False, "Incomplete query is accepted"
@@ -2,49 +2,125 @@
 
 from __future__ import annotations
 
+import calendar
 import dataclasses
 import logging
 import pathlib
 import re
-from collections.abc import Generator
+from collections.abc import Generator, Iterator
 from dataclasses import dataclass
-from datetime import date
+from datetime import date, timedelta
 
+from dope.export import Record
+from dope.instrument import Instrument
+from dope.tag_index import TagIndex, note_lines_iter
+from dope.task_query import TaskQuery
 from dope.v_note import VNote
 
 _logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class Recurrence:
+    """
+    Repetition of a task, e.g. `every-2w` in `#2026-10-20/x2/every-2w`.
+
+    A series is infinite; its occurrences are dates computed from the start on demand and never
+    stored. A monthly or yearly series that starts on the 31st falls on the last day of
+    shorter months.
+    """
+
+    num: int
+    unit: str
+    """`d`, `w`, `m`, or `y`: days, weeks, months, or years."""
+
+    re_obj = re.compile(r"every-(?P<num>[1-9]\d*)(?P<unit>[dwmy])")
+
+    @classmethod
+    def parse(cls, text: str) -> Recurrence | None:
+        """Parse `every-<num><unit>`; None is returned if it is malformed."""
+        if (mtch := cls.re_obj.fullmatch(text)) is None:
+            return None
+        return cls(num=int(mtch["num"]), unit=mtch["unit"])
+
+    def __str__(self) -> str:
+        return f"{self.num}{self.unit}"
+
+    def nth(self, start: date, idx: int) -> date:
+        """Return the occurrence number `idx` of the series; the start is number 0."""
+        if self.unit in {"d", "w"}:
+            return start + timedelta(days=idx * self.num * (7 if self.unit == "w" else 1))
+        months = start.month - 1 + idx * self.num * (12 if self.unit == "y" else 1)
+        year, month = start.year + months // 12, months % 12 + 1
+        return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+    def occurrences_iter(
+        self, start: date, first: date | None = None, last: date | None = None
+    ) -> Iterator[date]:
+        """
+        Yield occurrences of the series from the start that fall between the first and the last
+        days. Without the last day the generator is infinite; the first occurrence is found
+        without walking through the preceding ones.
+        """
+        idx = 0
+        if first is not None and first > start:
+            if self.unit in {"d", "w"}:
+                step = self.num * (7 if self.unit == "w" else 1)
+                idx = -(-(first - start).days // step)
+            else:
+                step = self.num * (12 if self.unit == "y" else 1)
+                idx = ((first.year - start.year) * 12 + first.month - start.month) // step
+        while True:
+            try:
+                day = self.nth(start, idx)
+            except (OverflowError, ValueError):
+                return  # Beyond year 9999.
+            idx += 1
+            if first is not None and day < first:
+                continue
+            if last is not None and day > last:
+                return
+            yield day
+
+
 @dataclass
 class Task:
     """Encapsulates all information about a task."""
 
     SORTING_PRECEDENCE = -1
     """It is considered when listing tasks."""
+    TYPE_LETTER = ""
+    """The letter of the task type in tags."""
 
     descr: str
     vault: str
     note: str
     priority: int
     deadline: date
+    """The deadline of a one-off task; the start of a recurring one."""
+    every: Recurrence | None = None
+    """The repetition of a recurring task."""
 
     re_obj_full_tag = re.compile(
         r".*"  # Optional symbols before the tag.
-        + r"(?P<full_tag>\#.*?\/(n|x|w)\d)"  # The tag itself.
+        + r"(?P<full_tag>\#.*?\/(n|x|w)\d(\/every-\w*)?)"  # The tag itself.
         + r"(\s.*|\:|$)"
     )  # Either nothing, or a colon, or at least one space after the tag.
     """
-    A full tag looks like #2023-12-31/x2.
+    A full tag looks like #2023-12-31/x2, or #2023-12-31/x2/every-1w for a recurring task.
     """
     re_obj_deadline = re.compile(r"^(?P<year>\d\d\d\d)-(?P<month>\d\d)-(?P<day>\d\d)$")
 
     @classmethod
     def _parse_line(
-        cls, note_line: str, v_note: VNote, line_num: int
+        cls, note_line: str, v_note: VNote, line_num: int, query: TaskQuery | None = None
     ) -> Generator[Task, None, None]:
-        """Collect all tasks from the given line."""
+        """Collect all tasks from the given line that match the optional query."""
+        # pylint: disable=too-many-locals
         if "#" not in note_line:
             return
+        if query is not None and not query.match_line(note_line):
+            return
 
         matches = cls.re_obj_full_tag.findall(note_line)
         if len(matches) > 1:
@@ -63,17 +139,21 @@ class Task:
             # Correct errors in a tag and emit warnings here.
             tag_parts = full_tag.split("/")
 
+            every = Recurrence.parse(tag_parts[2]) if len(tag_parts) == 3 else None
             tag_ok = (
-                len(tag_parts) == 2
+                len(tag_parts) in {2, 3}
                 and tag_parts[0][0] == "#"
                 and tag_parts[1][0] in {"n", "x", "w"}
                 and tag_parts[1][1] in {"1", "2", "3"}
+                and (len(tag_parts) == 2 or every is not None)
             )
             if not tag_ok:
                 _logger.error(
                     "Corrupted tag `%s` in '%s/%s', line %d.", full_tag, vault, note, line_num
                 )
             priority = int(tag_parts[1][1:]) if len(tag_parts) > 1 else 1
+            if query is not None and not query.match_tag(task_cls.TYPE_LETTER, priority):
+                return
 
             mtch_deadline = cls.re_obj_deadline.fullmatch(tag_parts[0][1:])
             if mtch_deadline is not None:
@@ -85,13 +165,21 @@ class Task:
             else:
                 deadline = date.today()
                 _logger.error("Tag `%s` in `%s/%s` has corrupted deadline.", full_tag, vault, note)
-
+            if query is not None and not query.match_deadline(
+                deadline if every is None else cls.current_deadline_of(deadline, every)
+            ):
+                return
+
+            descr = cls.clean_line(note_line)
+            if query is not None and not query.match_descr(descr):
+                return
             yield task_cls(
-                descr=cls.clean_line(note_line),
+                descr=descr,
                 vault=vault,
                 note=note,
                 priority=priority,
                 deadline=deadline,
+                every=every,
             )
 
     @classmethod
@@ -114,65 +202,130 @@ class Task:
     @classmethod
     def get_task_class(cls, full_tag: str) -> type[TaskNext] | type[TaskWait] | type[TaskNow]:
         """Determine concrete type of a task using the given tag."""
-        if full_tag[-2] == "x":
+        type_letter = full_tag.split("/every-")[0][-2]
+        if type_letter == "x":
             return TaskNext
-        if full_tag[-2] == "w":
+        if type_letter == "w":
             return TaskWait
-        if full_tag[-2] == "n":
+        if type_letter == "n":
             return TaskNow
         raise RuntimeError
 
     @classmethod
-    def collect(cls, vault_dirs: list[pathlib.PosixPath]) -> list[Task]:
-        """Find all tasks in all vaults."""
-        tasks: list[Task] = []
+    def collect(
+        cls,
+        vault_dirs: list[pathlib.PosixPath],
+        tag_index: TagIndex | None = None,
+        query: TaskQuery | None = None,
+    ) -> list[Task]:
+        """
+        Find all tasks in all vaults.
+
+        If an updated tag index is given, only its cached lines are parsed.
+        If a query is given, only matching tasks are collected; its cheap conditions
+        are checked during the walk, see TaskQuery.
+        """
+        return list(cls.collect_iter(vault_dirs=vault_dirs, tag_index=tag_index, query=query))
 
+    @classmethod
+    def collect_iter(
+        cls,
+        vault_dirs: list[pathlib.PosixPath],
+        tag_index: TagIndex | None = None,
+        query: TaskQuery | None = None,
+    ) -> Iterator[Task]:
+        """Walk through all vaults and yield tasks note by note as they are found."""
         num_lines = 0
-        for v_note in VNote.collect_iter(vault_dirs=vault_dirs, exclude_trash=True):
-            with open(v_note.note_path, "r", encoding="utf8") as note_fd:
-                note_lines = note_fd.readlines()
-            in_code_block = False
-            for line_num, note_line in enumerate(note_lines, start=1):
-                if note_line.startswith("```"):
-                    in_code_block = not in_code_block
-                if not in_code_block:
-                    num_lines += 1
+        num_tasks = 0
+        if query is not None:
+            vault_dirs = query.filter_vaults(vault_dirs)
+        for v_note, note_lines in note_lines_iter(
+            vault_dirs=vault_dirs,
+            tag_index=tag_index,
+            note_filter=query.match_note if query is not None else None,
+        ):
+            with Instrument.span("parse_tasks", lines=len(note_lines)):
+                tasks = [
+                    task
+                    for line_num, note_line in note_lines
                     for task in cls._parse_line(
-                        note_line=note_line, v_note=v_note, line_num=line_num
-                    ):
-                        tasks.append(task)
-                        _logger.info("%s", task)
-        _logger.debug("Checked %d lines, collected %d tasks", num_lines, len(tasks))
-
-        return tasks
+                        note_line=note_line, v_note=v_note, line_num=line_num, query=query
+                    )
+                ]
+            num_lines += len(note_lines)
+            for task in tasks:
+                num_tasks += 1
+                _logger.info("%s", task)
+                yield task
+        _logger.debug("Checked %d lines, collected %d tasks", num_lines, num_tasks)
+
+    def to_record(self) -> Record:
+        """Return the task as a flat record for export."""
+        return {
+            "type": self.TYPE_LETTER,
+            "priority": self.priority,
+            "deadline": self.deadline.isoformat(),
+            "every": None if self.every is None else str(self.every),
+            "vault": self.vault,
+            "note": self.note,
+            "descr": self.descr,
+        }
+
+    @staticmethod
+    def current_deadline_of(start: date, every: Recurrence, today: date | None = None) -> date:
+        """Return the first occurrence of the series from today on."""
+        return next(every.occurrences_iter(start, first=today or date.today()), start)
+
+    def current_deadline(self, today: date | None = None) -> date:
+        """Return the deadline, or the first occurrence from today on for a recurring task."""
+        if self.every is None:
+            return self.deadline
+        return self.current_deadline_of(self.deadline, self.every, today=today)
+
+    def occurrences_iter(
+        self, first: date | None = None, last: date | None = None
+    ) -> Iterator[date]:
+        """
+        Yield deadlines of the task between the first and the last days: the only deadline of a
+        one-off task, or occurrences of a recurring one; see Recurrence.occurrences_iter().
+        """
+        if self.every is not None:
+            yield from self.every.occurrences_iter(self.deadline, first=first, last=last)
+        elif (first is None or first <= self.deadline) and (last is None or self.deadline <= last):
+            yield self.deadline
 
     def get_days_to_dealine(self) -> int:
         """Calculate the number of days to the deadline."""
-        return (self.deadline - date.today()).days
+        return (self.current_deadline() - date.today()).days
 
     def get_deadline_string(self) -> str:
-        """Return the deadline in the format YYYY-MM-DD-DOW."""
-        weekday_idx = self.deadline.weekday()  # Monday is 0 and Sunday is 6
+        """Return the deadline in the format YYYY-MM-DD-DOW, and the repetition if any."""
+        deadline = self.current_deadline()
+        weekday_idx = deadline.weekday()  # Monday is 0 and Sunday is 6
         weekday_str = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"][weekday_idx]
-        return str(self.deadline) + " " + weekday_str
+        every_str = "" if self.every is None else f", every {self.every}"
+        return str(deadline) + " " + weekday_str + every_str
 
 
 class TaskNext(Task):
     """Encapsulates all information about a next action."""
 
     SORTING_PRECEDENCE = 1
+    TYPE_LETTER = "x"
 
 
 class TaskWait(Task):
     """Encapsulates all information about a pending action."""
 
     SORTING_PRECEDENCE = 2  # lowest
+    TYPE_LETTER = "w"
 
 
 class TaskNow(Task):
     """Encapsulates all information about a current action."""
 
     SORTING_PRECEDENCE = 0  # highest
+    TYPE_LETTER = "n"
 
 
 def test_task_parse_match_tag() -> None:
@@ -204,6 +357,8 @@ def test_task_parse_match_tag() -> None:
         TestCase("#2020-09-09/n3: abcd", True, "#2020-09-09/n3", TaskNow),
         TestCase("#2020-09-09/n3:", True, "#2020-09-09/n3", TaskNow),
         TestCase(" #2020-09-09/n3:", True, "#2020-09-09/n3", TaskNow),
+        TestCase("abcd #2020-09-09/x2/every-1w abcd", True, "#2020-09-09/x2/every-1w", TaskNext),
+        TestCase("#2020-09-09/w1/every-3m:", True, "#2020-09-09/w1/every-3m", TaskWait),
         TestCase("#week", False, None, None),
         TestCase("#now", False, None, None),
         TestCase("#xyz", False, None, None),
@@ -219,6 +374,78 @@ def test_task_parse_match_tag() -> None:
             assert full_tag == test_case.full_tag, (
                 f"Tag expected '{test_case.full_tag}', got '{full_tag}'."
             )
+            assert Task.get_task_class(test_case.full_tag) == test_case.task_class
 
         else:
             assert not match, f"No tag expected in '{test_case.string}', but got '{full_tag}'."
+
+
+def test_recurrence() -> None:
+    """Check occurrences of series and parsing of recurring tasks."""
+    # pylint: disable=protected-access
+    start = date(2026, 1, 31)
+    weekly, monthly = Recurrence.parse("every-2w"), Recurrence.parse("every-1m")
+    assert weekly is not None and monthly is not None and Recurrence.parse("every-0d") is None
+    assert list(weekly.occurrences_iter(start, first=date(2026, 2, 1), last=date(2026, 3, 14))) == [
+        date(2026, 2, 14),
+        date(2026, 2, 28),
+        date(2026, 3, 14),
+    ]
+    months = monthly.occurrences_iter(start, first=date(2026, 2, 2))
+    assert [next(months) for _ in range(3)] == [
+        date(2026, 2, 28),
+        date(2026, 3, 31),
+        date(2026, 4, 30),
+    ]
+    assert list(monthly.occurrences_iter(start, first=date(9999, 12, 1))) == [date(9999, 12, 31)]
+
+    v_note = VNote(pathlib.PosixPath("/vault"), pathlib.PosixPath("/vault/Chores.md"))
+    line = "* [ ] #2026-01-31/x2/every-2w Water the plants"
+    (task,) = Task._parse_line(line, v_note, line_num=1)
+    assert (task.descr, task.every) == ("Water the plants", weekly)
+    assert task.current_deadline(today=date(2026, 3, 1)) == date(2026, 3, 14)
+    assert task.to_record()["every"] == "2w"
+    query = TaskQuery.parse("due:<=14d")
+    assert list(Task._parse_line(line, v_note, line_num=1, query=query))
+    corrupted = "* [ ] #2026-01-31/x2/every-2q Water"
+    (task,) = Task._parse_line(corrupted, v_note, line_num=1)
+    assert task.every is None
+
+
+def test_collect_with_tag_index(tmp_path: pathlib.PosixPath) -> None:
+    """Check that tasks collected from the index are the same as from notes."""
+    # pylint: disable=import-outside-toplevel
+    from dope.bench import vault_gen
+
+    vault_dir = vault_gen.generate_vault(
+        tmp_path / "vault", vault_gen.VaultSpec(num_notes=40, task_ratio=0.2, lesson_ratio=0.2)
+    )
+    index = TagIndex(cache_path=tmp_path / "tag_index.json")
+    index.update([vault_dir])
+    tasks = Task.collect(vault_dirs=[vault_dir])
+    assert tasks
+    assert Task.collect(vault_dirs=[vault_dir], tag_index=index) == tasks
+
+
+def test_task_query_pushdown(tmp_path: pathlib.PosixPath) -> None:
+    """Check that tasks collected with a query are the matching tasks of a full collection."""
+    # pylint: disable=import-outside-toplevel
+    from dope.bench import vault_gen
+
+    vault_dir = vault_gen.generate_vault(
+        tmp_path / "vault", vault_gen.VaultSpec(num_notes=40, task_ratio=0.3)
+    )
+    tasks = Task.collect(vault_dirs=[vault_dir])
+    for query_str in ("type:x prio:1,2", "due:>-300d due:<100d note:~1", "text:alpha", "vault:x"):
+        query = dataclasses.replace(TaskQuery.parse(query_str), today=date(2026, 6, 15))
+        expected = [
+            task
+            for task in tasks
+            if query.filter_vaults([vault_dir])
+            and all(word in task.note for word in query.note_words)
+            and query.match_tag(task.TYPE_LETTER, task.priority)
+            and query.match_deadline(task.deadline)
+            and query.match_descr(task.descr)
+        ]
+        assert Task.collect(vault_dirs=[vault_dir], query=query) == expected
+        assert 0 < len(expected) < len(tasks) or query_str == "vault:x"
@@ -0,0 +1,194 @@
+"""
+Query language of tasks.
+
+A query is a list of space-separated conditions; all of them must hold:
+* `type:x,w` - next (x), pending (w), or current (n) tasks,
+* `prio:1,2` - priorities,
+* `due:<7d` - days to the deadline; operators are <, <=, >, >=, =; units are d and w,
+* `vault:work` - vaults whose names contain any of the given words, like `--vault`,
+* `note:proj` - notes named exactly so, `note:~proj` - notes whose names contain the word,
+* `text:"send invoice"` - descriptions containing the text; bare words mean the same.
+
+A query is compiled to a plan of predicates, ordered from the cheapest: vaults are checked
+before the walk, notes before they are read, lines and tags before tasks are built,
+and only the remaining tasks are checked against their deadlines and descriptions.
+"""
+
+from __future__ import annotations
+
+import logging
+import operator
+import pathlib
+import re
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+_RE_CONDITION = re.compile(r'(?:(?P<key>\w+):)?(?:"(?P<quoted>[^"]*)"|(?P<value>\S+))')
+_RE_DUE = re.compile(r"(?P<op><=|>=|<|>|=)(?P<num>-?\d+)(?P<unit>[dw])")
+_OPERATORS: dict[str, Callable[[int, int], bool]] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+}
+
+
+@dataclass
+class TaskQuery:
+    """A compiled task query; None or an empty list means that a condition is not set."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    types: set[str] | None = None
+    """Task type letters: x, w, n."""
+    priorities: set[int] | None = None
+    due: list[tuple[str, int]] = field(default_factory=list)
+    """Operators and days to the deadline."""
+    vaults: list[str] | None = None
+    notes: list[str] = field(default_factory=list)
+    """Exact note names."""
+    note_words: list[str] = field(default_factory=list)
+    """Words contained in note names."""
+    texts: list[str] = field(default_factory=list)
+    """Lowercase texts contained in descriptions."""
+    today: date | None = None
+    """The day `due:` counts from; the current day if not set."""
+
+    @classmethod
+    def parse(cls, query: str) -> TaskQuery:
+        """Compile the query; ValueError is raised if it is malformed."""
+        task_query = cls()
+        for mtch in _RE_CONDITION.finditer(query):
+            key = (mtch["key"] or "text").lower()
+            value = mtch["quoted"] if mtch["quoted"] is not None else mtch["value"]
+            values = [item for item in value.split(",") if item]
+            if key == "type":
+                if not set(values) <= {"x", "w", "n"}:
+                    raise ValueError(f"Unknown task type in `{mtch[0]}`; use x, w, or n.")
+                task_query.types = (task_query.types or {"x", "w", "n"}) & set(values)
+            elif key == "prio":
+                if not set(values) <= {"1", "2", "3"}:
+                    raise ValueError(f"Unknown priority in `{mtch[0]}`; use 1, 2, or 3.")
+                priorities = {int(item) for item in values}
+                task_query.priorities = (task_query.priorities or {1, 2, 3}) & priorities
+            elif key == "due":
+                task_query.due.append(cls._parse_due(value=value, condition=mtch[0]))
+            elif key == "vault":
+                task_query.vaults = (task_query.vaults or []) + values
+            elif key == "note":
+                if value.startswith("~"):
+                    task_query.note_words.append(value[1:].lower())
+                else:
+                    task_query.notes.append(value)
+            elif key == "text":
+                task_query.texts.append(value.lower())
+            else:
+                raise ValueError(f"Unknown condition `{mtch[0]}`.")
+        return task_query
+
+    @staticmethod
+    def _parse_due(value: str, condition: str) -> tuple[str, int]:
+        """Return the operator and days of a deadline condition."""
+        if (mtch_due := _RE_DUE.fullmatch(value)) is None:
+            raise ValueError(f"Malformed deadline `{condition}`, e.g. `due:<7d`.")
+        days = int(mtch_due["num"]) * (7 if mtch_due["unit"] == "w" else 1)
+        return mtch_due["op"], days
+
+    def restrict(
+        self, types: set[str] | None = None, priorities: set[int] | None = None
+    ) -> TaskQuery:
+        """Add conditions of the type and priority flags to the query."""
+        if types is not None:
+            self.types = types if self.types is None else self.types & types
+        if priorities is not None:
+            self.priorities = (
+                priorities if self.priorities is None else self.priorities & priorities
+            )
+        return self
+
+    def filter_vaults(self, vault_dirs: list[pathlib.PosixPath]) -> list[pathlib.PosixPath]:
+        """Return vaults matching the query; checked before the walk."""
+        if self.vaults is None:
+            return vault_dirs
+        return [
+            vault_dir
+            for vault_dir in vault_dirs
+            if any(word in vault_dir.name for word in self.vaults)
+        ]
+
+    def match_note(self, v_note: VNote) -> bool:
+        """Whether tasks of the note can match; checked before the note is read."""
+        stem = v_note.note_path.stem
+        if any(stem != note for note in self.notes):
+            return False
+        return all(word in stem.lower() for word in self.note_words)
+
+    def match_line(self, note_line: str) -> bool:
+        """Whether a task in the line can match; checked before the line is parsed."""
+        if not self.texts:
+            return True
+        note_line = note_line.lower()
+        # Cleaning a description may join spaces, thus words are checked one by one.
+        return all(word in note_line for text in self.texts for word in text.split())
+
+    def match_tag(self, task_type: str, priority: int) -> bool:
+        """Whether a task with the tag can match; checked before the task is built."""
+        if self.types is not None and task_type not in self.types:
+            return False
+        return self.priorities is None or priority in self.priorities
+
+    def match_deadline(self, deadline: date, today: date | None = None) -> bool:
+        """Whether the deadline matches; checked before the description is cleaned."""
+        days = (deadline - (today or self.today or date.today())).days
+        return all(_OPERATORS[op](days, limit) for op, limit in self.due)
+
+    def match_descr(self, descr: str) -> bool:
+        """Whether the cleaned description contains all texts."""
+        descr = descr.lower()
+        return all(text in descr for text in self.texts)
+
+
+def test_task_query_parse() -> None:
+    """Check parsing of conditions and malformed queries."""
+    query = TaskQuery.parse('type:x,w prio:1,2 due:<2w vault:work note:~Proj text:"an invoice" pay')
+    assert query.types == {"x", "w"}
+    assert query.priorities == {1, 2}
+    assert query.due == [("<", 14)]
+    assert query.vaults == ["work"]
+    assert query.note_words == ["proj"]
+    assert query.texts == ["an invoice", "pay"]
+    assert query.restrict(types={"x", "n"}).types == {"x"}
+    assert TaskQuery.parse("").restrict(priorities={3}).priorities == {3}
+    for malformed in ("type:y", "prio:4", "due:7d", "due:<7m", "owner:me"):
+        try:
+            TaskQuery.parse(malformed)
+        except ValueError:
+            pass
+        else:
+            assert False, f"Malformed query `{malformed}` is accepted"
+
+
+def test_task_query_match() -> None:
+    """Check the predicates of a plan."""
+    query = TaskQuery.parse('note:~proj due:>=0d due:<=7d text:"send invoice"')
+    vault_dir = pathlib.PosixPath("/vaults/work")
+    assert query.match_note(VNote(vault_dir, vault_dir / "Project X.md"))
+    assert not query.match_note(VNote(vault_dir, vault_dir / "Home.md"))
+    assert query.match_line("* [ ] #2026-01-01/x1 Send  the Invoice, send invoice")
+    assert not query.match_line("* [ ] #2026-01-01/x1 Send money")
+    today = date(2026, 1, 1)
+    assert query.match_deadline(today, today=today)
+    assert query.match_deadline(today + timedelta(days=7), today=today)
+    assert not query.match_deadline(today - timedelta(days=1), today=today)
+    assert query.match_descr("Send invoice")
+    assert TaskQuery.parse("note:Home").match_note(VNote(vault_dir, vault_dir / "Home.md"))
+    assert TaskQuery.parse("vault:wo,x").filter_vaults([vault_dir, vault_dir.parent / "home"]) == [
+        vault_dir
+    ]
+    assert not TaskQuery.parse("type:x prio:1").match_tag("x", 2)
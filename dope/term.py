@@ -1,5 +1,20 @@
 """Terminal utilities"""
 
+from __future__ import annotations
+
+import contextlib
+import functools
+import io
+import logging
+import os
+import shutil
+import subprocess as sp
+import sys
+from collections.abc import Iterator
+from typing import IO
+
+_logger = logging.getLogger(__name__)
+
 
 class Term:
     """
@@ -18,32 +33,165 @@ class Term:
     _UNDERLINE = "\033[4m"
     _END = "\033[0m"
 
+    _enabled = True
+    """Styles are not applied when disabled, e.g. when the output is not a terminal."""
+
+    @classmethod
+    def set_enabled(cls, enabled: bool) -> None:
+        """Turn all styles on or off."""
+        cls._enabled = enabled
+        _styled.cache_clear()
+
+    @classmethod
+    def _apply(cls, code: str, text: str) -> str:
+        return code + text + cls._END if cls._enabled else text
+
+    @classmethod
+    def styled(cls, text: str, *styles: str) -> str:
+        """
+        Apply styles to the text, e.g. styled(text, "bold", "green") == bold(green(text)).
+
+        The most recent results are cached, thus it is good for short strings that repeat a lot,
+        e.g. prefixes; the cache is bounded, so that unique strings do not grow it.
+        """
+        return _styled(text, styles)
+
     @classmethod
     def underline(cls, text: str) -> str:
         """Convert text to underlined text."""
-        return cls._UNDERLINE + text + cls._END
+        return cls._apply(cls._UNDERLINE, text)
 
     @classmethod
     def bold(cls, text: str) -> str:
         """Convert text to bold text."""
-        return cls._BOLD + text + cls._END
+        return cls._apply(cls._BOLD, text)
 
     @classmethod
     def red(cls, text: str) -> str:
         """Output the text in red color."""
-        return cls._RED + text + cls._END
+        return cls._apply(cls._RED, text)
 
     @classmethod
     def green(cls, text: str) -> str:
         """Output the text in green color."""
-        return cls._GREEN + text + cls._END
+        return cls._apply(cls._GREEN, text)
 
     @classmethod
     def yellow(cls, text: str) -> str:
         """Output the text in yellow color."""
-        return cls._YELLOW + text + cls._END
+        return cls._apply(cls._YELLOW, text)
 
     @classmethod
     def cyan(cls, text: str) -> str:
         """Output the text in cyan color."""
-        return cls._CYAN + text + cls._END
+        return cls._apply(cls._CYAN, text)
+
+
+@functools.lru_cache(maxsize=1024)
+def _styled(text: str, styles: tuple[str, ...]) -> str:
+    result = text
+    for style in reversed(styles):
+        result = getattr(Term, style)(result)
+    return result
+
+
+class TermRenderer:
+    """
+    Collects output lines and writes them to the stream in large chunks.
+
+    The first screen of lines is written as soon as it is complete, so the user sees it
+    before the rest of the output is formatted.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    """Buffered characters that trigger writing to the stream."""
+
+    def __init__(
+        self, stream: IO[str] | None = None, first_screen_lines: int | None = None
+    ) -> None:
+        self.stream = stream if stream is not None else sys.stdout
+        self.first_screen_lines = (
+            first_screen_lines
+            if first_screen_lines is not None
+            else shutil.get_terminal_size().lines
+        )
+        self._parts: list[str] = []
+        self._size = 0
+        self._num_lines = 0
+        self._first_screen_written = False
+
+    def __enter__(self) -> TermRenderer:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.flush()
+
+    def line(self, text: str = "") -> None:
+        """Add a line to the output."""
+        self._parts.append(text)
+        self._parts.append("\n")
+        self._size += len(text) + 1
+        self._num_lines += text.count("\n") + 1
+        if self._size >= self.CHUNK_SIZE or (
+            not self._first_screen_written and self._num_lines >= self.first_screen_lines
+        ):
+            self._first_screen_written = True
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything buffered so far."""
+        if self._parts:
+            self.stream.write("".join(self._parts))
+            self._parts.clear()
+            self._size = 0
+        self.stream.flush()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def open(pager: bool = False) -> Iterator[TermRenderer]:
+        """
+        Return a renderer writing to stdout or, if requested and stdout is a terminal, to a pager.
+
+        The pager is $PAGER or `less`; it shows the first screen while the rest is being rendered.
+        """
+        if not (pager and sys.stdout.isatty()):
+            with TermRenderer() as renderer:
+                yield renderer
+            return
+        cmd = os.environ.get("PAGER", "less -R -F -X")
+        with sp.Popen(cmd, shell=True, stdin=sp.PIPE, text=True, encoding="utf8") as proc:
+            assert proc.stdin is not None
+            try:
+                with TermRenderer(stream=proc.stdin) as renderer:
+                    yield renderer
+            except BrokenPipeError:
+                _logger.debug("The pager was closed before all output was written.")
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+
+
+def test_term_styled() -> None:
+    """Check cached styles and disabling them."""
+    assert Term.styled("x", "bold", "green") == Term.bold(Term.green("x"))
+    assert Term.styled("x", "bold", "green") is Term.styled("x", "bold", "green")
+    try:
+        Term.set_enabled(False)
+        assert Term.styled("x", "bold", "green") == "x"
+        assert Term.red("x") == "x"
+    finally:
+        Term.set_enabled(True)
+    assert Term.red("x") != "x"
+
+
+def test_term_renderer() -> None:
+    """Check that the first screen is written before the rest."""
+    stream = io.StringIO()
+    renderer = TermRenderer(stream=stream, first_screen_lines=2)
+    renderer.line("1")
+    assert stream.getvalue() == ""
+    renderer.line("2")
+    assert stream.getvalue() == "1\n2\n"
+    renderer.line("3")
+    assert stream.getvalue() == "1\n2\n"
+    renderer.flush()
+    assert stream.getvalue() == "1\n2\n3\n"
@@ -1,55 +1,149 @@
-"""Common code for tests."""
+"""
+Common code for tests.
 
-import argparse
+Vault tests are parametrized lazily: `@vault_dirs` and `@vault_dirs_subdirs` only mark a test,
+and conftest.py's pytest_generate_tests() calls parametrize() when such a test is collected.
+Subdirectories with notes are found with a persisted listing of directories: a directory is
+listed again only if its modification time changed, i.e. an entry was added, deleted, or renamed
+in it, thus collection costs one stat() per directory instead of a walk through all files.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
 from pathlib import PosixPath
-from typing import Any
 
 import pytest
 
-from dope.config import get_vault_paths
+from dope.config import get_cache_dir, get_vault_paths, read_json_cache, write_json_cache
+
+_logger = logging.getLogger(__name__)
 
 # Notes and other files cannot contain these symbols:
 RESERVED_SYMBOLS = ["`", "[", "]", "'", '"']
 
+# pytest parametrization iterating over all configured vaults.
+vault_dirs = pytest.mark.vault_dirs
+
+# pytest parametrization iterating over all subdirectories of configured vaults that
+# contain markdown notes; see also `pytest --subdirs-per-item`.
+vault_dirs_subdirs = pytest.mark.vault_dirs_subdirs
 
-def _get_vault_paths_tests() -> list[PosixPath]:
-    """
-    A wrapper around get_vault_paths() that filters vault names.
-    """
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--vault", nargs="*", action="store")
-    pytest_args, _ = parser.parse_known_args()
-    return get_vault_paths(filter=pytest_args.vault)
 
+@dataclass
+class _DirEntry:
+    mtime_ns: int
+    has_notes: bool
+    subdirs: list[str]
 
-# pytest parametrization iterating over all configured vaults.
-vault_dirs = pytest.mark.parametrize(
-    argnames="vault_dir",
-    argvalues=(v_dirs := _get_vault_paths_tests()),
-    ids=[v_dir.name for v_dir in v_dirs],
-)
-
-
-def _get_vault_dirs_subdirs_parametrization() -> dict[str, Any]:
-    """
-    Prepare parametrization parameters for @vault_dirs_subdirs
-    """
-    argnames = "vault_dir_subdir"
-    argvalues = []
-    ids = []
-    v_dirs_ = _get_vault_paths_tests()
-    for v_dir in v_dirs_:
-        dirs_with_md = {p.parent for p in v_dir.rglob("*.md")}
-        for d in sorted(dirs_with_md):
-            argvalues.append((v_dir, d))
-            ids.append(f"{v_dir.name}/{d.relative_to(v_dir)}")
-    return {
-        "argnames": argnames,
-        "argvalues": argvalues,
-        "ids": ids,
-    }
 
+class DirListing:
+    """Persisted listing of directories of vaults that is refreshed by modification times."""
 
-# pytest parametrization iterating over all subdirectories of configured vaults that
-# contain markdown notes.
-vault_dirs_subdirs = pytest.mark.parametrize(**_get_vault_dirs_subdirs_parametrization())
+    # pylint: disable=too-few-public-methods
+
+    CACHE_VERSION = 1
+
+    def __init__(self, cache_path: PosixPath | None = None) -> None:
+        self.cache_path = cache_path or get_cache_dir() / "test_dirs.json"
+        self.entries: dict[str, _DirEntry] = {}
+        self.num_listed = 0
+        """The number of directories listed by the last call of note_dirs()."""
+        self._load()
+
+    def note_dirs(self, vault_dir: PosixPath) -> list[PosixPath]:
+        """Return sorted directories of the vault that contain notes."""
+        entries: dict[str, _DirEntry] = {}
+        self.num_listed = 0
+        dirs = []
+        stack = [str(vault_dir)]
+        while stack:
+            dir_path = stack.pop()
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            entry = self.entries.get(dir_path)
+            if entry is None or entry.mtime_ns != mtime_ns:
+                entry = self._list(dir_path, mtime_ns)
+            entries[dir_path] = entry
+            if entry.has_notes:
+                dirs.append(PosixPath(dir_path))
+            stack.extend(os.path.join(dir_path, subdir) for subdir in entry.subdirs)
+        vault_prefix = os.path.join(str(vault_dir), "")
+        self.entries = {
+            key: entry
+            for key, entry in self.entries.items()
+            if key != str(vault_dir) and not key.startswith(vault_prefix)
+        } | entries
+        self._save()
+        return sorted(dirs)
+
+    def _list(self, dir_path: str, mtime_ns: int) -> _DirEntry:
+        self.num_listed += 1
+        has_notes = False
+        subdirs = []
+        with os.scandir(dir_path) as dir_entries:
+            for dir_entry in dir_entries:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    subdirs.append(dir_entry.name)
+                elif dir_entry.name.endswith(".md") and dir_entry.is_file():
+                    has_notes = True
+        return _DirEntry(mtime_ns=mtime_ns, has_notes=has_notes, subdirs=sorted(subdirs))
+
+    def _load(self) -> None:
+        cache = read_json_cache(self.cache_path, self.CACHE_VERSION)
+        if cache is None:
+            return
+        self.entries = {key: _DirEntry(*item) for key, item in cache["dirs"].items()}
+
+    def _save(self) -> None:
+        cache = {
+            "dirs": {
+                key: [entry.mtime_ns, entry.has_notes, entry.subdirs]
+                for key, entry in self.entries.items()
+            },
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def parametrize(metafunc: pytest.Metafunc) -> None:
+    """Parametrize a test marked with @vault_dirs or @vault_dirs_subdirs."""
+    if metafunc.definition.get_closest_marker("vault_dirs") is not None:
+        v_dirs = get_vault_paths(filter=metafunc.config.getoption("vault"))
+        metafunc.parametrize(
+            argnames="vault_dir", argvalues=v_dirs, ids=[v_dir.name for v_dir in v_dirs]
+        )
+    if metafunc.definition.get_closest_marker("vault_dirs_subdirs") is not None:
+        batch_size = max(1, metafunc.config.getoption("subdirs_per_item") or 1)
+        argvalues: list[tuple[PosixPath, ...]] = []
+        ids = []
+        dir_listing = DirListing()
+        for v_dir in get_vault_paths(filter=metafunc.config.getoption("vault")):
+            note_dirs = dir_listing.note_dirs(v_dir)
+            _logger.debug("%s: %d directories listed.", v_dir.name, dir_listing.num_listed)
+            for idx in range(0, len(note_dirs), batch_size):
+                batch = note_dirs[idx : idx + batch_size]
+                argvalues.append((v_dir, *batch))
+                item_id = f"{v_dir.name}/{batch[0].relative_to(v_dir)}"
+                ids.append(item_id if len(batch) == 1 else f"{item_id}+{len(batch) - 1}")
+        metafunc.parametrize(argnames="vault_dir_subdir", argvalues=argvalues, ids=ids)
+
+
+def test_dir_listing(tmp_path: PosixPath) -> None:
+    """Check that only changed directories are listed again."""
+    vault_dir = tmp_path / "vault"
+    (vault_dir / "a" / "b").mkdir(parents=True)
+    (vault_dir / "c").mkdir()
+    (vault_dir / "n.md").write_text("")
+    (vault_dir / "a" / "b" / "n.md").write_text("")
+    (vault_dir / "c" / "i.png").write_bytes(b"")
+    cache_path = tmp_path / "test_dirs.json"
+
+    assert DirListing(cache_path).note_dirs(vault_dir) == [vault_dir, vault_dir / "a" / "b"]
+    dir_listing = DirListing(cache_path)
+    assert dir_listing.note_dirs(vault_dir) == [vault_dir, vault_dir / "a" / "b"]
+    assert dir_listing.num_listed == 0
+    (vault_dir / "c" / "n.md").write_text("")
+    os.utime(vault_dir / "c", ns=(1, 1))  # Ensure the change is seen on coarse file systems.
+    assert dir_listing.note_dirs(vault_dir) == [vault_dir, vault_dir / "a" / "b", vault_dir / "c"]
+    assert dir_listing.num_listed == 1
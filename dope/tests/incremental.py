@@ -0,0 +1,373 @@
+"""
+Incremental mode of vault tests, `pytest --incremental` or `d --test --incremental`.
+
+After a run, every note that passed a note-level test is recorded together with its content
+hash. The next run checks only notes that are new, changed, or failed last time; notes whose
+modification time changed but whose content did not are not checked again.
+
+Tests of links also depend on other files: a link breaks when its target is deleted or renamed
+and a section link breaks when the target note changes. Notes that link to added, deleted, or
+changed files, to other files with their names since wiki links are resolved by name, or to
+aliases of changed notes, are found with the backlink index, which is the reverse-dependency
+map, and checked again. If the vault is a git repository, changed files are those git reports
+since the commit of the last run, see dope.git_changes, and unchanged notes are not even
+stat'ed; otherwise the files of the vault are listed after every run and compared with the last
+listing.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pathlib
+import subprocess as sp
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Any
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+from dope.git_changes import GitChanges, GitMark, git_changes
+from dope.link_index import LinkIndex
+from dope.name_index import NameIndex
+from dope.property_index import PropertyIndex
+from dope.v_note import VNote
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _VaultSession:
+    link_index: LinkIndex
+    mark: GitMark | None
+    """The state of the vault if it is a git repository."""
+    files: dict[str, int] | None = None
+    """Modification times of files, listed on demand if the vault is not a git repository."""
+
+
+_session: dict[str, _VaultSession] = {}
+"""The state of every vault; built once per session in incremental mode."""
+_name_indexes: dict[str, NameIndex] = {}
+
+
+def vault_files(vault_dir: pathlib.PosixPath) -> dict[str, int]:
+    """Return modification times of all files of the vault except hidden directories."""
+    files = {}
+    for dir_path, dir_names, file_names in os.walk(vault_dir):
+        dir_names[:] = [dir_name for dir_name in dir_names if not dir_name.startswith(".")]
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            files[os.path.relpath(path, vault_dir)] = os.stat(path).st_mtime_ns
+    return files
+
+
+def session_link_index(vault_dir: pathlib.PosixPath) -> LinkIndex:
+    """Return an up-to-date backlink index; in incremental mode it is updated once per session."""
+    if not IncrementalCheck.enabled:
+        link_index = LinkIndex()
+        link_index.update([vault_dir])
+        return link_index
+    return _session_state(vault_dir, get_cache_dir()).link_index
+
+
+def session_name_index(
+    vault_dir: pathlib.PosixPath, cache_dir: pathlib.PosixPath | None = None
+) -> NameIndex:
+    """
+    Return the index of file names and aliases of the vault, built once per session.
+
+    :param cache_dir: the directory of the property index, the user cache directory by default.
+    """
+    if (name_index := _name_indexes.get(str(vault_dir))) is None:
+        property_index = PropertyIndex(
+            cache_path=(cache_dir or get_cache_dir()) / "property_index.json"
+        )
+        property_index.update([vault_dir])
+        name_index = _name_indexes[str(vault_dir)] = NameIndex(
+            vault_dir, aliases=property_index.aliases(vault_dir)
+        )
+    return name_index
+
+
+def _session_state(vault_dir: pathlib.PosixPath, cache_dir: pathlib.PosixPath) -> _VaultSession:
+    if (state := _session.get(str(vault_dir))) is None:
+        link_index = LinkIndex(cache_path=cache_dir / "link_index.json")
+        link_index.update([vault_dir])
+        # The update has just asked git for the state of the vault.
+        mark = link_index.git_marks.get(str(vault_dir))
+        state = _session[str(vault_dir)] = _VaultSession(link_index, mark)
+    if state.mark is None and state.files is None:
+        state.files = vault_files(vault_dir)
+    return state
+
+
+@dataclass
+class _NoteState:
+    mtime_ns: int
+    size: int
+    digest: str
+
+
+class IncrementalCheck:
+    """
+    Notes that one note-level test has to check in this run, and the notes that passed.
+
+    Use as a context manager, so that the outcomes are recorded even if the test fails:
+
+        with IncrementalCheck(vault_dir, "test_x") as check:
+            for v_note in check.notes_iter(VNote.collect_iter(...)):
+                ...  # Assertions.
+                check.passed(v_note)
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    CACHE_VERSION = 1
+    enabled = False
+    """Set by `pytest --incremental`; if False, all notes are checked and nothing is recorded."""
+
+    def __init__(
+        self,
+        vault_dir: pathlib.PosixPath,
+        scope: str,
+        links: bool = False,
+        cache_path: pathlib.PosixPath | None = None,
+    ) -> None:
+        """
+        :param scope: the name of the test and, if it is parametrized further, its parameters.
+        :param links: whether the test depends on targets of links.
+        """
+        self.vault_dir = vault_dir
+        self.key = f"{vault_dir}::{scope}"
+        self.links = links
+        self.cache_path = cache_path or get_cache_dir() / "test_state.json"
+        self.num_checked = 0
+        self.num_skipped = 0
+        self._prev_notes: dict[str, _NoteState] = {}
+        self._prev_files: dict[str, int] | None = None
+        self._prev_mark: GitMark | None = None
+        self._changes: GitChanges | None = None
+        self._current: dict[str, _NoteState] = {}
+        self._passed: dict[str, _NoteState] = {}
+        if self.enabled:
+            self._load()
+
+    def __enter__(self) -> IncrementalCheck:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        if not self.enabled:
+            return
+        _logger.info(
+            "%s: %d notes checked, %d passed before.", self.key, self.num_checked, self.num_skipped
+        )
+        if exc_type is None:
+            state = _session_state(self.vault_dir, self.cache_path.parent)
+            files = state.files if self.links else None
+            self._save(self._passed, files=files, mark=state.mark)
+        else:
+            # Notes that were not reached keep their old outcomes, thus changes are looked for
+            # since the old listing or commit next time.
+            notes = {
+                rpath: state
+                for rpath, state in self._prev_notes.items()
+                if rpath not in self._current
+            }
+            self._save({**notes, **self._passed}, files=self._prev_files, mark=self._prev_mark)
+
+    def notes_iter(self, v_notes: Iterable[VNote]) -> Iterator[VNote]:
+        """Yield notes that have to be checked."""
+        if not self.enabled:
+            yield from v_notes
+            return
+        session = _session_state(self.vault_dir, self.cache_path.parent)
+        if self._prev_mark is not None and session.mark is not None:
+            self._changes = git_changes(self.vault_dir, self._prev_mark, session.mark)
+        dependents = self._dependents() if self.links else set()
+        for v_note in v_notes:
+            rpath = str(v_note.note_path.relative_to(self.vault_dir))
+            prev = self._prev_notes.get(rpath)
+            if (
+                prev is not None
+                and self._changes is not None
+                and rpath not in self._changes.changed
+            ):
+                state = prev  # Git reports no change, thus the note is not even stat'ed.
+            else:
+                state = self._note_state(v_note, prev)
+            self._current[rpath] = state
+            if prev is not None and prev.digest == state.digest and rpath not in dependents:
+                self._passed[rpath] = state
+                self.num_skipped += 1
+                continue
+            self.num_checked += 1
+            yield v_note
+
+    @staticmethod
+    def _note_state(v_note: VNote, prev: _NoteState | None) -> _NoteState:
+        stat = v_note.note_path.stat()
+        if prev is not None and (prev.mtime_ns, prev.size) == (stat.st_mtime_ns, stat.st_size):
+            return prev
+        digest = hashlib.sha1(v_note.note_path.read_bytes()).hexdigest()
+        return _NoteState(stat.st_mtime_ns, stat.st_size, digest)
+
+    def passed(self, v_note: VNote) -> None:
+        """Record that the note passed the test."""
+        if self.enabled:
+            rpath = str(v_note.note_path.relative_to(self.vault_dir))
+            self._passed[rpath] = self._current[rpath]
+
+    def _dependents(self) -> set[str]:
+        """Return notes linking to files that were added, deleted, or changed since the last run."""
+        session = _session_state(self.vault_dir, self.cache_path.parent)
+        if self._changes is not None:
+            changed = self._changes.changed | self._changes.deleted
+        elif self._prev_files is None or session.files is None:
+            return set(self._prev_notes)  # The files are unknown, thus everything is checked.
+        else:
+            files = session.files
+            changed = self._prev_files.keys() ^ files.keys()
+            changed.update(
+                rpath
+                for rpath, mtime_ns in files.items()
+                if rpath.endswith(".md") and self._prev_files.get(rpath, mtime_ns) != mtime_ns
+            )
+        link_index = session.link_index
+        # Links resolved by name, see dope.name_index, change when any file with the name does,
+        # and links to aliases when the note with the alias does.
+        name_index = session_name_index(self.vault_dir, self.cache_path.parent)
+        names = [*changed, *name_index.aliases_of(changed)]
+        dependents = {
+            str(v_note.note_path.relative_to(self.vault_dir))
+            for name in names
+            for v_note in link_index.name_backlinks(self.vault_dir, self.vault_dir / name)
+        }
+        _logger.debug("%d files changed, %d notes depend on them.", len(changed), len(dependents))
+        return dependents
+
+    def _read_cache(self) -> dict[str, Any]:
+        cache = read_json_cache(
+            self.cache_path,
+            self.CACHE_VERSION,
+            "Test state has an old format; checking all notes again.",
+        )
+        return {"scopes": {}} if cache is None else cache
+
+    def _load(self) -> None:
+        scope = self._read_cache()["scopes"].get(self.key, {})
+        self._prev_notes = {
+            rpath: _NoteState(*item) for rpath, item in scope.get("notes", {}).items()
+        }
+        self._prev_files = scope.get("files")
+        if (mark := scope.get("git")) is not None:
+            self._prev_mark = GitMark(*mark)
+
+    def _save(
+        self, notes: dict[str, _NoteState], files: dict[str, int] | None, mark: GitMark | None
+    ) -> None:
+        cache = self._read_cache()
+        cache["scopes"][self.key] = {
+            "notes": {
+                rpath: [state.mtime_ns, state.size, state.digest] for rpath, state in notes.items()
+            },
+            "files": files,
+            "git": None if mark is None else [mark.commit, mark.dirty],
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+def test_incremental_check(tmp_path: pathlib.PosixPath) -> None:
+    """Check that only changed, failed, and dependent notes are checked again."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    (vault_dir / "a.md").write_text("[b](b.md) [i](i.png)\n")
+    (vault_dir / "b.md").write_text("b\n")
+    (vault_dir / "c.md").write_text("bad\n")
+    (vault_dir / "i.png").write_bytes(b"")
+    cache_path = tmp_path / "test_state.json"
+
+    def run(links: bool) -> list[str]:
+        _session.clear()
+        _name_indexes.clear()
+        checked = []
+        with IncrementalCheck(vault_dir, "test", links=links, cache_path=cache_path) as check:
+            for v_note in check.notes_iter(VNote.collect_iter([vault_dir], exclude_trash=True)):
+                checked.append(v_note.note_path.name)
+                if "bad" not in v_note.note_path.read_text():
+                    check.passed(v_note)
+        return sorted(checked)
+
+    IncrementalCheck.enabled = True
+    try:
+        assert run(links=True) == ["a.md", "b.md", "c.md"]
+        assert run(links=True) == ["c.md"]
+        (vault_dir / "b.md").write_text("b\n")  # Touched, the content is the same.
+        os.utime(vault_dir / "b.md", ns=(1, 1))
+        assert run(links=True) == ["a.md", "c.md"]  # a.md links to b.md.
+        assert run(links=True) == ["c.md"]
+        (vault_dir / "i.png").rename(vault_dir / "j.png")
+        (vault_dir / "c.md").write_text("good\n")
+        assert run(links=True) == ["a.md", "c.md"]
+        assert not run(links=True)
+        (vault_dir / "b.md").write_text("changed\n")
+        assert run(links=False) == ["b.md"]
+        assert not run(links=False)
+        (vault_dir / "d.md").write_text("---\naliases: [Dee]\n---\nd\n")
+        (vault_dir / "e.md").write_text("[[dee]]\n")
+        assert len(run(links=True)) == 5  # The listing of files is not kept without links.
+        assert not run(links=True)
+        (vault_dir / "d.md").write_text("---\naliases: [Dee]\n---\nchanged\n")
+        assert run(links=True) == ["d.md", "e.md"]  # e.md links to the alias of d.md.
+    finally:
+        IncrementalCheck.enabled = False
+        _session.clear()
+        _name_indexes.clear()
+
+
+def test_incremental_check_git(tmp_path: pathlib.PosixPath) -> None:
+    """Check that changes are taken from git in a repository."""
+    vault_dir = tmp_path / "vault"
+    vault_dir.mkdir()
+    (vault_dir / "a.md").write_text("[b](b.md)\n")
+    (vault_dir / "b.md").write_text("b\n")
+    (vault_dir / "c.md").write_text("c\n")
+    cache_path = tmp_path / "test_state.json"
+
+    def git(*args: str) -> None:
+        sp.run(
+            ["git", "-C", str(vault_dir), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+            check=True,
+            capture_output=True,
+        )
+
+    def run() -> list[str]:
+        _session.clear()
+        _name_indexes.clear()
+        with IncrementalCheck(vault_dir, "test", links=True, cache_path=cache_path) as check:
+            checked = list(check.notes_iter(VNote.collect_iter([vault_dir], exclude_trash=True)))
+            for v_note in checked:
+                check.passed(v_note)
+        return sorted(v_note.note_path.name for v_note in checked)
+
+    git("init", "-q")
+    git("add", "-A")
+    git("commit", "-q", "-m", "1")
+    IncrementalCheck.enabled = True
+    try:
+        assert run() == ["a.md", "b.md", "c.md"]
+        assert not run()
+        os.utime(vault_dir / "c.md", ns=(1, 1))  # Git compares content, not times.
+        assert not run()
+        git("mv", "b.md", "d.md")
+        git("commit", "-q", "-m", "2")
+        assert run() == ["a.md", "d.md"]  # a.md links to the old name.
+        assert not run()
+    finally:
+        IncrementalCheck.enabled = False
+        _session.clear()
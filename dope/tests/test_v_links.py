@@ -4,55 +4,66 @@ This module contains tests for Obsidian vaults.
 
 import enum
 import logging
+import os
 import pathlib
 
 import pytest
 
 from dope.hyper_link import HyperLink
+from dope.link_index import LinkIndex
 from dope.markdown_link import MarkdownLink
+from dope.name_index import NameIndex
 from dope.v_note import VNote
 from dope.wiki_link import WikiLink
 
 from .common import vault_dirs, vault_dirs_subdirs
+from .incremental import IncrementalCheck, session_link_index, session_name_index
 
 _logger = logging.getLogger(__name__)
 
 
-def _unquote(path: pathlib.PosixPath) -> pathlib.PosixPath:
-    """Unquote the path."""
-    path_s = str(path)
-    path_s = path_s.replace("%20", " ")
-    path_s = path_s.replace("%28", "(")
-    path_s = path_s.replace("%29", ")")
-    path_s = path_s.replace("%40", "@")
-    return pathlib.PosixPath(path_s)
-
-
-def _exists(link_path: pathlib.PosixPath) -> bool:
-    """Unquote the path and check if file exists."""
-    link_path_s = str(link_path)
-    link_path_s = link_path_s.replace("%20", " ")
-    link_path_s = link_path_s.replace("%28", "(")
-    link_path_s = link_path_s.replace("%29", ")")
-    link_path_s = link_path_s.replace("%40", "@")
-    link_path = pathlib.PosixPath(link_path_s)
-    return link_path.exists()
-
-
 class HyperLinkType(enum.Enum):
     BROKEN = enum.auto()
     EXTERNAL = enum.auto()
     INTERNAL = enum.auto()
 
 
-def _check_v_link_validity(v_note: VNote, line_idx: int, hyper_link: HyperLink) -> HyperLinkType:
+def _check_v_link_anchor(
+    v_note: VNote,
+    line_idx: int,
+    hyper_link: HyperLink,
+    link_path: pathlib.PosixPath,
+    link_index: LinkIndex | None,
+) -> None:
+    """Check that the note `link_path` has the section and the block referenced by the link."""
+    parsed_uri = hyper_link.parsed()
+    if link_index is None or (parsed_uri.section is None and parsed_uri.block is None):
+        return
+    link_path = pathlib.PosixPath(os.path.normpath(link_path))
+    assert link_index.has_anchor(link_path, parsed_uri) is not False, (
+        f"Section or block does not exist. "
+        f"Note=`{v_note.note_path}`, line={line_idx}. URI=`{hyper_link.uri_raw}`."
+    )
+
+
+def _check_v_link_validity(
+    v_note: VNote,
+    line_idx: int,
+    hyper_link: HyperLink,
+    link_index: LinkIndex | None = None,
+    name_index: NameIndex | None = None,
+) -> HyperLinkType:
     """
     Check that the link points to an existing file or note.
 
     For notes, the .md extension may be omitted.
 
     :param hyper_link: hyper_link.uri may be changed if the link is relative.
+    :param link_index: if given, sections and blocks of links to notes are checked too.
+    :param name_index: if given, wiki links that are not paths from the vault root are resolved
+        by name the same way as in Obsidian.
     """
+    # pylint: disable=too-many-return-statements
     if hyper_link.is_external():
         return HyperLinkType.EXTERNAL
     if hyper_link.uri.startswith("broken:"):
@@ -66,10 +77,12 @@ def _check_v_link_validity(v_note: VNote, line_idx: int, hyper_link: HyperLink)
     assert not hyper_link.uri.startswith("file:"), (
         f"Legacy Windows link.Note=`{v_note.note_path}`, line={line_idx}. URI=`{hyper_link.uri}`."
     )
-    # Internal link.
-    hyper_link.uri = hyper_link.decoded()
-    # hyper_link.uri = hyper_link.uri.split("#")[0]  # Remove heading.
-    # hyper_link.uri = hyper_link.uri.split("^")[0]  # Remove block.
+    # Internal link; the normalised path has no heading or block.
+    hyper_link.uri = hyper_link.parsed().path
+    if not hyper_link.uri:
+        # A link to a section or a block of the same note.
+        _check_v_link_anchor(v_note, line_idx, hyper_link, v_note.note_path, link_index)
+        return HyperLinkType.INTERNAL
 
     if hyper_link.uri.startswith("./") or (hyper_link.uri.startswith("../")):
         # Internal relative link.
@@ -81,8 +94,12 @@ def _check_v_link_validity(v_note: VNote, line_idx: int, hyper_link: HyperLink)
         link_path_dot_md = link_path_start / link_path_end_dot_md
         if link_path_as_is.exists():
             hyper_link.uri = str(link_path_as_is)
+            _check_v_link_anchor(
+                v_note, line_idx, hyper_link, link_path_start / link_path_end_as_is, link_index
+            )
             return HyperLinkType.INTERNAL
         if link_path_dot_md.exists():
+            _check_v_link_anchor(v_note, line_idx, hyper_link, link_path_dot_md, link_index)
             return HyperLinkType.INTERNAL
         raise ValueError(
             "Int.rel.link does not exist. "
@@ -95,10 +112,31 @@ def _check_v_link_validity(v_note: VNote, line_idx: int, hyper_link: HyperLink)
         link_path_as_is = link_path_start / link_path_end_as_is
         link_path_end_dot_md = pathlib.PosixPath(hyper_link.uri + ".md")
         link_path_dot_md = link_path_start / link_path_end_dot_md
+        if (
+            isinstance(hyper_link, WikiLink)
+            and name_index is not None
+            and not (link_path_as_is.exists() or link_path_dot_md.exists())
+        ):
+            # Internal wiki link by name, e.g. [[Note Name]] for 'dir/Note Name.md'.
+            note_rpath = str(v_note.note_path.relative_to(v_note.vault_dir))
+            resolution = name_index.resolve(note_rpath, hyper_link.uri)
+            assert resolution is not None, (
+                f"Int.wiki.link does not exist. "
+                f"Note=`{v_note.note_path}`, line={line_idx}. URI=`{hyper_link.uri}`."
+            )
+            _check_v_link_anchor(v_note, line_idx, hyper_link, resolution.path, link_index)
+            return HyperLinkType.INTERNAL
         assert link_path_as_is.exists() or link_path_dot_md.exists(), (
             f"Int.abs.link does not exist. "
             f"Note=`{v_note.note_path}`, line={line_idx}. URI=`{hyper_link.uri}`."
         )
+        _check_v_link_anchor(
+            v_note,
+            line_idx,
+            hyper_link,
+            link_path_as_is if link_path_as_is.is_file() else link_path_dot_md,
+            link_index,
+        )
         return HyperLinkType.INTERNAL
 
 
@@ -115,35 +153,82 @@ def test_v_links_validity(vault_dir: pathlib.PosixPath) -> None:
     Internal link format:
         [link_name](file_path)
         [link_name](file_path#heading)
-        [link_name](file_path^block_id)
+        [link_name](file_path#^block_id)
     """
 
+    link_index = session_link_index(vault_dir)
+    name_index = session_name_index(vault_dir)
     num_md_links = 0
     num_wk_links = 0
-    for v_note in VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True):
-        for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
-            for md_link in MarkdownLink.collect_iter(line=note_line):
-                num_md_links += 1
-                _check_v_link_validity(v_note=v_note, line_idx=line_idx, hyper_link=md_link)
+    with IncrementalCheck(vault_dir, "test_v_links_validity", links=True) as check:
+        for v_note in check.notes_iter(
+            VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True)
+        ):
+            for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+                for md_link in MarkdownLink.collect_iter(line=note_line):
+                    num_md_links += 1
+                    _check_v_link_validity(
+                        v_note=v_note, line_idx=line_idx, hyper_link=md_link, link_index=link_index
+                    )
 
-            for wk_link in WikiLink.collect_iter(line=note_line):
-                num_wk_links += 1
-                _check_v_link_validity(v_note=v_note, line_idx=line_idx, hyper_link=wk_link)
+                for wk_link in WikiLink.collect_iter(line=note_line):
+                    num_wk_links += 1
+                    _check_v_link_validity(
+                        v_note=v_note,
+                        line_idx=line_idx,
+                        hyper_link=wk_link,
+                        link_index=link_index,
+                        name_index=name_index,
+                    )
+            check.passed(v_note)
 
     _logger.info("%d Markdown links were found and checked", num_md_links)
     _logger.info("%d Wiki links were found", num_wk_links)
 
 
 @pytest.mark.vault_test(True)
-@vault_dirs_subdirs
-def test_v_links_resources(vault_dir_subdir: tuple[pathlib.PosixPath, pathlib.PosixPath]) -> None:
+@vault_dirs
+def test_v_links_ambiguous(vault_dir: pathlib.PosixPath) -> None:
     """
-    Walk throug all notes in a subdirectory of a vault, check that a resource referenced by a
-    hyperlink is in the local "res" directory.
+    Check that wiki links by name do not depend on disambiguation: a name that several files
+    share resolves to one of them only by the rules of Obsidian, see dope.name_index, and
+    changes meaning as soon as a note is moved or a file is renamed.
     """
-    # pass
-    vault_dir = vault_dir_subdir[0]
-    vault_subdir = vault_dir_subdir[1]
+    name_index = session_name_index(vault_dir)
+    num_ambiguous = 0
+    with IncrementalCheck(vault_dir, "test_v_links_ambiguous", links=True) as check:
+        for v_note in check.notes_iter(
+            VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True)
+        ):
+            note_rpath = str(v_note.note_path.relative_to(vault_dir))
+            num_ambiguous_before = num_ambiguous
+            for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+                for wk_link in WikiLink.collect_iter(line=note_line):
+                    link_path = wk_link.parsed().path
+                    if wk_link.is_external() or not link_path or link_path.startswith("."):
+                        continue
+                    resolution = name_index.resolve(note_rpath, link_path)
+                    if resolution is not None and resolution.ambiguous:
+                        num_ambiguous += 1
+                        _logger.error(
+                            "%s: line %d: Wiki link `%s` matches %d files, resolved to '%s'.",
+                            note_rpath,
+                            line_idx,
+                            wk_link.uri_raw,
+                            len(resolution.candidates),
+                            resolution.path.relative_to(vault_dir),
+                        )
+            if num_ambiguous == num_ambiguous_before:
+                check.passed(v_note)
+    if num_ambiguous:
+        pytest.fail(reason=f"Found {num_ambiguous} ambiguous wiki link(s)")
+
+
+def _check_v_links_resources(
+    vault_dir: pathlib.PosixPath, vault_subdir: pathlib.PosixPath
+) -> tuple[int, int, int]:
+    """Return the numbers of notes and resources checked in the subdirectory, and of problems."""
+    # pylint: disable=too-many-locals
     assert vault_dir.exists()
     assert vault_dir.is_dir()
     assert vault_subdir.exists()
@@ -152,48 +237,77 @@ def test_v_links_resources(vault_dir_subdir: tuple[pathlib.PosixPath, pathlib.Po
     num_notes_checked = 0
     num_res_checked = 0
     num_res_errors = 0
-    for v_note in VNote.collect_subdir_iter(
-        vault_dir=vault_dir,
-        vault_subdir=vault_subdir,
-        exclude_trash=True,
-    ):
-        num_notes_checked += 1
-        for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
-            for hyper_link in MarkdownLink.collect_iter(line=note_line):
-                if pathlib.Path(hyper_link.uri).suffix == ".md":
-                    continue  # Ignore links to notes.
-                _logger.debug("hyper_link '%s'.", hyper_link.uri)
-                num_res_checked += 1
-                match _check_v_link_validity(
-                    v_note=v_note, line_idx=line_idx, hyper_link=hyper_link
-                ):
-                    case HyperLinkType.EXTERNAL:
-                        pass
-                    case HyperLinkType.INTERNAL:
-                        note_dir_rpath = v_note.note_path.relative_to(v_note.vault_dir).parent
-                        note_res_rpath = note_dir_rpath / "res"
-                        link_dir_path = pathlib.Path(hyper_link.uri).parent
-                        if link_dir_path.is_absolute():
-                            link_dir_rpath = link_dir_path.relative_to(v_note.vault_dir)
-                        else:
-                            link_dir_rpath = link_dir_path
-                        if note_res_rpath != link_dir_rpath:
-                            _logger.error(
-                                "%s: line %d: Resource ('%s') is not in the local 'res' directory ('%s').\n\t%s",
-                                v_note.note_path.name,
-                                line_idx,
-                                hyper_link.uri,
-                                note_res_rpath,
-                                note_line if len(note_line) <= 100 else f"{note_line:.100}...",
-                            )
-                            _logger.debug(
-                                "res BAD: '%s', file in '%s'.", note_res_rpath, link_dir_path
-                            )
-                            num_res_errors += 1
-                        else:
-                            _logger.debug(
-                                "res GOOD: '%s', file in '%s'.", note_res_rpath, link_dir_path
-                            )
+    scope = f"test_v_links_resources:{vault_subdir.relative_to(vault_dir)}"
+    with IncrementalCheck(vault_dir, scope, links=True) as check:
+        for v_note in check.notes_iter(
+            VNote.collect_subdir_iter(
+                vault_dir=vault_dir,
+                vault_subdir=vault_subdir,
+                exclude_trash=True,
+            )
+        ):
+            num_notes_checked += 1
+            num_res_errors_before = num_res_errors
+            for line_idx, note_line in v_note.lines_iter(lazy=True, remove_newline=True):
+                for hyper_link in MarkdownLink.collect_iter(line=note_line):
+                    if pathlib.Path(hyper_link.uri).suffix == ".md":
+                        continue  # Ignore links to notes.
+                    _logger.debug("hyper_link '%s'.", hyper_link.uri)
+                    num_res_checked += 1
+                    match _check_v_link_validity(
+                        v_note=v_note, line_idx=line_idx, hyper_link=hyper_link
+                    ):
+                        case HyperLinkType.EXTERNAL:
+                            pass
+                        case HyperLinkType.INTERNAL:
+                            note_dir_rpath = v_note.note_path.relative_to(v_note.vault_dir).parent
+                            note_res_rpath = note_dir_rpath / "res"
+                            link_dir_path = pathlib.Path(hyper_link.uri).parent
+                            if link_dir_path.is_absolute():
+                                link_dir_rpath = link_dir_path.relative_to(v_note.vault_dir)
+                            else:
+                                link_dir_rpath = link_dir_path
+                            if note_res_rpath != link_dir_rpath:
+                                _logger.error(
+                                    "%s: line %d: Resource ('%s') is not in the local 'res' "
+                                    "directory ('%s').\n\t%s",
+                                    v_note.note_path.name,
+                                    line_idx,
+                                    hyper_link.uri,
+                                    note_res_rpath,
+                                    note_line if len(note_line) <= 100 else f"{note_line:.100}...",
+                                )
+                                _logger.debug(
+                                    "res BAD: '%s', file in '%s'.", note_res_rpath, link_dir_path
+                                )
+                                num_res_errors += 1
+                            else:
+                                _logger.debug(
+                                    "res GOOD: '%s', file in '%s'.", note_res_rpath, link_dir_path
+                                )
+            if num_res_errors == num_res_errors_before:
+                check.passed(v_note)
+    return num_notes_checked, num_res_checked, num_res_errors
+
+
+@pytest.mark.vault_test(True)
+@vault_dirs_subdirs
+def test_v_links_resources(vault_dir_subdir: tuple[pathlib.PosixPath, ...]) -> None:
+    """
+    Walk throug all notes in subdirectories of a vault, check that a resource referenced by a
+    hyperlink is in the local "res" directory.
+
+    :param vault_dir_subdir: the vault and one or more of its subdirectories.
+    """
+    num_notes_checked = 0
+    num_res_checked = 0
+    num_res_errors = 0
+    vault_dir, *vault_subdirs = vault_dir_subdir
+    for vault_subdir in vault_subdirs:
+        num_notes, num_res, num_errors = _check_v_links_resources(vault_dir, vault_subdir)
+        num_notes_checked += num_notes
+        num_res_checked += num_res
+        num_res_errors += num_errors
     _logger.debug(
         "checked %d notes, %d hyper-links were found and checked, %d problem(s).",
         num_notes_checked,
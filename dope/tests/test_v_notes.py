@@ -10,6 +10,7 @@ import pytest
 from dope.v_note import VNote
 
 from .common import RESERVED_SYMBOLS, vault_dirs
+from .incremental import IncrementalCheck
 
 _logger = logging.getLogger(__name__)
 
@@ -20,13 +21,21 @@ def test_v_notes_newline(vault_dir: pathlib.PosixPath) -> None:
     """Check if there are Windows-style new lines in the notes."""
     cnt_no_empty_line = 0  # The number of notes with no empty line in the end.
 
-    for v_note in VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True):
-        for _, note_line in v_note.lines_iter(lazy=True, remove_newline=False):
-            # pylint: disable-next=not-an-iterable
-            # (This looks like a false positive).
-            assert not note_line.endswith("\r\n"), "Unexpected Windows-style newline."
-            if not note_line.endswith("\n"):
-                cnt_no_empty_line += 1
+    with IncrementalCheck(vault_dir, "test_v_notes_newline") as check:
+        for v_note in check.notes_iter(
+            VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True)
+        ):
+            # Text mode translates newlines, thus Windows-style ones are only seen in raw bytes.
+            assert b"\r\n" not in v_note.note_path.read_bytes(), (
+                f"Unexpected Windows-style newline in '{v_note.note_path}'; "
+                "fix it with `d --rewrite crlf`."
+            )
+            for _, note_line in v_note.lines_iter(lazy=True, remove_newline=False):
+                # pylint: disable-next=not-an-iterable
+                # (This looks like a false positive).
+                if not note_line.endswith("\n"):
+                    cnt_no_empty_line += 1
+            check.passed(v_note)
     if cnt_no_empty_line:
         _logger.warning("%d notes don't have an empty line in the end.", cnt_no_empty_line)
 
@@ -35,16 +44,21 @@ def test_v_notes_newline(vault_dir: pathlib.PosixPath) -> None:
 @vault_dirs
 def test_v_notes_titles(vault_dir: pathlib.PosixPath) -> None:
     """Check if there are inappropriate symbols in note titles."""
-    for v_note in VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True):
-        title = v_note.note_path.stem
-        for symbol in RESERVED_SYMBOLS:
-            if symbol in title:
+    with IncrementalCheck(vault_dir, "test_v_notes_titles") as check:
+        for v_note in check.notes_iter(
+            VNote.collect_iter(vault_dirs=[vault_dir], exclude_trash=True)
+        ):
+            title = v_note.note_path.stem
+            reserved = [symbol for symbol in RESERVED_SYMBOLS if symbol in title]
+            for symbol in reserved:
                 logging.warning(
                     "%s: Symbol `%s` in `%s`.",
                     v_note.vault_dir.stem,
                     symbol,
                     v_note.note_path.relative_to(v_note.vault_dir),
                 )
+            if not reserved:
+                check.passed(v_note)
 
 
 @pytest.mark.vault_test(True)
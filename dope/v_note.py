@@ -2,21 +2,42 @@
 
 from __future__ import annotations
 
+import contextlib
 import logging
+import os
 import pathlib
-from collections.abc import Generator
-from dataclasses import dataclass
+import stat
+import tempfile
+from collections.abc import Generator, Iterable, Iterator
+from dataclasses import dataclass, field
 from pathlib import PosixPath
+from typing import IO
+
+from dope.frontmatter import MAX_LINES, is_delimiter, parse_properties, read_frontmatter
+from dope.instrument import Instrument
 
 _logger = logging.getLogger(__name__)
 
 
+def _read_umask() -> int:
+    """Return the umask of the process; os.umask() can only swap it, thus it is read once."""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _read_umask()
+
+
 @dataclass
 class VNote:
     """Encapsulates all the information about a note in a vault."""
 
     vault_dir: PosixPath
     note_path: PosixPath
+    _properties: dict[str, list[str]] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @classmethod
     def collect(cls, vault_dirs: list[pathlib.PosixPath], exclude_trash: bool) -> list[VNote]:
@@ -35,10 +56,21 @@ class VNote:
         vault_dirs: list[pathlib.PosixPath],
         *,
         exclude_trash: bool,
-    ) -> Generator[VNote, None, None]:
+    ) -> Iterator[VNote]:
         """
         Walk through given vaults and get all notes from them.
         """
+        return Instrument.timed_iter(
+            "walk", cls._collect_iter(vault_dirs, exclude_trash=exclude_trash), unit="notes"
+        )
+
+    @classmethod
+    def _collect_iter(
+        cls,
+        vault_dirs: list[pathlib.PosixPath],
+        *,
+        exclude_trash: bool,
+    ) -> Generator[VNote, None, None]:
         for vault_dir in vault_dirs:
             for note_path in vault_dir.rglob("*.md"):
                 assert note_path.is_file()
@@ -74,45 +106,88 @@ class VNote:
         self,
         lazy: bool,
         remove_newline: bool,
-    ) -> Generator[tuple[int, str], None, None]:
+    ) -> Iterator[tuple[int, str]]:
         """
-        Walk through all lines in a note except code lines.
+        Walk through all lines in a note except the frontmatter and code lines.
 
         Note that the index of the line is one-based.
 
         The greedy, i.e. not lazy, variant closes the file before yielding, thus it should
         be used when you want to rewrite the file while analyzing its lines.
         """
-        in_code_block = False
+        return Instrument.timed_iter(
+            "read", self._lines_iter(lazy=lazy, remove_newline=remove_newline), unit="lines"
+        )
+
+    def _lines_iter(
+        self,
+        lazy: bool,
+        remove_newline: bool,
+    ) -> Generator[tuple[int, str], None, None]:
+        if Instrument.is_enabled():
+            Instrument.count(notes=1, bytes=self.note_path.stat().st_size)
         if lazy:
             with open(self.note_path, "r", encoding="utf8") as note_fd:
-                line_idx = 1
-                while (note_line := note_fd.readline()) != "":
-                    # f.readline() reads a single line from the file;
-                    # a newline character (\n) is left at the end of the string,
-                    # and is only omitted on the last line of the file if the file doesn’t end
-                    # in a newline. This makes the return value unambiguous; if f.readline()
-                    # returns an empty string, the end of the file has been reached,
-                    # while a blank line is represented by '\n', a string containing only
-                    # a single newline.
-                    if note_line.startswith("```"):
-                        in_code_block = not in_code_block
-                    if not in_code_block:
-                        if remove_newline:
-                            note_line = note_line.replace("\n", "").replace("\r", "")
-                        yield line_idx, note_line
-                    line_idx += 1
-
+                # f.readline() reads a single line from the file;
+                # a newline character (\n) is left at the end of the string,
+                # and is only omitted on the last line of the file if the file doesn’t end
+                # in a newline. This makes the return value unambiguous; if f.readline()
+                # returns an empty string, the end of the file has been reached,
+                # while a blank line is represented by '\n', a string containing only
+                # a single newline.
+                yield from self._text_iter(iter(note_fd.readline, ""), remove_newline)
         else:
             with open(self.note_path, "r", encoding="utf8") as note_fd:
                 note_lines = note_fd.readlines()
-            for line_idx, note_line in enumerate(note_lines, start=1):
-                if note_line.startswith("```"):
-                    in_code_block = not in_code_block
-                if not in_code_block:
-                    if remove_newline:
-                        note_line = note_line.replace("\n", "").replace("\r", "")
-                    yield line_idx, note_line
+            yield from self._text_iter(note_lines, remove_newline)
+
+    @classmethod
+    def _text_iter(
+        cls, note_lines: Iterable[str], remove_newline: bool
+    ) -> Iterator[tuple[int, str]]:
+        """Number lines and skip the frontmatter and code blocks."""
+        in_code_block = False
+        for line_idx, note_line in cls._body_iter(note_lines):
+            if note_line.startswith("```"):
+                in_code_block = not in_code_block
+            if not in_code_block:
+                if remove_newline:
+                    note_line = note_line.replace("\n", "").replace("\r", "")
+                yield line_idx, note_line
+
+    @staticmethod
+    def _body_iter(note_lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+        """
+        Number lines from one and skip the frontmatter; a block that is not closed within
+        frontmatter.MAX_LINES lines is not frontmatter, thus its lines are yielded.
+        """
+        numbered = enumerate(note_lines, start=1)
+        first = next(numbered, None)
+        if first is None:
+            return
+        if not is_delimiter(first[1]):
+            yield first
+            yield from numbered
+            return
+        header = [first]
+        for line_idx, note_line in numbered:
+            if is_delimiter(note_line):
+                yield from numbered
+                return
+            header.append((line_idx, note_line))
+            if len(header) > MAX_LINES:
+                break
+        yield from header
+        yield from numbered
+
+    def properties(self) -> dict[str, list[str]]:
+        """
+        Return properties from the frontmatter; only the header of the note is read, once.
+        """
+        if self._properties is None:
+            lines = read_frontmatter(self.note_path)
+            self._properties = {} if lines is None else parse_properties(lines)
+        return self._properties
 
     def read(self) -> str:
         """Read the whole note."""
@@ -120,6 +195,66 @@ class VNote:
             return note_fd.read()
 
     def write(self, data: str) -> None:
-        """Write the whole note."""
-        with open(self.note_path, "w", encoding="utf8") as note_fd:
+        """Write the whole note atomically."""
+        with self.open_for_rewrite() as note_fd:
             note_fd.write(data)
+
+    @contextlib.contextmanager
+    def open_for_rewrite(self) -> Iterator[IO[str]]:
+        """
+        Open a temporary file next to the note for writing.
+
+        When the with-block succeeds, the temporary file atomically replaces the note and gets
+        its permissions, or those of a new file if there is no note yet, rather than the private
+        ones of a temporary file; otherwise it is removed and the note stays untouched.
+        Newlines are written as they are.
+        """
+        tmp_fd, tmp_name = tempfile.mkstemp(
+            dir=self.note_path.parent, prefix=f".{self.note_path.name}.", suffix=".tmp"
+        )
+        try:
+            with open(tmp_fd, "w", encoding="utf8", newline="") as note_fd:
+                yield note_fd
+            if self.note_path.exists():
+                os.chmod(tmp_name, stat.S_IMODE(self.note_path.stat().st_mode))
+            else:
+                os.chmod(tmp_name, 0o666 & ~_UMASK)
+            os.replace(tmp_name, self.note_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_name)
+            raise
+
+
+def test_lines_iter(tmp_path: pathlib.PosixPath) -> None:
+    """Check that the frontmatter and code are skipped and lines keep their numbers."""
+    note_path = tmp_path / "n.md"
+    note_path.write_text("---\ntags: [a]\n---\ntext\n```\ncode\n```\n---\nend")
+    v_note = VNote(tmp_path, note_path)
+    expected = [(4, "text"), (7, "```"), (8, "---"), (9, "end")]  # As before, closing ``` is kept.
+    assert list(v_note.lines_iter(lazy=True, remove_newline=True)) == expected
+    assert list(v_note.lines_iter(lazy=False, remove_newline=True)) == expected
+    assert v_note.properties() == {"tags": ["a"]}
+
+    note_path.write_text("---\nnot closed\n")  # Not frontmatter.
+    v_note = VNote(tmp_path, note_path)
+    assert list(v_note.lines_iter(lazy=True, remove_newline=True)) == [
+        (1, "---"),
+        (2, "not closed"),
+    ]
+    assert not v_note.properties()
+
+
+def test_open_for_rewrite(tmp_path: pathlib.PosixPath) -> None:
+    """Check that a rewritten note keeps its mode and a new one gets the default mode."""
+    note_path = tmp_path / "n.md"
+    note_path.write_text("old\n")
+    note_path.chmod(0o640)
+    VNote(tmp_path, note_path).write("new\n")
+    assert note_path.read_text() == "new\n"
+    assert stat.S_IMODE(note_path.stat().st_mode) == 0o640
+
+    new_path = tmp_path / "new.md"
+    VNote(tmp_path, new_path).write("new\n")
+    assert stat.S_IMODE(new_path.stat().st_mode) == 0o666 & ~_UMASK
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["n.md", "new.md"]
@@ -0,0 +1,420 @@
+"""
+Checking external web links with asyncio.
+
+URLs are deduplicated across vaults and only the ones whose cached result is older than the TTL
+are checked. Every host has its own pool of keep-alive connections, a limit of concurrent
+connections and a minimum interval between requests, so that a vault with hundreds of links
+to one site does not hammer it. A global limit bounds the connections to all hosts together,
+in use and idle, so that a vault linking to thousands of sites does not run out of file
+descriptors. A link is checked with HEAD; servers that do not support HEAD
+are asked again with GET, whose body is never read. Redirects are followed.
+
+Results are cached in the user cache directory together with the time of the check and the
+latency, from which per-host statistics are computed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import pathlib
+import ssl
+import statistics
+import threading
+import time
+import urllib.parse
+from collections.abc import Iterable
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from dope.config import get_cache_dir, read_json_cache, write_json_cache
+
+_logger = logging.getLogger(__name__)
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+_NO_HEAD = (403, 405, 501)
+"""Statuses after which HEAD is retried with GET."""
+
+_Connection = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+@dataclass
+class LinkStatus:
+    """The result of checking one URL."""
+
+    url: str
+    status: int | None
+    """HTTP status of the final response; None if no response was received."""
+    error: str | None
+    checked_at: float
+    """Time of the check, seconds since the epoch."""
+    latency: float
+    """
+    Seconds from sending the first request to the final response, including redirects;
+    waiting for a connection to the host and for the rate limit is not counted.
+    """
+
+    @property
+    def ok(self) -> bool:
+        """Whether or not the link is alive."""
+        return self.status is not None and self.status < 400
+
+
+@dataclass
+class HostStats:
+    """Latency statistics of one host."""
+
+    host: str
+    num_links: int
+    num_dead: int
+    mean: float
+    median: float
+    max: float
+
+
+class _HostPool:
+    """Keep-alive connections and the rate limit of one host."""
+
+    def __init__(self, max_connections: int, min_interval: float) -> None:
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.idle: list[_Connection] = []
+        self.min_interval = min_interval
+        self._next_time = 0.0
+        self._rate_lock = asyncio.Lock()
+
+    async def wait_turn(self) -> None:
+        """Sleep until the next request to the host is allowed."""
+        async with self._rate_lock:
+            loop = asyncio.get_running_loop()
+            if (delay := self._next_time - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            self._next_time = loop.time() + self.min_interval
+
+    def close(self) -> None:
+        """Close idle connections."""
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+class WebLinkChecker:
+    """Checks external URLs and caches the results."""
+
+    # pylint: disable=too-many-instance-attributes
+
+    CACHE_VERSION = 1
+
+    def __init__(
+        self,
+        cache_path: pathlib.PosixPath | None = None,
+        ttl: float = 7 * 24 * 3600,
+        max_per_host: int = 2,
+        max_connections: int = 64,
+        min_interval: float = 0.5,
+        timeout: float = 10.0,
+        max_redirects: int = 5,
+    ) -> None:
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.cache_path = cache_path or get_cache_dir() / "web_links.json"
+        self.ttl = ttl
+        """Seconds after which a cached result is checked again."""
+        self.max_per_host = max_per_host
+        self.max_connections = max_connections
+        """The maximum number of connections in use; as many idle ones are kept for reuse."""
+        self.min_interval = min_interval
+        """Minimum seconds between requests to one host."""
+        self.timeout = timeout
+        """Seconds to connect and receive the response of one request once it is its turn."""
+        self.max_redirects = max_redirects
+        self.results: dict[str, LinkStatus] = {}
+        self.num_checked = 0
+        """The number of URLs checked by the last call of check()."""
+        self._pools: dict[tuple[str, str, int], _HostPool] = {}
+        self._slots = asyncio.Semaphore(max_connections)
+        self._num_idle = 0
+        """The number of idle connections in all pools."""
+        self._ssl_context: ssl.SSLContext | None = None
+        self._load()
+
+    def check(self, urls: Iterable[str]) -> dict[str, LinkStatus]:
+        """Return results of all URLs; stale and new ones are checked, the rest come from cache."""
+        now = time.time()
+        unique = dict.fromkeys(url for url in urls if url.startswith(("http://", "https://")))
+        stale = [
+            url
+            for url in unique
+            if url not in self.results or now - self.results[url].checked_at > self.ttl
+        ]
+        _logger.debug("%d unique URLs, %d to check.", len(unique), len(stale))
+        if stale:
+            for status in asyncio.run(self._check_all(stale)):
+                self.results[status.url] = status
+            self._save()
+        self.num_checked = len(stale)
+        return {url: self.results[url] for url in unique}
+
+    @staticmethod
+    def host_stats(results: Iterable[LinkStatus]) -> list[HostStats]:
+        """Return latency statistics per host, the slowest hosts first."""
+        by_host: dict[str, list[LinkStatus]] = {}
+        for status in results:
+            by_host.setdefault(urllib.parse.urlsplit(status.url).netloc, []).append(status)
+        stats = [
+            HostStats(
+                host=host,
+                num_links=len(statuses),
+                num_dead=sum(not status.ok for status in statuses),
+                mean=statistics.fmean(latencies),
+                median=statistics.median(latencies),
+                max=max(latencies),
+            )
+            for host, statuses in by_host.items()
+            if (latencies := [status.latency for status in statuses])
+        ]
+        return sorted(stats, key=lambda host_stats: host_stats.mean, reverse=True)
+
+    async def _check_all(self, urls: list[str]) -> list[LinkStatus]:
+        self._pools = {}
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self._num_idle = 0
+        try:
+            return await asyncio.gather(*(self._check_url(url) for url in urls))
+        finally:
+            for pool in self._pools.values():
+                pool.close()
+
+    async def _check_url(self, url: str) -> LinkStatus:
+        timings: list[float] = []
+        status: int | None = None
+        error: str | None = None
+        try:
+            status = await self._follow(url, timings)
+        except (OSError, asyncio.TimeoutError, ValueError) as err:
+            error = f"{type(err).__name__}: {err}" if str(err) else type(err).__name__
+        latency = sum(timings)
+        _logger.debug("%s: %s %s in %.3f s.", url, status, error or "", latency)
+        return LinkStatus(
+            url=url, status=status, error=error, checked_at=time.time(), latency=latency
+        )
+
+    async def _follow(self, url: str, timings: list[float]) -> int:
+        """Return the status of the URL after redirects; durations of requests are appended."""
+        for _ in range(self.max_redirects + 1):
+            status, location = await self._request("HEAD", url, timings)
+            if status in _NO_HEAD:
+                status, location = await self._request("GET", url, timings)
+            if status not in _REDIRECTS or location is None:
+                return status
+            url = urllib.parse.urljoin(url, location)
+            if not url.startswith(("http://", "https://")):
+                raise ValueError(f"Redirect to `{url}`.")
+        raise ValueError(f"More than {self.max_redirects} redirects.")
+
+    async def _request(self, method: str, url: str, timings: list[float]) -> tuple[int, str | None]:
+        """
+        Send one request and return the status and the location header.
+
+        The timeout and the appended duration start when the host has a free connection slot,
+        the rate limit allows the request and a global connection slot is free, thus links queued
+        behind others do not time out.
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.hostname is None:
+            raise ValueError(f"No host in `{url}`.")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        if (pool := self._pools.get(key)) is None:
+            pool = self._pools[key] = _HostPool(self.max_per_host, self.min_interval)
+        target = urllib.parse.quote(parts.path or "/", safe="/%:@!$&'()*+,;=~")
+        if parts.query:
+            target += "?" + urllib.parse.quote(parts.query, safe="/%:@!$&'()*+,;=~?")
+        request = (
+            f"{method} {target} HTTP/1.1\r\n"
+            f"Host: {parts.netloc.rpartition('@')[2]}\r\n"
+            "User-Agent: dope-link-checker\r\n"
+            "Accept: */*\r\n"
+            f"Connection: {'keep-alive' if method == 'HEAD' else 'close'}\r\n\r\n"
+        ).encode("ascii", errors="strict")
+
+        async with pool.semaphore:
+            await pool.wait_turn()
+            async with self._slots:
+                start = time.monotonic()
+                try:
+                    status, headers = await asyncio.wait_for(
+                        self._exchange(pool, key, method, request), timeout=self.timeout
+                    )
+                finally:
+                    timings.append(time.monotonic() - start)
+        return status, headers.get("location")
+
+    async def _exchange(
+        self, pool: _HostPool, key: tuple[str, str, int], method: str, request: bytes
+    ) -> tuple[int, dict[str, str]]:
+        """Send the request over an idle or a new connection; return the status and headers."""
+        # An idle connection may have been closed by the server; then a new one is opened.
+        while True:
+            reused = bool(pool.idle)
+            if reused:
+                reader, writer = pool.idle.pop()
+                self._num_idle -= 1
+            else:
+                reader, writer = await self._connect(key)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("Connection closed by the server.")
+                break
+            except OSError:
+                writer.close()
+                if not reused:
+                    raise
+            except asyncio.CancelledError:  # The timeout.
+                writer.close()
+                raise
+        try:
+            headers = await self._read_headers(reader)
+        except (OSError, asyncio.CancelledError):
+            writer.close()
+            raise
+        fields = status_line.split(maxsplit=2)
+        if len(fields) < 2 or not fields[0].startswith(b"HTTP/") or not fields[1].isdigit():
+            writer.close()
+            raise ValueError(f"Malformed status line `{status_line!r}`.")
+        if (
+            method == "HEAD"
+            and headers.get("connection", "").lower() != "close"
+            and self._num_idle < self.max_connections
+        ):
+            pool.idle.append((reader, writer))
+            self._num_idle += 1
+        else:
+            writer.close()  # The body of GET is never read.
+        return int(fields[1]), headers
+
+    async def _connect(self, key: tuple[str, str, int]) -> _Connection:
+        scheme, host, port = key
+        if scheme == "https" and self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return await asyncio.open_connection(
+            host, port, ssl=self._ssl_context if scheme == "https" else None
+        )
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def _load(self) -> None:
+        cache = read_json_cache(
+            self.cache_path,
+            self.CACHE_VERSION,
+            "Web link cache has an old format; checking all links again.",
+        )
+        if cache is None:
+            return
+        self.results = {url: LinkStatus(url=url, **item) for url, item in cache["links"].items()}
+
+    def _save(self) -> None:
+        cache = {
+            "links": {
+                url: {key: value for key, value in status.__dict__.items() if key != "url"}
+                for url, status in self.results.items()
+            },
+        }
+        write_json_cache(self.cache_path, self.CACHE_VERSION, cache)
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """A local web site for tests."""
+
+    protocol_version = "HTTP/1.1"
+    requests: list[tuple[str, str, int]] = []
+    """Method, path and client port of every request."""
+
+    def do_HEAD(self) -> None:  # pylint: disable=invalid-name
+        """Answer HEAD; `/get-only` does not support it."""
+        self._answer(405 if self.path == "/get-only" else None)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Answer GET."""
+        self._answer(None)
+
+    def _answer(self, status: int | None) -> None:
+        self.requests.append((self.command, self.path, self.client_address[1]))
+        headers = {"Content-Length": "0"}
+        if status is None:
+            match self.path:
+                case "/ok" | "/other" | "/get-only":
+                    status = 200
+                case "/moved":
+                    status, headers["Location"] = 301, "/ok"
+                case _:
+                    status = 404
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        """Keep test output clean."""
+
+
+def test_web_link_checker(tmp_path: pathlib.PosixPath) -> None:
+    """Check statuses, GET fallback, redirects, connection reuse and the cache with a TTL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        urls = [f"{base}/ok", f"{base}/other", f"{base}/get-only", f"{base}/moved", f"{base}/gone"]
+        checker = WebLinkChecker(
+            cache_path=tmp_path / "web_links.json", max_per_host=1, min_interval=0
+        )
+        results = checker.check([*urls, f"{base}/ok", "mailto:me@x.org"])
+        assert list(results) == urls
+        assert [results[url].status for url in urls] == [200, 200, 200, 200, 404]
+        assert [results[url].ok for url in urls] == [True, True, True, True, False]
+        assert ("GET", "/get-only") in [request[:2] for request in _StandInHandler.requests]
+        # Keep-alive connections are reused; only GET closes its connection.
+        assert len({port for _, _, port in _StandInHandler.requests}) < len(
+            _StandInHandler.requests
+        )
+        (stats,) = WebLinkChecker.host_stats(results.values())
+        assert (stats.num_links, stats.num_dead) == (5, 1)
+        assert 0 <= stats.median <= stats.max
+
+        checker = WebLinkChecker(cache_path=tmp_path / "web_links.json")
+        assert checker.check(urls)[f"{base}/gone"].status == 404
+        assert checker.num_checked == 0
+        checker.ttl = 0
+        checker.min_interval = 0
+        checker.check(urls[:1])
+        assert checker.num_checked == 1
+
+        # Links queued for the rate limit longer than the timeout are still checked.
+        queued = WebLinkChecker(
+            cache_path=tmp_path / "queued.json", max_per_host=1, min_interval=0.2, timeout=0.3
+        )
+        results = queued.check(urls)
+        assert [results[url].status for url in urls] == [200, 200, 200, 200, 404]
+        assert max(status.latency for status in results.values()) < 0.3
+
+        # One connection in use at a time, although the host allows more.
+        bounded = WebLinkChecker(
+            cache_path=tmp_path / "bounded.json", max_per_host=4, max_connections=1, min_interval=0
+        )
+        results = bounded.check(urls)
+        assert [results[url].status for url in urls] == [200, 200, 200, 200, 404]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    closed = WebLinkChecker(cache_path=tmp_path / "closed.json", timeout=2)
+    (status,) = closed.check([base + "/ok"]).values()
+    assert status.status is None and status.error is not None